@@ -0,0 +1,184 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+from itertools import chain
+
+import numpy as np
+
+# Analítica de ventas del panel del manager. Las columnas necesarias de
+# comandas y comanda_detalle se leen una sola vez para el rango de fechas
+# (todo enteros: segundos, ids e importes en céntimos) y se agregan con
+# NumPy: mapa de calor por día de la semana y hora, tendencia diaria,
+# ticket medio, rotación por mesa y ítems más vendidos por grupo.
+
+DIAS_SEMANA = ['lunes', 'martes', 'miércoles', 'jueves', 'viernes', 'sábado', 'domingo']
+
+# TO_SECONDS / TO_DAYS no convierten zona horaria: la hora es la del local
+COMANDAS_SQL = """
+    SELECT c.mesa_id, TO_SECONDS(c.fecha), CAST(ROUND(c.total * 100) AS SIGNED)
+    FROM comandas c
+    WHERE c.fecha >= %s AND c.fecha < %s
+"""
+
+DETALLE_SQL = """
+    SELECT cd.item_id, cd.cantidad, CAST(ROUND(cd.total * 100) AS SIGNED)
+    FROM comandas c
+    JOIN comanda_detalle cd ON cd.comanda_id = c.id
+    WHERE c.fecha >= %s AND c.fecha < %s
+"""
+
+
+def _to_days(dia):
+    # TO_DAYS() de MySQL para una fecha de Python
+    return dia.toordinal() + 365
+
+
+def _columnas(filas, n):
+    # Tuplas del cursor -> n columnas int64, sin crear un objeto por valor
+    plano = np.fromiter(chain.from_iterable(filas), dtype=np.int64, count=len(filas) * n)
+    return plano.reshape(-1, n).T
+
+
+def _dinero(centimos):
+    return np.round(np.asarray(centimos) / 100, 2).tolist()
+
+
+def cargar(cur, desde, hasta):
+    # Filas en tuplas (cursor sin diccionarios) para el rango [desde, hasta]
+    limite = (desde, hasta + timedelta(days=1))
+    cur.execute(COMANDAS_SQL, limite)
+    comandas = cur.fetchall()
+    cur.execute(DETALLE_SQL, limite)
+    detalle = cur.fetchall()
+    cur.execute("""
+        SELECT i.id, i.nombre, g.codigo, g.nombre
+        FROM item i JOIN grupos g ON i.grupo_codigo = g.codigo
+    """)
+    items = cur.fetchall()
+    cur.execute("SELECT Id, nombre FROM mesas")
+    mesas = cur.fetchall()
+    return comandas, detalle, items, mesas
+
+
+def calcular(comandas, detalle, items, mesas, desde, hasta, top=5):
+    dias_rango = (hasta - desde).days + 1
+    mesa_ids, segundos, centimos = _columnas(comandas, 3)
+    n = len(centimos)
+    total = int(centimos.sum())
+
+    # Mapa de calor: celda = día de la semana (lunes = 0) * 24 + hora
+    dias = segundos // 86400
+    celda = ((dias + 5) % 7) * 24 + (segundos % 86400) // 3600
+    mapa_ventas = np.bincount(celda, weights=centimos, minlength=7 * 24).reshape(7, 24)
+    mapa_comandas = np.bincount(celda, minlength=7 * 24).reshape(7, 24)
+
+    # Tendencia diaria
+    indice_dia = dias - _to_days(desde)
+    ventas_dia = np.bincount(indice_dia, weights=centimos, minlength=dias_rango)
+    comandas_dia = np.bincount(indice_dia, minlength=dias_rango)
+    tendencia = [{
+        'fecha': (desde + timedelta(days=i)).isoformat(),
+        'ventas': ventas,
+        'comandas': cuenta
+    } for i, (ventas, cuenta) in enumerate(zip(_dinero(ventas_dia), comandas_dia.tolist()))]
+
+    # Rotación: comandas por mesa y día del rango
+    nombres_mesa = dict(mesas)
+    unicas, inverso, por_mesa = np.unique(mesa_ids, return_inverse=True, return_counts=True)
+    ventas_mesa = np.bincount(inverso, weights=centimos, minlength=len(unicas))
+    orden = np.argsort(-por_mesa, kind='stable')
+    rotacion = [{
+        'mesa_id': int(unicas[i]),
+        'mesa': nombres_mesa.get(int(unicas[i])),
+        'comandas': int(por_mesa[i]),
+        'rotacion': round(float(por_mesa[i]) / dias_rango, 2),
+        'ventas': round(float(ventas_mesa[i]) / 100, 2)
+    } for i in orden]
+
+    # Ítems más vendidos (por importe) dentro de cada grupo
+    item_ids, cantidades, importes = _columnas(detalle, 3)
+    vendidos, inverso = np.unique(item_ids, return_inverse=True)
+    cantidad_item = np.bincount(inverso, weights=cantidades, minlength=len(vendidos))
+    importe_item = np.bincount(inverso, weights=importes, minlength=len(vendidos))
+    catalogo = {item_id: (nombre, codigo, grupo) for item_id, nombre, codigo, grupo in items}
+    grupos = sorted({(codigo, grupo) for _, codigo, grupo in catalogo.values()})
+    indice_grupo = {codigo: i for i, (codigo, _) in enumerate(grupos)}
+    sin_grupo = (None, None, None)
+    grupo_item = np.array([indice_grupo.get(catalogo.get(int(i), sin_grupo)[1], -1) for i in vendidos],
+                          dtype=np.int64)
+    top_items = []
+    for g, (codigo, nombre_grupo) in enumerate(grupos):
+        posiciones = np.flatnonzero(grupo_item == g)
+        if not len(posiciones):
+            continue
+        mejores = posiciones[np.argsort(-importe_item[posiciones], kind='stable')[:top]]
+        top_items.append({
+            'grupo_codigo': codigo,
+            'grupo': nombre_grupo,
+            'items': [{
+                'item_id': int(vendidos[i]),
+                'item': catalogo[int(vendidos[i])][0],
+                'cantidad': int(cantidad_item[i]),
+                'ventas': round(float(importe_item[i]) / 100, 2)
+            } for i in mejores]
+        })
+
+    return {
+        'desde': desde.isoformat(),
+        'hasta': hasta.isoformat(),
+        'comandas': n,
+        'ventas': round(total / 100, 2),
+        'ticket_medio': round(total / n / 100, 2) if n else 0,
+        'mapa_horas': {
+            'dias': DIAS_SEMANA,
+            'ventas': [_dinero(fila) for fila in mapa_ventas],
+            'comandas': mapa_comandas.tolist()
+        },
+        'tendencia': tendencia,
+        'mesas': rotacion,
+        'top_items': top_items
+    }
+
+
+class CacheAnalitica:
+    # Resultados por rango de fechas. Un rango que ya terminó apenas cambia
+    # y se guarda ttl_cerrado segundos; si incluye hoy, ttl_abierto. Los
+    # cálculos se hacen de uno en uno: el mismo rango pedido a la vez desde
+    # varias pestañas se calcula una sola vez.
+
+    def __init__(self, maximo=64, ttl_abierto=60, ttl_cerrado=6 * 3600):
+        self.maximo = maximo
+        self.ttl_abierto = ttl_abierto
+        self.ttl_cerrado = ttl_cerrado
+        self._lock = threading.Lock()
+        self._calculo = threading.Lock()
+        self._datos = OrderedDict()
+        self.calculos = 0
+
+    def _vigente(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None or time.monotonic() > entrada[1]:
+                return None
+            self._datos.move_to_end(clave)
+            return entrada[0]
+
+    def obtener(self, desde, hasta, calcular):
+        clave = (desde, hasta)
+        resultado = self._vigente(clave)
+        if resultado is not None:
+            return resultado
+        with self._calculo:
+            resultado = self._vigente(clave)
+            if resultado is not None:
+                return resultado
+            resultado = calcular(desde, hasta)
+            ttl = self.ttl_abierto if hasta >= date.today() else self.ttl_cerrado
+            with self._lock:
+                self._datos[clave] = (resultado, time.monotonic() + ttl)
+                self._datos.move_to_end(clave)
+                while len(self._datos) > self.maximo:
+                    self._datos.popitem(last=False)
+                self.calculos += 1
+            return resultado
@@ -1,12 +1,44 @@
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash
-from pymysql import cursors
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash, Response, g, has_app_context, has_request_context, stream_with_context
+import click
 import pymysql
 from decimal import Decimal
-from functools import wraps
-import json
-from datetime import datetime,timedelta
+from functools import partial, wraps
+from contextlib import contextmanager
+import csv
+import io
+import os
+import zlib
+try:
+    import fcntl
+except ImportError:  # Sin fcntl (Windows) no se comprueba el proceso único
+    fcntl = None
+from datetime import date, datetime,timedelta
+import threading
+import time
+import atexit
+from db_pool import ConnectionPool, ErrorTrasCommit
+from catalogo import CatalogCache
+from eventos import Broker, stream_sse
+from tareas import Tareas
+import sucursales
+from sucursales import PorSucursal
+from cocina import ColasCocina
+import pedidos
+import cuentas
+from cuentas import CuentasAbiertas
+from impresion import ColaImpresion, ticket_escpos
+from idempotencia import CacheIdempotencia
+from etags import RegistroETag
+import serializacion
+from replica import EstadoReplica, medir_retraso
+import analitica
+from analitica import CacheAnalitica
+from serializacion import ProveedorJSON
+from metricas import Metricas, CursorMedido, SSCursorMedido, CursorTuplaMedido
+from migraciones import VENTAS_ITEM_HORA_DDL, migrar, verificar_consultas
 
 app = Flask(__name__)
+app.json = ProveedorJSON(app)  # Decimal y fechas sin convertir fila a fila
 app.secret_key = 'tu_clave_secreta_aqui'
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(minutes=30)  # Sesión expira después de 30 minutos
 app.config['SESSION_REFRESH_EACH_REQUEST'] = True  # Refresca la sesión con cada solicitud
@@ -18,16 +50,397 @@ app.config['MYSQL_USER'] = 'root'
 app.config['MYSQL_PASSWORD'] = 'TURING'
 app.config['MYSQL_DB'] = 'comandas'
 
-def get_db_connection():
+# Sucursales, cada una con su base de datos: id -> {'nombre': ..., y las
+# claves MYSQL_* / MYSQL_REPLICA_* que cambien respecto a las de aquí
+# (al menos MYSQL_DB)}. La sucursal se elige en /login. Vacío = una sola
+# base. Cachés, colas de cocina y eventos van por sucursal.
+#   {'centro': {'nombre': 'Centro', 'MYSQL_DB': 'comandas_centro'},
+#    'norte': {'nombre': 'Norte', 'MYSQL_HOST': '10.0.0.12', 'MYSQL_DB': 'comandas_norte'}}
+app.config['SUCURSALES'] = {}
+app.config['SUCURSAL_DEFECTO'] = None   # Si el login no elige sucursal (None = la primera)
+app.config['SUCURSALES_HILOS'] = 8      # Sucursales consultadas a la vez en los informes conjuntos
+# Quién puede ver los informes conjuntos (?sucursal=todas): sucursal ->
+# usuarios de esa sucursal con permiso global. Ser Admin de una sucursal
+# no basta: cada base tiene sus propios usuarios.
+#   {'centro': ['gerente']}
+app.config['SUCURSALES_ADMINS_GLOBALES'] = {}
+
+# Pool de conexiones MySQL (uno por sucursal)
+app.config['MYSQL_POOL_MIN'] = 2
+app.config['MYSQL_POOL_MAX'] = 20
+app.config['MYSQL_POOL_TIMEOUT'] = 5         # Segundos esperando conexión libre (None = sin límite, 0 = fallar de inmediato)
+app.config['MYSQL_POOL_RECYCLE'] = 3600      # Vida máxima de una conexión en segundos
+app.config['MYSQL_POOL_PING_INTERVAL'] = 5   # Ping al prestar si la conexión lleva más de N segundos ociosa
+
+# Réplica de solo lectura para informes (None = todo va a la principal).
+# Los datos de conexión que falten se toman de la principal.
+app.config['MYSQL_REPLICA_HOST'] = None
+app.config['MYSQL_REPLICA_PORT'] = None
+app.config['MYSQL_REPLICA_USER'] = None
+app.config['MYSQL_REPLICA_PASSWORD'] = None
+app.config['MYSQL_REPLICA_DB'] = None
+app.config['MYSQL_REPLICA_MAX_RETRASO'] = 5   # Segundos de retraso tolerados en los informes
+app.config['MYSQL_REPLICA_REINTENTO'] = 30    # Segundos sin usar la réplica tras un fallo
+
+def sucursal_actual():
+    # Sucursal de la petición o tarea en curso; None si no hay SUCURSALES
+    sucursal = sucursales.actual()
+    configuradas = app.config['SUCURSALES']
+    if sucursal in configuradas:
+        return sucursal
+    return app.config['SUCURSAL_DEFECTO'] or next(iter(configuradas), None)
+
+def _mysql(clave, sucursal):
+    # Valor de configuración de la sucursal, o el general si no lo cambia
+    return app.config['SUCURSALES'].get(sucursal, {}).get(clave, app.config[clave])
+
+# Pools por (sucursal, réplica), creados al primer uso
+_pools = {}
+_pool_lock = threading.Lock()
+
+def _nueva_conexion(sucursal=None):
+    if sucursal is None:
+        sucursal = sucursal_actual()
+    return pymysql.connect(
+        host=_mysql('MYSQL_HOST', sucursal),
+        port=_mysql('MYSQL_PORT', sucursal),
+        user=_mysql('MYSQL_USER', sucursal),
+        password=_mysql('MYSQL_PASSWORD', sucursal),
+        database=_mysql('MYSQL_DB', sucursal),
+        cursorclass=CursorMedido
+    )
+
+def _nueva_conexion_replica(sucursal=None):
+    if sucursal is None:
+        sucursal = sucursal_actual()
+    def valor(clave):
+        replica = _mysql(f'MYSQL_REPLICA_{clave}', sucursal)
+        return replica if replica is not None else _mysql(f'MYSQL_{clave}', sucursal)
     return pymysql.connect(
-        host=app.config['MYSQL_HOST'],
-        port=app.config['MYSQL_PORT'],
-        user=app.config['MYSQL_USER'],
-        password=app.config['MYSQL_PASSWORD'],
-        database=app.config['MYSQL_DB'],
-        cursorclass=cursors.DictCursor
+        host=_mysql('MYSQL_REPLICA_HOST', sucursal),
+        port=valor('PORT'),
+        user=valor('USER'),
+        password=valor('PASSWORD'),
+        database=valor('DB'),
+        cursorclass=CursorMedido,
+        # Un informe nunca debe escribir en la réplica
+        init_command='SET SESSION TRANSACTION READ ONLY',
+        connect_timeout=2
     )
 
+def _obtener_pool(replica):
+    sucursal = sucursal_actual()
+    pool = _pools.get((sucursal, replica))
+    if pool is None:
+        with _pool_lock:
+            pool = _pools.get((sucursal, replica))
+            if pool is None:
+                pool = _pools[(sucursal, replica)] = ConnectionPool(
+                    partial(_nueva_conexion_replica if replica else _nueva_conexion, sucursal),
+                    min_size=0 if replica else app.config['MYSQL_POOL_MIN'],
+                    max_size=app.config['MYSQL_POOL_MAX'],
+                    timeout=app.config['MYSQL_POOL_TIMEOUT'],
+                    recycle=app.config['MYSQL_POOL_RECYCLE'],
+                    ping_interval=app.config['MYSQL_POOL_PING_INTERVAL']
+                )
+    return pool
+
+def get_pool():
+    return _obtener_pool(False)
+
+def get_pool_replica():
+    return _obtener_pool(True)
+
+def _descartar_pool(replica=False):
+    # Cierra el pool de la sucursal actual; el siguiente uso abre uno nuevo
+    with _pool_lock:
+        pool = _pools.pop((sucursal_actual(), replica), None)
+    if pool is not None:
+        pool.close()
+
+estado_replica = PorSucursal(lambda: EstadoReplica(max_retraso=app.config['MYSQL_REPLICA_MAX_RETRASO'],
+                                                   reintento=app.config['MYSQL_REPLICA_REINTENTO']),
+                             sucursal_actual)
+
+def _conexion_replica():
+    # Conexión a la réplica si esta lectura puede ir allí, o None
+    if not estado_replica.activa():
+        return None
+    ultima = session.get('ultima_escritura') if has_request_context() else None
+    if not estado_replica.necesita_medir() and not estado_replica.admite(ultima):
+        return None
+    
+    conn = None
+    try:
+        conn, espera = get_pool_replica().get()
+        if estado_replica.necesita_medir():
+            cur = conn.cursor()
+            try:
+                def consultar(sql):
+                    cur.execute(sql)
+                    return cur.fetchone()
+                estado_replica.medir(medir_retraso(consultar))
+            finally:
+                cur.close()
+    except Exception as e:
+        app.logger.warning(f'Réplica no disponible, se lee de la principal: {e}')
+        if conn is not None:
+            conn.close()
+        estado_replica.caida()
+        return None
+    
+    if not estado_replica.admite(ultima):
+        conn.close()
+        return None
+    if has_app_context() and '_metricas' in g:
+        g._metricas['espera_pool'] += espera
+    return _registrar_conexion(conn)
+
+def get_db_connection(replica=False):
+    # La conexión devuelta vuelve al pool al llamar a close().
+    # replica=True: lectura que tolera MYSQL_REPLICA_MAX_RETRASO segundos de
+    # retraso; va a la réplica si está configurada y al día
+    if replica and _mysql('MYSQL_REPLICA_HOST', sucursal_actual()):
+        conn = _conexion_replica()
+        estado_replica.contar(conn is not None)
+        if conn is not None:
+            return conn
+    conn, espera = get_pool().get()
+    # Fuera de un contexto de la app (hilos propios, scripts) no hay g
+    if has_app_context() and '_metricas' in g:
+        g._metricas['espera_pool'] += espera
+    return _registrar_conexion(conn)
+
+def _registrar_conexion(conn):
+    # Las conexiones prestadas dentro de un contexto de la app se anotan en
+    # g: si una ruta lanza antes de su close(), vuelven al pool al terminar
+    if has_app_context():
+        g.setdefault('_conexiones', []).append(conn)
+    return conn
+
+@app.teardown_appcontext
+def _devolver_conexiones(exc):
+    # close() es idempotente: las ya cerradas no se devuelven dos veces
+    for conn in g.pop('_conexiones', ()):
+        conn.close()
+
+@app.before_request
+def _fijar_sucursal():
+    # La sucursal elegida en /login decide base, pools y cachés
+    g._sucursal = sucursales.fijar(session.get('sucursal'))
+
+@app.teardown_request
+def _restaurar_sucursal(exc):
+    token = g.pop('_sucursal', None)
+    if token is not None:
+        sucursales.restaurar(token)
+
+@app.after_request
+def _marcar_escritura(response):
+    # Leer lo escrito: tras una escritura, los informes de este usuario van
+    # a la principal hasta que la réplica la haya aplicado
+    if (request.method in ('POST', 'PUT', 'DELETE') and response.status_code < 400
+            and 'usuario' in session):
+        session['ultima_escritura'] = time.time()
+    return response
+
+# Métricas por ruta (latencia, consultas, tiempo en BD, espera del pool)
+# expuestas en /metrics. SLOW_REQUEST_MS activa el log de peticiones lentas
+# con las sentencias SQL ejecutadas (None = desactivado).
+app.config['SLOW_REQUEST_MS'] = None
+metricas = Metricas()
+
+@app.before_request
+def _iniciar_metricas():
+    g._metricas = {
+        'inicio': time.perf_counter(),
+        'consultas': 0,
+        'tiempo_db': 0.0,
+        'espera_pool': 0.0,
+        'sql': [] if app.config['SLOW_REQUEST_MS'] is not None else None,
+        'estado': 500
+    }
+
+@app.after_request
+def _estado_metricas(response):
+    if '_metricas' in g:
+        g._metricas['estado'] = response.status_code
+    return response
+
+@app.teardown_request
+def _registrar_metricas(exc):
+    datos = g.pop('_metricas', None)
+    if datos is None:
+        return
+    segundos = time.perf_counter() - datos['inicio']
+    # Se etiqueta por regla de ruta, no por URL, para acotar las series
+    ruta = request.url_rule.rule if request.url_rule else 'sin_ruta'
+    metricas.registrar(ruta, request.method, datos['estado'], segundos,
+                       datos['consultas'], datos['tiempo_db'], datos['espera_pool'])
+    
+    limite = app.config['SLOW_REQUEST_MS']
+    if limite is not None and segundos * 1000 >= limite:
+        sentencias = '\n'.join(f"  [{t * 1000:.1f} ms] {' '.join(sql.split())}"
+                               for sql, t in datos['sql'])
+        app.logger.warning(
+            f"Petición lenta {request.method} {request.path}: {segundos * 1000:.1f} ms, "
+            f"{datos['consultas']} consultas, {datos['tiempo_db'] * 1000:.1f} ms en BD, "
+            f"{datos['espera_pool'] * 1000:.1f} ms esperando pool\n{sentencias}")
+
+@app.route('/metrics')
+def metrics():
+    # Sin sesión para que Prometheus pueda leerlo; restringir en el proxy
+    def por_sucursal(valores):
+        # Con SUCURSALES, una serie por sucursal (etiqueta sucursal="...")
+        if not app.config['SUCURSALES']:
+            return valores.get(None, 0)
+        return [(f'sucursal="{sucursal}"', valor) for sucursal, valor in sorted(valores.items())]
+    
+    extra = []
+    stats = {sucursal: pool.stats() for (sucursal, replica), pool in list(_pools.items()) if not replica}
+    if stats:
+        for nombre, tipo, ayuda, campo in (
+                ('db_pool_in_use', 'gauge', 'Conexiones prestadas', 'en_uso'),
+                ('db_pool_idle', 'gauge', 'Conexiones libres', 'libres'),
+                ('db_pool_waiting', 'gauge', 'Hilos esperando conexión', 'esperando'),
+                ('db_pool_timeouts_total', 'counter', 'Esperas que agotaron el timeout', 'timeouts'),
+                ('db_pool_wait_seconds_max', 'gauge', 'Espera máxima por una conexión', 'tiempo_espera_max')):
+            extra.append((nombre, tipo, ayuda, por_sucursal({s: datos[campo] for s, datos in stats.items()})))
+    replicas = {sucursal: estado_replica.para(sucursal)
+                for sucursal in (app.config['SUCURSALES'] or [None])
+                if _mysql('MYSQL_REPLICA_HOST', sucursal)}
+    if replicas:
+        extra += [
+            ('db_replica_lag_seconds', 'gauge', 'Último retraso medido de la réplica (-1 = no disponible)',
+             por_sucursal({s: e.retraso if e.retraso is not None else -1 for s, e in replicas.items()})),
+            ('db_replica_reads_total', 'counter', 'Lecturas servidas por la réplica',
+             por_sucursal({s: e.lecturas for s, e in replicas.items()})),
+            ('db_replica_fallbacks_total', 'counter', 'Lecturas de réplica desviadas a la principal',
+             por_sucursal({s: e.desvios for s, e in replicas.items()})),
+            ('db_replica_errors_total', 'counter', 'Fallos de conexión con la réplica',
+             por_sucursal({s: e.fallos for s, e in replicas.items()})),
+        ]
+    extra.append(('sse_subscribers', 'gauge', 'Clientes conectados a /api/eventos',
+                  por_sucursal({s: b.suscriptores for s, b in eventos.instancias().items()})))
+    estado = tareas.estado()
+    extra += [
+        ('bg_tasks_queue_depth', 'gauge', 'Tareas en segundo plano esperando hilo', estado['en_cola']),
+        ('bg_tasks_queue_max', 'gauge', 'Capacidad de la cola de tareas', estado['maximo']),
+        ('bg_tasks_delayed', 'gauge', 'Tareas esperando un reintento', estado['diferidas']),
+        ('bg_tasks_running', 'gauge', 'Tareas ejecutándose', estado['en_curso']),
+        ('bg_tasks_completed_total', 'counter', 'Tareas terminadas', estado['completadas']),
+        ('bg_tasks_failed_total', 'counter', 'Tareas fallidas tras agotar los reintentos', estado['fallidas']),
+        ('bg_tasks_retries_total', 'counter', 'Reintentos de tareas', estado['reintentadas']),
+        ('bg_tasks_inline_total', 'counter', 'Tareas ejecutadas en la petición por cola llena',
+         estado['en_linea']),
+    ]
+    return Response(metricas.exponer(extra), mimetype='text/plain; version=0.0.4')
+
+# Caché del menú para la pantalla de comandas
+app.config['CATALOGO_TTL'] = 300  # Segundos; los cambios de items invalidan antes
+
+def _cargar_catalogo():
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT codigo, nombre FROM grupos ORDER BY nombre")
+        grupos = cur.fetchall()
+
+        # Obtener items (solo activos con existencia) - Añadido grupo_codigo
+        cur.execute("""
+            SELECT i.id, i.nombre, i.precio, i.grupo_codigo, g.nombre as grupo 
+            FROM item i 
+            JOIN grupos g ON i.grupo_codigo = g.codigo 
+            WHERE i.estatus = 'activo' AND i.existencia > 0
+            ORDER BY i.nombre
+        """)
+        items = cur.fetchall()
+
+        return {'grupos': grupos, 'items': items, 'items_json': serializacion.dumps(items)}
+    finally:
+        cur.close()
+        conn.close()
+
+catalogo = PorSucursal(lambda: CatalogCache(_cargar_catalogo, ttl=app.config['CATALOGO_TTL']), sucursal_actual)
+
+# Eventos en vivo (SSE) para las tablets: estado de mesas y nuevas comandas
+app.config['EVENTOS_COLA_MAX'] = 100     # Eventos pendientes por cliente antes de desconectarlo
+app.config['EVENTOS_HEARTBEAT'] = 15     # Segundos entre pings a clientes ociosos
+eventos = PorSucursal(lambda: Broker(maxsize=app.config['EVENTOS_COLA_MAX']), sucursal_actual)
+
+# Tareas en segundo plano tras el commit (acumulados de ventas, avisos)
+app.config['TAREAS_HILOS'] = 4
+app.config['TAREAS_COLA_MAX'] = 1000    # Con la cola llena la tarea se ejecuta en la petición
+app.config['TAREAS_REINTENTOS'] = 3     # Intentos por tarea, con espera creciente entre ellos
+tareas = Tareas(hilos=app.config['TAREAS_HILOS'], maximo=app.config['TAREAS_COLA_MAX'],
+                reintentos=app.config['TAREAS_REINTENTOS'])
+tareas.abrir(app.app_context)
+# Al salir se terminan las pendientes
+atexit.register(tareas.detener)
+
+# Pantallas de cocina: estación por código de grupo; si el grupo no está
+# aquí se usa su formato (p. ej. 'bar') y si no 'cocina'
+app.config['COCINA_ESTACIONES'] = {}
+app.config['COCINA_ESTACION_DEFECTO'] = 'cocina'
+
+cocina = PorSucursal(ColasCocina, sucursal_actual)
+_cocina_lock = threading.Lock()
+
+def get_cocina():
+    # Tras un reinicio, las líneas pendientes se recargan de cocina_linea
+    colas = cocina.para(sucursal_actual())
+    if not colas.cargada:
+        with _cocina_lock:
+            if not colas.cargada:
+                conn = get_db_connection()
+                cur = conn.cursor()
+                try:
+                    cur.execute("""
+                        SELECT detalle_id as id, comanda_id, mesa_id, item, cantidad,
+                               estacion, prioridad, creado
+                        FROM cocina_linea
+                        WHERE estatus = 'pendiente'
+                        ORDER BY creado, detalle_id
+                    """)
+                    colas.cargar(cur.fetchall())
+                finally:
+                    cur.close()
+                    conn.close()
+    return colas
+
+# Eventos, colas de cocina y las invalidaciones del catálogo, ETags e
+# idempotencia viven en la memoria del proceso: con dos workers un pedido
+# tomado en uno no llega a las pantallas ni al SSE del otro, y el bump de
+# cocina da 404. Solo puede servir un proceso (`flask run` o hypercorn con
+# --workers 1); se comprueba con flock y los demás fallan al arrancar
+# (asgi.py) o en cada petición.
+app.config['PROCESO_UNICO'] = True
+app.config['PROCESO_UNICO_BLOQUEO'] = None   # None = instance_path/comandas.lock
+_proceso_bloqueo = None
+_proceso_lock = threading.Lock()
+
+def bloquear_proceso_unico():
+    global _proceso_bloqueo
+    if _proceso_bloqueo is not None or not app.config['PROCESO_UNICO'] or fcntl is None:
+        return
+    with _proceso_lock:
+        if _proceso_bloqueo is not None:
+            return
+        ruta = app.config['PROCESO_UNICO_BLOQUEO'] or os.path.join(app.instance_path, 'comandas.lock')
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        bloqueo = open(ruta, 'w')
+        try:
+            fcntl.flock(bloqueo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            bloqueo.close()
+            raise RuntimeError(f'{ruta} lo tiene otro proceso: eventos, cocina y cachés están '
+                               f'en memoria y necesitan un solo worker')
+        _proceso_bloqueo = bloqueo
+
+@app.before_request
+def _comprobar_proceso_unico():
+    bloquear_proceso_unico()
+
 # Decorador para verificar sesión
 def login_required(f):
     @wraps(f)
@@ -37,6 +450,11 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def _admin_global():
+    # Usuario con permiso para los informes de todas las sucursales
+    permitidos = app.config['SUCURSALES_ADMINS_GLOBALES'].get(sucursal_actual(), ())
+    return 'usuario' in session and session['usuario']['user'] in permitidos
+
 # Decorador para verificar rol de administrador
 def admin_required(f):
     @wraps(f)
@@ -58,23 +476,34 @@ def index():
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
+    configuradas = app.config['SUCURSALES']
     if request.method == 'POST':
         usuario = request.form['usuario']
         password = request.form['password']
+        # Cada sucursal tiene su base y sus usuarios
+        sucursal = request.form.get('sucursal') or None
+        if configuradas and sucursal is not None and sucursal not in configuradas:
+            flash('Sucursal no válida', 'error')
+            return render_template('login.html', sucursales=configuradas)
         
         try:
-            conn = get_db_connection()
-            cur = conn.cursor()
-            cur.execute("SELECT * FROM usuario WHERE user = %s AND password = %s AND estatus = 'activo'", (usuario, password))
-            user = cur.fetchone()
-            cur.close()
-            conn.close()
+            with sucursales.en(sucursal):
+                sucursal = sucursal_actual()
+                conn = get_db_connection()
+                cur = conn.cursor()
+                try:
+                    cur.execute("SELECT * FROM usuario WHERE user = %s AND password = %s AND estatus = 'activo'", (usuario, password))
+                    user = cur.fetchone()
+                finally:
+                    cur.close()
+                    conn.close()
             
             if user:
                 session['usuario'] = {
                     'user': user['user'],
                     'nombre_completo': user['nombre_completo']
                 }
+                session['sucursal'] = sucursal
                 flash('Inicio de sesión exitoso', 'success')
                 return redirect(url_for('index'))
             else:
@@ -82,7 +511,7 @@ def login():
         except Exception as e:
             flash(f'Error de conexión: {str(e)}', 'error')
     
-    return render_template('login.html')
+    return render_template('login.html', sucursales=configuradas)
 
 @app.route('/logout')
 def logout():
@@ -94,42 +523,24 @@ def logout():
 @login_required
 def comandas():
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
+        # Grupos e items salen de la caché del catálogo (antes de tomar
+        # conexión: si hay que reconstruir, el loader usa la suya)
+        menu = catalogo.get()
+    except Exception as e:
+        flash(f'Error al cargar comandas: {str(e)}', 'error')
+        return redirect(url_for('index'))
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
         # Obtener mesas
         cur.execute("SELECT Id, nombre, estatus FROM mesas ORDER BY nombre")
         mesas = cur.fetchall()
         
-        # Obtener grupos
-        cur.execute("SELECT codigo, nombre FROM grupos ORDER BY nombre")
-        grupos = cur.fetchall()
-        
-        # Obtener items (solo activos con existencia) - Añadido grupo_codigo
-        cur.execute("""
-            SELECT i.id, i.nombre, i.precio, i.grupo_codigo, g.nombre as grupo 
-            FROM item i 
-            JOIN grupos g ON i.grupo_codigo = g.codigo 
-            WHERE i.estatus = 'activo' AND i.existencia > 0
-            ORDER BY i.nombre
-        """)
-        items = cur.fetchall()
-        
-        # Convertir Decimal a float para JSON
-        items_json = []
-        for item in items:
-            items_json.append({
-                'id': item['id'],
-                'nombre': item['nombre'],
-                'precio': float(item['precio']),
-                'grupo': item['grupo'],
-                'grupo_codigo': item['grupo_codigo']
-            })
-        
         return render_template('comandas.html', 
                             mesas=mesas, 
-                            grupos=grupos, 
-                            items=json.dumps(items_json),
+                            grupos=menu['grupos'], 
+                            items=menu['items_json'],
                             usuario=session['usuario'])
     except Exception as e:
         flash(f'Error al cargar comandas: {str(e)}', 'error')
@@ -149,9 +560,9 @@ def manager():
 @login_required
 @admin_required
 def manager_usuarios():
+    conn = get_db_connection()
+    cur = conn.cursor()
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
         cur.execute("SELECT id, user, nombre_completo, estatus FROM usuario")
         usuarios = cur.fetchall()
         return render_template('partials/usuarios.html', usuarios=usuarios)
@@ -166,9 +577,9 @@ def manager_usuarios():
 @login_required
 @admin_required
 def manager_items():
+    conn = get_db_connection()
+    cur = conn.cursor()
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
         cur.execute("""
             SELECT i.id, i.nombre, i.precio, i.existencia, i.estatus, g.nombre as grupo 
             FROM item i 
@@ -177,10 +588,6 @@ def manager_items():
         """)
         items = cur.fetchall()
         
-        # Convertir Decimal a float para la plantilla
-        for item in items:
-            item['precio'] = float(item['precio'])
-        
         cur.execute("SELECT codigo, nombre FROM grupos ORDER BY nombre")
         grupos = cur.fetchall()
         
@@ -196,20 +603,19 @@ def manager_items():
 @login_required
 @admin_required
 def api_create_item():
-    try:
-        data = request.get_json()
-        
-        # Validación de campos requeridos
-        required_fields = ['nombre', 'grupo_codigo', 'precio', 'existencia', 'estatus']
-        if not all(field in data for field in required_fields):
-            return jsonify({
-                'success': False,
-                'message': 'Todos los campos son requeridos: nombre, grupo_codigo, precio, existencia, estatus'
-            }), 400
-
-        conn = get_db_connection()
-        cur = conn.cursor()
+    data = request.get_json()
+    
+    # Validación de campos requeridos
+    required_fields = ['nombre', 'grupo_codigo', 'precio', 'existencia', 'estatus']
+    if not all(field in data for field in required_fields):
+        return jsonify({
+            'success': False,
+            'message': 'Todos los campos son requeridos: nombre, grupo_codigo, precio, existencia, estatus'
+        }), 400
 
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
         # Verificar que el grupo existe
         cur.execute("SELECT 1 FROM grupos WHERE codigo = %s", (data['grupo_codigo'],))
         if not cur.fetchone():
@@ -231,6 +637,8 @@ def api_create_item():
         ))
 
         conn.commit()
+        catalogo.invalidar()
+        etags.invalidar('items')
         return jsonify({
             'success': True,
             'message': 'Ítem creado correctamente',
@@ -251,22 +659,20 @@ def api_create_item():
 @login_required
 @admin_required
 def api_update_item(item_id):
-    try:
-        print(f"Recibida solicitud PUT para item {item_id}")  # Agrega esto
-        data = request.get_json()
-        print(f"Datos recibidos: {data}")
-        
-        # Validación de campos requeridos
-        required_fields = ['nombre', 'grupo_codigo', 'precio', 'existencia', 'estatus']
-        if not all(field in data for field in required_fields):
-            return jsonify({
-                'success': False,
-                'message': 'Todos los campos son requeridos: nombre, grupo_codigo, precio, existencia, estatus'
-            }), 400
-
-        conn = get_db_connection()
-        cur = conn.cursor()
+    data = request.get_json()
+    app.logger.debug(f"PUT item {item_id}: {data}")
+    
+    # Validación de campos requeridos
+    required_fields = ['nombre', 'grupo_codigo', 'precio', 'existencia', 'estatus']
+    if not all(field in data for field in required_fields):
+        return jsonify({
+            'success': False,
+            'message': 'Todos los campos son requeridos: nombre, grupo_codigo, precio, existencia, estatus'
+        }), 400
 
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
         # Verificar que el ítem existe
         cur.execute("SELECT 1 FROM item WHERE id = %s", (item_id,))
         if not cur.fetchone():
@@ -302,6 +708,9 @@ def api_update_item(item_id):
         ))
 
         conn.commit()
+        catalogo.invalidar()
+        etags.invalidar('items')
+        _olvidar_items_cuentas([item_id])
         return jsonify({
             'success': True,
             'message': 'Ítem actualizado correctamente'
@@ -321,9 +730,9 @@ def api_update_item(item_id):
 @login_required
 @admin_required
 def manager_grupos():
+    conn = get_db_connection()
+    cur = conn.cursor()
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
         cur.execute("SELECT codigo, nombre FROM grupos ORDER BY nombre")
         grupos = cur.fetchall()
         return render_template('partials/grupos.html', grupos=grupos)
@@ -338,9 +747,9 @@ def manager_grupos():
 @login_required
 @admin_required
 def manager_mesas():
+    conn = get_db_connection()
+    cur = conn.cursor()
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
         cur.execute("SELECT Id, nombre, estatus FROM mesas ORDER BY nombre")
         mesas = cur.fetchall()
         return render_template('partials/mesas.html', mesas=mesas)
@@ -351,34 +760,212 @@ def manager_mesas():
         cur.close()
         conn.close()
 
+# Historial de comandas paginado por cursor (fecha, id)
+app.config['COMANDAS_POR_PAGINA'] = 50
+app.config['COMANDAS_POR_PAGINA_MAX'] = 200
+
+def _cursor_comandas(comanda):
+    return f"{comanda['fecha'].isoformat()}_{comanda['id']}"
+
+def _leer_cursor_comandas(cursor):
+    fecha, _, comanda_id = cursor.rpartition('_')
+    return datetime.fromisoformat(fecha), int(comanda_id)
+
+def _filtros_comandas(args):
+    condiciones = []
+    params = []
+    if args.get('desde'):
+        condiciones.append("c.fecha >= %s")
+        params.append(datetime.strptime(args['desde'], '%Y-%m-%d'))
+    if args.get('hasta'):
+        # 'hasta' es inclusivo: todo el día indicado
+        condiciones.append("c.fecha < %s")
+        params.append(datetime.strptime(args['hasta'], '%Y-%m-%d') + timedelta(days=1))
+    if args.get('mesa_id'):
+        condiciones.append("c.mesa_id = %s")
+        params.append(int(args['mesa_id']))
+    if args.get('usuario_id'):
+        condiciones.append("c.usuario_id = %s")
+        params.append(int(args['usuario_id']))
+    if args.get('estatus'):
+        condiciones.append("c.estatus = %s")
+        params.append(args['estatus'])
+    return condiciones, params
+
 @app.route('/manager/comandas')
 @login_required
 @admin_required
 def manager_comandas():
+    filtros = {k: request.args.get(k, '') for k in ('desde', 'hasta', 'mesa_id', 'usuario_id', 'estatus')}
+    conn = get_db_connection(replica=True)
+    cur = conn.cursor()
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""
+        # Entre 1 y el máximo: 0 o negativos no forman un LIMIT válido
+        limite = max(1, min(request.args.get('limite', app.config['COMANDAS_POR_PAGINA'], type=int),
+                            app.config['COMANDAS_POR_PAGINA_MAX']))
+        condiciones, params = _filtros_comandas(request.args)
+        
+        # Keyset: continuar justo después de la última fila de la página anterior
+        cursor = request.args.get('cursor')
+        if cursor:
+            fecha, comanda_id = _leer_cursor_comandas(cursor)
+            condiciones.append("(c.fecha < %s OR (c.fecha = %s AND c.id < %s))")
+            params.extend([fecha, fecha, comanda_id])
+        
+        where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        
+        # Se pide una fila de más para saber si hay página siguiente
+        cur.execute(f"""
             SELECT c.id, m.nombre as mesa, c.total, c.fecha, c.estatus, u.nombre_completo as usuario
             FROM comandas c
             JOIN mesas m ON c.mesa_id = m.Id
             JOIN usuario u ON c.usuario_id = u.id
-            ORDER BY c.fecha DESC
-        """)
+            {where}
+            ORDER BY c.fecha DESC, c.id DESC
+            LIMIT %s
+        """, params + [limite + 1])
         comandas = cur.fetchall()
         
-        # Convertir Decimal a float
-        for comanda in comandas:
-            comanda['total'] = float(comanda['total'])
+        siguiente = None
+        if len(comandas) > limite:
+            comandas = comandas[:limite]
+            siguiente = _cursor_comandas(comandas[-1])
+        
+        # Las páginas siguientes se piden bajo demanda desde el partial
+        if request.args.get('formato') == 'json':
+            return jsonify({'comandas': comandas, 'siguiente': siguiente})
             
-        return render_template('partials/comandas_list.html', comandas=comandas)
+        return render_template('partials/comandas_list.html', comandas=comandas,
+                               siguiente=siguiente, filtros=filtros)
     except Exception as e:
         flash(f'Error al cargar comandas: {str(e)}', 'error')
-        return render_template('partials/comandas_list.html', comandas=[])
+        return render_template('partials/comandas_list.html', comandas=[],
+                               siguiente=None, filtros=filtros)
     finally:
         cur.close()
         conn.close()
 
+# Exportación completa del historial para contabilidad. Usa un cursor
+# sin buffer (SSDictCursor): las filas se envían según llegan de MySQL y
+# la memoria no crece con el tamaño del historial.
+EXPORT_COLUMNAS = ['comanda_id', 'fecha', 'mesa', 'usuario', 'estatus', 'comanda_total',
+                   'detalle_id', 'item_id', 'item', 'cantidad', 'precio_unitario', 'total']
+EXPORT_LOTE = 500  # Filas por bloque enviado al cliente
+
+def _filas_export(condiciones, params):
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    conn = get_db_connection(replica=True)
+    cur = conn.cursor(SSCursorMedido)
+    try:
+        # Se ordena solo por comanda (fecha, id), que puede salir del índice
+        # idx_comandas_fecha_id; como el id es único, las líneas de cada
+        # comanda quedan juntas (el orden entre ellas no importa)
+        cur.execute(f"""
+            SELECT c.id as comanda_id, c.fecha, m.nombre as mesa, u.nombre_completo as usuario,
+                   c.estatus, c.total as comanda_total, cd.id as detalle_id, cd.item_id,
+                   i.nombre as item, cd.cantidad, cd.precio_unitario, cd.total
+            FROM comandas c
+            JOIN mesas m ON c.mesa_id = m.Id
+            JOIN usuario u ON c.usuario_id = u.id
+            LEFT JOIN comanda_detalle cd ON cd.comanda_id = c.id
+            LEFT JOIN item i ON cd.item_id = i.id
+            {where}
+            ORDER BY c.fecha, c.id
+        """, params)
+        for fila in cur:
+            yield fila
+    finally:
+        cur.close()
+        conn.close()
+
+def _export_csv(filas):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNAS)
+    for n, fila in enumerate(filas, 1):
+        writer.writerow([fila[col] for col in EXPORT_COLUMNAS])
+        if n % EXPORT_LOTE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def _export_ndjson(filas):
+    # Una línea JSON por comanda con sus detalles anidados
+    partes = []
+    actual = None
+    for fila in filas:
+        if actual is None or actual['id'] != fila['comanda_id']:
+            if actual is not None:
+                partes.append(serializacion.dumps(actual))
+                if len(partes) >= EXPORT_LOTE:
+                    yield '\n'.join(partes) + '\n'
+                    partes = []
+            actual = {
+                'id': fila['comanda_id'],
+                'fecha': fila['fecha'],
+                'mesa': fila['mesa'],
+                'usuario': fila['usuario'],
+                'estatus': fila['estatus'],
+                'total': fila['comanda_total'],
+                'detalles': []
+            }
+        if fila['detalle_id'] is not None:
+            actual['detalles'].append({
+                'id': fila['detalle_id'],
+                'item_id': fila['item_id'],
+                'item': fila['item'],
+                'cantidad': fila['cantidad'],
+                'precio_unitario': fila['precio_unitario'],
+                'total': fila['total']
+            })
+    if actual is not None:
+        partes.append(serializacion.dumps(actual))
+    if partes:
+        yield '\n'.join(partes) + '\n'
+
+def _gzip_stream(bloques):
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for bloque in bloques:
+        if isinstance(bloque, str):
+            bloque = bloque.encode('utf-8')
+        datos = compresor.compress(bloque)
+        if datos:
+            yield datos
+    yield compresor.flush()
+
+@app.route('/manager/exportar/comandas')
+@login_required
+@admin_required
+def exportar_comandas():
+    formato = request.args.get('formato', 'csv')
+    if formato not in ('csv', 'ndjson', 'json'):
+        return jsonify({'success': False, 'message': 'Formato no válido: csv, ndjson o json'}), 400
+    try:
+        condiciones, params = _filtros_comandas(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Filtro no válido: {str(e)}'}), 400
+    
+    filas = _filas_export(condiciones, params)
+    if formato == 'csv':
+        bloques, mimetype = _export_csv(filas), 'text/csv'
+    elif formato == 'ndjson':
+        bloques, mimetype = _export_ndjson(filas), 'application/x-ndjson'
+    else:
+        # Un único array con una fila por línea de detalle
+        bloques, mimetype = serializacion.stream_array(filas, EXPORT_LOTE), 'application/json'
+    nombre = f"comandas.{formato}"
+    
+    if request.args.get('gzip') in ('1', 'true'):
+        bloques = _gzip_stream(bloques)
+        nombre += '.gz'
+        mimetype = 'application/gzip'
+    
+    # El contexto de la petición sigue vivo mientras se envía: la conexión
+    # se pide en el primer bloque (métricas, réplica y sesión lo necesitan)
+    return Response(stream_with_context(bloques), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={nombre}'})
+
 @app.route('/formulario/<tipo>')
 @login_required
 @admin_required
@@ -389,10 +976,12 @@ def mostrar_formulario(tipo):
         if id:
             conn = get_db_connection()
             cur = conn.cursor()
-            cur.execute("SELECT * FROM usuario WHERE id = %s", (id,))
-            registro = cur.fetchone()
-            cur.close()
-            conn.close()
+            try:
+                cur.execute("SELECT * FROM usuario WHERE id = %s", (id,))
+                registro = cur.fetchone()
+            finally:
+                cur.close()
+                conn.close()
             return render_template('partials/form_usuario.html', usuario=registro)
         return render_template('partials/form_usuario.html')
     
@@ -400,18 +989,17 @@ def mostrar_formulario(tipo):
         # Obtener grupos para el select
         conn = get_db_connection()
         cur = conn.cursor()
-        cur.execute("SELECT codigo, nombre FROM grupos ORDER BY nombre")
-        grupos = cur.fetchall()
-        
-        item = None
-        if id:
-            cur.execute("SELECT * FROM item WHERE id = %s", (id,))
-            item = cur.fetchone()
-            if item and 'precio' in item:
-                item['precio'] = float(item['precio'])
-        
-        cur.close()
-        conn.close()
+        try:
+            cur.execute("SELECT codigo, nombre FROM grupos ORDER BY nombre")
+            grupos = cur.fetchall()
+            
+            item = None
+            if id:
+                cur.execute("SELECT * FROM item WHERE id = %s", (id,))
+                item = cur.fetchone()
+        finally:
+            cur.close()
+            conn.close()
         
         return render_template('partials/form_item.html', item=item, grupos=grupos)
     
@@ -428,80 +1016,305 @@ def formulario_usuario():
     if usuario_id:
         conn = get_db_connection()
         cur = conn.cursor()
-        cur.execute("SELECT * FROM usuario WHERE id = %s", (usuario_id,))
-        usuario = cur.fetchone()
-        cur.close()
-        conn.close()
+        try:
+            cur.execute("SELECT * FROM usuario WHERE id = %s", (usuario_id,))
+            usuario = cur.fetchone()
+        finally:
+            cur.close()
+            conn.close()
     
     return render_template('partials/form_usuario.html', usuario=usuario)
 
+def _ventas_por_item(where, params):
+    # Ventas por ítem de la sucursal actual sobre el acumulado por día y hora
+    conn = get_db_connection(replica=True)
+    cur = conn.cursor()
+    try:
+        cur.execute(f"""
+            SELECT i.nombre as item, SUM(v.cantidad) as cantidad, 
+                   SUM(v.total) as total
+            FROM ventas_item_hora v
+            JOIN item i ON v.item_id = i.id
+            {where}
+            GROUP BY i.nombre
+            ORDER BY total DESC
+        """, params)
+        return cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+
+def _sumar_ventas_por_item(resultados):
+    # Los ids de ítem son de cada base: se junta por nombre
+    suma = {}
+    for filas in resultados:
+        for fila in filas:
+            acumulado = suma.setdefault(fila['item'], {'item': fila['item'], 'cantidad': 0, 'total': Decimal('0')})
+            acumulado['cantidad'] += fila['cantidad']
+            acumulado['total'] += fila['total']
+    return sorted(suma.values(), key=lambda fila: fila['total'], reverse=True)
+
 @app.route('/manager/ventas-item')
 @login_required
 @admin_required
 def manager_ventas_item():
+    # ?sucursal=todas: todas las sucursales consultadas en paralelo
+    filtros = {k: request.args.get(k, '') for k in ('desde', 'hasta', 'sucursal')}
+    por_sucursal = {}
+    if filtros['sucursal'] == 'todas' and app.config['SUCURSALES'] and not _admin_global():
+        flash('Acceso denegado: el informe de todas las sucursales requiere permiso global', 'error')
+        return render_template('partials/ventas_item.html',
+                               ventas_items=[],
+                               total_ventas=0,
+                               ventas_sucursales={},
+                               filtros=filtros), 403
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        # Consulta para ventas por ítem
-        cur.execute("""
-            SELECT i.nombre as item, SUM(cd.cantidad) as cantidad, 
-                   SUM(cd.total) as total
-            FROM comanda_detalle cd
-            JOIN item i ON cd.item_id = i.id
-            JOIN comandas c ON cd.comanda_id = c.id
-            GROUP BY i.nombre
-            ORDER BY total DESC
-        """)
-        ventas_items = cur.fetchall()
+        condiciones = []
+        params = []
+        if filtros['desde']:
+            condiciones.append("v.fecha >= %s")
+            params.append(datetime.strptime(filtros['desde'], '%Y-%m-%d').date())
+        if filtros['hasta']:
+            condiciones.append("v.fecha <= %s")
+            params.append(datetime.strptime(filtros['hasta'], '%Y-%m-%d').date())
+        where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
         
-        # Calcular total general
-        total_ventas = sum(float(item['total']) for item in ventas_items)
+        if filtros['sucursal'] == 'todas' and app.config['SUCURSALES']:
+            resultados = sucursales.en_paralelo(lambda: _ventas_por_item(where, params),
+                                                app.config['SUCURSALES'],
+                                                hilos=app.config['SUCURSALES_HILOS'],
+                                                contexto=app.app_context)
+            ventas_items = _sumar_ventas_por_item(resultados.values())
+            por_sucursal = {sucursal: sum((fila['total'] for fila in filas), Decimal('0'))
+                            for sucursal, filas in resultados.items()}
+        else:
+            ventas_items = _ventas_por_item(where, params)
         
-        # Convertir Decimal a float
-        for item in ventas_items:
-            item['total'] = float(item['total'])
+        # Calcular total general (en Decimal, sin redondeos de float)
+        total_ventas = sum((item['total'] for item in ventas_items), Decimal('0'))
             
         return render_template('partials/ventas_item.html', 
                             ventas_items=ventas_items,
-                            total_ventas=total_ventas)
+                            total_ventas=total_ventas,
+                            ventas_sucursales=por_sucursal,
+                            filtros=filtros)
     except Exception as e:
         flash(f'Error al cargar ventas por ítem: {str(e)}', 'error')
         return render_template('partials/ventas_item.html', 
                               ventas_items=[], 
-                              total_ventas=0)
+                              total_ventas=0,
+                              ventas_sucursales={},
+                              filtros=filtros)
+
+# Analítica de ventas: mapa por día y hora, tendencia diaria, ticket medio,
+# rotación de mesas y top de ítems por grupo, calculada con NumPy
+app.config['ANALITICA_DIAS'] = 30          # Rango por defecto (días hasta hoy)
+app.config['ANALITICA_DIAS_MAX'] = 731     # Rango máximo por petición
+app.config['ANALITICA_TOP'] = 5            # Ítems por grupo
+app.config['ANALITICA_CACHE_TTL'] = 60     # Segundos para rangos que incluyen hoy
+
+analitica_cache = PorSucursal(lambda: CacheAnalitica(ttl_abierto=app.config['ANALITICA_CACHE_TTL']),
+                              sucursal_actual)
+
+def _calcular_analitica(desde, hasta):
+    conn = get_db_connection(replica=True)
+    cur = conn.cursor(CursorTuplaMedido)
+    try:
+        filas = analitica.cargar(cur, desde, hasta)
+    finally:
+        cur.close()
+        conn.close()
+    return analitica.calcular(*filas, desde, hasta, top=app.config['ANALITICA_TOP'])
+
+@app.route('/api/analitica/ventas')
+@login_required
+@admin_required
+def api_analitica_ventas():
+    try:
+        hasta = (datetime.strptime(request.args['hasta'], '%Y-%m-%d').date()
+                 if request.args.get('hasta') else date.today())
+        desde = (datetime.strptime(request.args['desde'], '%Y-%m-%d').date()
+                 if request.args.get('desde') else hasta - timedelta(days=app.config['ANALITICA_DIAS'] - 1))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Fecha no válida: {str(e)}'}), 400
+    if desde > hasta or (hasta - desde).days >= app.config['ANALITICA_DIAS_MAX']:
+        return jsonify({
+            'success': False,
+            'message': f"Rango no válido (máximo {app.config['ANALITICA_DIAS_MAX']} días)"
+        }), 400
+    
+    try:
+        return jsonify(analitica_cache.obtener(desde, hasta, _calcular_analitica))
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error al calcular la analítica: {str(e)}'}), 400
+
+def reconstruir_acumulado_ventas(conn, desde=None):
+    # Conviene ejecutarlo fuera de servicio (bloquea las comandas del
+    # rango). Las marca como acumuladas en la misma transacción, así las
+    # tareas de acumulado aún pendientes no las vuelven a sumar.
+    cur = conn.cursor()
+    try:
+        cur.execute(VENTAS_ITEM_HORA_DDL)
+        if desde:
+            cur.execute("DELETE FROM ventas_item_hora WHERE fecha >= %s", (desde,))
+            filtro, params = "WHERE c.fecha >= %s", (desde,)
+        else:
+            cur.execute("DELETE FROM ventas_item_hora")
+            filtro, params = "", ()
+        cur.execute(f"UPDATE comandas c SET c.acumulada = 1 {filtro}", params)
+        cur.execute(f"""
+            INSERT INTO ventas_item_hora (fecha, hora, item_id, cantidad, total)
+            SELECT DATE(c.fecha), HOUR(c.fecha), cd.item_id, SUM(cd.cantidad), SUM(cd.total)
+            FROM comanda_detalle cd
+            JOIN comandas c ON cd.comanda_id = c.id
+            {filtro}
+            GROUP BY DATE(c.fecha), HOUR(c.fecha), cd.item_id
+        """, params)
+        filas = cur.rowcount
+        conn.commit()
+        return filas
+    except Exception:
+        conn.rollback()
+        raise
     finally:
         cur.close()
+
+def _por_sucursal_cli(f):
+    # Opción --sucursal de los comandos de base de datos: una sucursal de
+    # SUCURSALES o 'todas' (por defecto, la sucursal por defecto)
+    @click.option('--sucursal', default=None, help="Sucursal de SUCURSALES o 'todas'")
+    @wraps(f)
+    def comando(sucursal, **kwargs):
+        configuradas = app.config['SUCURSALES']
+        if sucursal == 'todas':
+            elegidas = list(configuradas) or [None]
+        elif sucursal is None or sucursal in configuradas:
+            elegidas = [sucursal]
+        else:
+            raise click.BadParameter(f'Sucursal desconocida: {sucursal}')
+        for elegida in elegidas:
+            with sucursales.en(elegida):
+                if configuradas:
+                    click.echo(f'Sucursal {sucursal_actual()}:')
+                f(**kwargs)
+    return comando
+
+@app.cli.command('reconstruir-ventas')
+@click.option('--desde', default=None, help='Reconstruir solo desde esta fecha (YYYY-MM-DD)')
+@_por_sucursal_cli
+def reconstruir_ventas(desde):
+    """Recalcula ventas_item_hora a partir de comanda_detalle."""
+    if desde:
+        desde = datetime.strptime(desde, '%Y-%m-%d').date()
+    conn = get_db_connection()
+    try:
+        filas = reconstruir_acumulado_ventas(conn, desde)
+        click.echo(f'ventas_item_hora reconstruida: {filas} filas')
+    finally:
+        conn.close()
+
+@app.cli.command('migrar')
+@click.option('--hasta', type=int, default=None, help='Versión máxima a aplicar')
+@_por_sucursal_cli
+def migrar_esquema(hasta):
+    """Crea o actualiza el esquema de la base de datos."""
+    conn = _nueva_conexion()
+    try:
+        version = migrar(conn, hasta=hasta, log=click.echo)
+        click.echo(f'Esquema en versión {version}')
+    finally:
+        conn.close()
+
+@app.cli.command('verificar-indices')
+@_por_sucursal_cli
+def verificar_indices():
+    """Falla si alguna consulta caliente hace escaneo completo de tabla."""
+    conn = _nueva_conexion()
+    try:
+        fallos = verificar_consultas(conn)
+    finally:
         conn.close()
+    for nombre, tabla, tipo, key in fallos:
+        click.echo(f'ESCANEO COMPLETO en "{nombre}": tabla {tabla} (type={tipo}, key={key})', err=True)
+    if fallos:
+        raise SystemExit(1)
+    click.echo('Todas las consultas calientes usan índice')
+
 # API Endpoints para el manager
 
+# Validación condicional (ETag / Last-Modified) de las lecturas JSON
+app.config['ETAG_TTL'] = 30  # Segundos; las escrituras de este proceso invalidan antes
+
+etags = PorSucursal(lambda: RegistroETag(ttl=app.config['ETAG_TTL']), sucursal_actual)
+
+def _no_modificado(etag, modificado):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    return request.if_modified_since is not None and request.if_modified_since >= modificado
+
+def _validada(response, etag, modificado):
+    response.set_etag(etag)
+    response.last_modified = modificado
+    # El cliente puede guardarla pero debe revalidar en cada consulta
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def _json_condicional(clave, grupo, cargar):
+    # Respuesta JSON con ETag. Si la versión del grupo no ha cambiado y el
+    # cliente ya tiene ese ETag se contesta 304 sin llamar a cargar().
+    # Devuelve None si cargar() no encuentra el recurso.
+    vigente = etags.vigente(clave, grupo)
+    if vigente and _no_modificado(*vigente):
+        return _validada(Response(status=304), *vigente)
+    
+    version = etags.version(grupo)
+    datos = cargar()
+    if datos is None:
+        return None
+    cuerpo = serializacion.dumps_bytes(datos)
+    etag, modificado = etags.registrar(clave, version, cuerpo)
+    if _no_modificado(etag, modificado):
+        return _validada(Response(status=304), etag, modificado)
+    return _validada(Response(cuerpo, mimetype='application/json'), etag, modificado)
+
+@app.route('/api/pool/stats')
+@login_required
+@admin_required
+def api_pool_stats():
+    return jsonify(get_pool().stats())
+
 
 @app.route('/api/usuarios', methods=['GET', 'POST'])
 @login_required
 @admin_required
 def api_usuarios():
     if request.method == 'GET':
-        try:
+        def cargar():
             conn = get_db_connection()
             cur = conn.cursor()
-            cur.execute("SELECT id, user, nombre_completo, estatus FROM usuario")
-            usuarios = cur.fetchall()
-            return jsonify(usuarios)
+            try:
+                cur.execute("SELECT id, user, nombre_completo, estatus FROM usuario")
+                return cur.fetchall()
+            finally:
+                cur.close()
+                conn.close()
+        
+        try:
+            return _json_condicional('usuarios', 'usuarios', cargar)
         except Exception as e:
             return jsonify({'success': False, 'message': str(e)}), 400
-        finally:
-            cur.close()
-            conn.close()
     
     elif request.method == 'POST':
         data = request.get_json()
+        conn = get_db_connection()
+        cur = conn.cursor()
         try:
-            conn = get_db_connection()
-            cur = conn.cursor()
             cur.execute("""
                 INSERT INTO usuario (user, password, nombre_completo, estatus)
                 VALUES (%s, %s, %s, %s)
             """, (data['user'], data['password'], data['nombre_completo'], data['estatus']))
             conn.commit()
+            etags.invalidar('usuarios')
             return jsonify({'success': True, 'message': 'Usuario creado correctamente'})
         except Exception as e:
             conn.rollback()
@@ -516,10 +1329,9 @@ def api_usuarios():
 def api_usuario(user_id):
     if request.method == 'PUT':
         data = request.get_json()
+        conn = get_db_connection()
+        cur = conn.cursor()
         try:
-            conn = get_db_connection()
-            cur = conn.cursor()
-            
             if 'password' in data and data['password']:
                 cur.execute("""
                     UPDATE usuario 
@@ -534,6 +1346,7 @@ def api_usuario(user_id):
                 """, (data['user'], data['nombre_completo'], data['estatus'], user_id))
                 
             conn.commit()
+            etags.invalidar('usuarios')
             return jsonify({'success': True, 'message': 'Usuario actualizado correctamente'})
         except Exception as e:
             conn.rollback()
@@ -543,11 +1356,12 @@ def api_usuario(user_id):
             conn.close()
     
     elif request.method == 'DELETE':
+        conn = get_db_connection()
+        cur = conn.cursor()
         try:
-            conn = get_db_connection()
-            cur = conn.cursor()
             cur.execute("DELETE FROM usuario WHERE id = %s", (user_id,))
             conn.commit()
+            etags.invalidar('usuarios')
             return jsonify({'success': True, 'message': 'Usuario eliminado correctamente'})
         except Exception as e:
             conn.rollback()
@@ -556,90 +1370,870 @@ def api_usuario(user_id):
             cur.close()
             conn.close()
 
+# La lógica del pedido vive en pedidos.py para compartirla con asgi.py
+def _reservar_existencias(cur, items):
+    return pedidos.ejecutar(cur, pedidos.reservar_existencias(items))
+
+def _insertar_comanda(cur, mesa_id, total, user, items):
+    return pedidos.ejecutar(cur, pedidos.insertar_comanda(mesa_id, total, user, items))
+
+def _encolar_cocina(cur, comanda_id, mesa_id):
+    return pedidos.ejecutar(cur, pedidos.encolar_cocina(
+        comanda_id, mesa_id, app.config['COCINA_ESTACIONES'], app.config['COCINA_ESTACION_DEFECTO']))
+
+def _guardar_comanda(cur, data, user):
+    return pedidos.ejecutar(cur, pedidos.guardar_comanda(
+        data, user, app.config['COCINA_ESTACIONES'], app.config['COCINA_ESTACION_DEFECTO']))
+
+def _comanda_guardada(comanda_id, data, user, agotados, lineas_cocina):
+    # Tras el commit de una comanda. Aquí solo lo que la siguiente lectura
+    # ya tiene que ver; acumulados y avisos van a las tareas en segundo plano
+    # La existencia de los ítems ha cambiado
+    etags.invalidar('items')
+    _olvidar_items_cuentas([item['id'] for item in data['items']])
+    if agotados:
+        # El menú de los meseros oculta los ítems sin existencia
+        catalogo.invalidar()
+    # Los hilos de las tareas no ven la sucursal de la petición: va como argumento
+    sucursal = sucursal_actual()
+    tareas.enviar(_acumular_ventas, sucursal, comanda_id)
+    tareas.enviar(_avisar_comanda, sucursal, comanda_id, data, user, lineas_cocina)
+
+def _item_agregado(mesa_id, agotados):
+    # Tras el commit de un toque (agregar_item): la existencia ha cambiado
+    etags.invalidar('items')
+    if agotados:
+        catalogo.invalidar()
+    eventos.publicar('mesas', 'mesa', {'id': mesa_id, 'estatus': 'ocupada'})
+
+def _acumular_ventas(sucursal, comanda_id):
+    with sucursales.en(sucursal):
+        conn = get_db_connection()
+        cur = conn.cursor()
+        try:
+            pedidos.ejecutar(cur, pedidos.acumular_ventas(comanda_id))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+            conn.close()
+
+def _avisar_comanda(sucursal, comanda_id, data, user, lineas_cocina):
+    with sucursales.en(sucursal):
+        _publicar_cocina(lineas_cocina)
+        eventos.publicar('mesas', 'mesa', {'id': data['mesa_id'], 'estatus': 'ocupada'})
+        eventos.publicar('comandas', 'comanda', {
+            'id': comanda_id,
+            'mesa_id': data['mesa_id'],
+            'total': data['total'],
+            'usuario': user
+        })
+
+def _publicar_cocina(lineas):
+    get_cocina().agregar(lineas)
+    for linea in lineas:
+        eventos.publicar(f"cocina:{linea['estacion']}", 'linea', linea)
+
+# Reintentos de POST /api/comandas con cabecera Idempotency-Key
+app.config['IDEMPOTENCIA_CACHE_MAX'] = 10000
+app.config['IDEMPOTENCIA_RETENCION_HORAS'] = 24
+
+idempotencia = PorSucursal(lambda: CacheIdempotencia(maximo=app.config['IDEMPOTENCIA_CACHE_MAX'],
+                                                     ttl=app.config['IDEMPOTENCIA_RETENCION_HORAS'] * 3600),
+                            sucursal_actual)
+
+def _guardar_comanda_nueva(data, user, clave=None):
+    # Devuelve (cuerpo, estado, repetida). Con clave, la fila de
+    # comanda_idempotencia se reserva en la misma transacción que la comanda
+    # (ver pedidos.reclamar_clave), así solo una petición con esa clave
+    # escribe; repetida indica que se devuelve la respuesta ya guardada.
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        if clave:
+            guardada = pedidos.ejecutar(cur, pedidos.reclamar_clave(user, clave))
+            if guardada:
+                idempotencia.guardar((user, clave), guardada)
+                return guardada, 200, True
+            if guardada is not None:
+                return {
+                    'success': False,
+                    'message': 'La comanda con esta Idempotency-Key se está procesando'
+                }, 409, False
+        
+        comanda_id, agotados, lineas_cocina = _guardar_comanda(cur, data, user)
+        conn.al_confirmar(_comanda_guardada, comanda_id, data, user, agotados, lineas_cocina)
+        cuerpo = {
+            'success': True,
+            'message': 'Comanda guardada correctamente',
+            'comanda_id': comanda_id
+        }
+        
+        if clave:
+            pedidos.ejecutar(cur, pedidos.guardar_respuesta(user, clave, comanda_id, cuerpo))
+        
+        try:
+            conn.commit()
+        except ErrorTrasCommit as e:
+            # La comanda está guardada; solo falló algún efecto posterior
+            app.logger.error(f'Comanda {comanda_id} guardada, pero: {e}')
+        if clave:
+            idempotencia.guardar((user, clave), cuerpo)
+        return cuerpo, 200, False
+    except pedidos.ExistenciaInsuficiente as e:
+        conn.rollback()
+        return {
+            'success': False,
+            'message': str(e)
+        }, 409, False
+    except Exception as e:
+        conn.rollback()
+        return {
+            'success': False,
+            'message': f'Error al guardar comanda: {str(e)}'
+        }, 400, False
+    finally:
+        cur.close()
+        conn.close()
+
 @app.route('/api/comandas', methods=['POST'])
 @login_required
 def api_guardar_comanda():
     data = request.get_json()
+    user = session['usuario']['user']
+    clave = request.headers.get('Idempotency-Key')
+    if clave and len(clave) > 100:
+        return jsonify({'success': False, 'message': 'Idempotency-Key demasiado larga'}), 400
+    
+    if not clave:
+        cuerpo, estado, _ = _guardar_comanda_nueva(data, user)
+        return jsonify(cuerpo), estado
+    
+    # Un reintento ya respondido se resuelve con una búsqueda en memoria;
+    # si no está (otro worker, reinicio) lo resuelve la base de datos
+    cuerpo, estado, repetida = idempotencia.obtener((user, clave)), 200, True
+    if cuerpo is None:
+        with idempotencia.en_curso((user, clave)):
+            cuerpo = idempotencia.obtener((user, clave))
+            if cuerpo is None:
+                cuerpo, estado, repetida = _guardar_comanda_nueva(data, user, clave)
     
+    response = jsonify(cuerpo)
+    if repetida:
+        response.headers['Idempotent-Replayed'] = 'true'
+    return response, estado
+
+@app.cli.command('purgar-idempotencia')
+@_por_sucursal_cli
+def purgar_idempotencia():
+    """Borra las claves de idempotencia más antiguas que la retención."""
+    conn = get_db_connection()
+    cur = conn.cursor()
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
+        cur.execute("DELETE FROM comanda_idempotencia WHERE creado < NOW() - INTERVAL %s HOUR",
+                    (app.config['IDEMPOTENCIA_RETENCION_HORAS'],))
+        conn.commit()
+        click.echo(f'{cur.rowcount} claves borradas')
+    finally:
+        cur.close()
+        conn.close()
+
+# Reenvío en lote de las comandas que las tablets guardaron sin conexión
+app.config['COMANDAS_LOTE_TRANSACCION'] = 25  # Comandas por transacción
+app.config['COMANDAS_LOTE_MAX'] = 500         # Comandas por petición
+app.config['COMANDAS_LOTE_REINTENTOS'] = 2    # Reintentos de un bloque perdido por deadlock
+
+# Deadlock (1213) y espera de bloqueo agotada (1205): InnoDB deshace la
+# transacción entera (o puede dejarla a medias), no solo la sentencia, así
+# que los SAVEPOINT ya no sirven y hay que repetir el bloque completo
+_TRANSACCION_PERDIDA = (1213, 1205)
+
+def _client_id(comanda):
+    return comanda.get('client_id') if isinstance(comanda, dict) else None
+
+def _guardar_bloque(conn, cur, bloque, user):
+    # Guarda un bloque del lote en la transacción actual, cada comanda en su
+    # SAVEPOINT: si falla se deshace solo ella. Devuelve (resultados, None),
+    # o (resultados, error) si se perdió la transacción entera y hay que
+    # hacer rollback y repetir el bloque.
+    # El client_id es la clave de idempotencia de la comanda (la misma tabla
+    # que Idempotency-Key): un lote reenviado no la guarda dos veces.
+    resultados = []
+    for comanda in bloque:
+        client_id = _client_id(comanda)
+        resultado = {'client_id': client_id, 'success': False}
+        resultados.append(resultado)
+        savepoint = False
+        try:
+            if not isinstance(comanda, dict) or not all(
+                    campo in comanda for campo in ('mesa_id', 'total', 'items')):
+                raise ValueError('Faltan campos: mesa_id, total, items')
+            clave = str(client_id) if client_id is not None else None
+            if clave and len(clave) > 100:
+                raise ValueError('client_id demasiado largo (máx. 100)')
+            cur.execute("SAVEPOINT comanda")
+            savepoint = True
+            if clave:
+                guardada = pedidos.ejecutar(cur, pedidos.reclamar_clave(user, clave, cerrar=False))
+                if guardada is not None:
+                    cur.execute("RELEASE SAVEPOINT comanda")
+                    if not guardada:
+                        resultado['message'] = 'La comanda con este client_id se está procesando'
+                        continue
+                    resultado.update(success=True, comanda_id=guardada.get('comanda_id'), repetida=True)
+                    continue
+            comanda_id, agotados, lineas_cocina = _guardar_comanda(cur, comanda, user)
+            if clave:
+                pedidos.ejecutar(cur, pedidos.guardar_respuesta(user, clave, comanda_id, {
+                    'success': True,
+                    'message': 'Comanda guardada correctamente',
+                    'comanda_id': comanda_id
+                }))
+            cur.execute("RELEASE SAVEPOINT comanda")
+            resultado.update(success=True, comanda_id=comanda_id)
+            conn.al_confirmar(_comanda_guardada, comanda_id, comanda, user, agotados, lineas_cocina)
+        except Exception as e:
+            if isinstance(e, pymysql.err.OperationalError) and e.args and e.args[0] in _TRANSACCION_PERDIDA:
+                return resultados, e
+            if savepoint:
+                try:
+                    cur.execute("ROLLBACK TO SAVEPOINT comanda")
+                except Exception as perdida:
+                    # Sin el savepoint no se sabe qué queda de la transacción
+                    return resultados, perdida
+            resultado['message'] = str(e)
+    return resultados, None
+
+@app.route('/api/comandas/lote', methods=['POST'])
+@login_required
+def api_guardar_comandas_lote():
+    data = request.get_json(silent=True) or {}
+    lote = data.get('comandas')
+    if not isinstance(lote, list) or not lote:
+        return jsonify({'success': False, 'message': 'Se requiere una lista de comandas'}), 400
+    if len(lote) > app.config['COMANDAS_LOTE_MAX']:
+        return jsonify({
+            'success': False,
+            'message': f"Máximo {app.config['COMANDAS_LOTE_MAX']} comandas por lote"
+        }), 400
+    
+    user = session['usuario']['user']
+    resultados = []
+    tamano = app.config['COMANDAS_LOTE_TRANSACCION']
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        for inicio in range(0, len(lote), tamano):
+            bloque = lote[inicio:inicio + tamano]
+            for intento in range(app.config['COMANDAS_LOTE_REINTENTOS'] + 1):
+                resultados_bloque, perdida = _guardar_bloque(conn, cur, bloque, user)
+                if perdida is None:
+                    break
+                # También se perdieron las comandas del bloque ya guardadas
+                # (y sus efectos en al_confirmar): se repite desde el principio
+                conn.rollback()
+                app.logger.warning(f'Bloque del lote perdido (intento {intento + 1}): {perdida}')
+                time.sleep(0.05 * (intento + 1))
+            
+            if perdida is not None:
+                resultados_bloque = [{
+                    'client_id': _client_id(comanda),
+                    'success': False,
+                    'message': f'Transacción perdida, reintentar: {str(perdida)}'
+                } for comanda in bloque]
+            else:
+                try:
+                    conn.commit()
+                except ErrorTrasCommit as e:
+                    app.logger.error(f'Lote de comandas guardado, pero: {e}')
+                except Exception as e:
+                    conn.rollback()
+                    for resultado in resultados_bloque:
+                        if resultado['success']:
+                            resultado.update(success=False, message=f'Error al confirmar: {str(e)}')
+                            resultado.pop('comanda_id', None)
+                            resultado.pop('repetida', None)
+            resultados.extend(resultados_bloque)
         
-        # Guardar comanda
+        return jsonify({
+            'success': all(r['success'] for r in resultados),
+            'guardadas': sum(1 for r in resultados if r['success']),
+            'resultados': resultados
+        })
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'success': False, 'message': f'Error al guardar el lote: {str(e)}',
+                        'resultados': resultados}), 500
+    finally:
+        cur.close()
+        conn.close()
+
+# Cuentas abiertas en memoria (cuentas.py): con CUENTAS_EN_MEMORIA los
+# toques de agregar_item se aplican en memoria y se anotan en un diario, y
+# un hilo los vuelca a la base en lotes. El diario de cada sucursal se
+# bloquea con flock: solo un proceso puede tenerlas (`flask run` o
+# hypercorn con --workers 1); en otro worker el toque falla.
+app.config['CUENTAS_EN_MEMORIA'] = False
+app.config['CUENTAS_DIRECTORIO'] = None   # Diarios; None = instance_path
+app.config['CUENTAS_LOTE'] = 200          # Líneas pendientes que fuerzan un volcado
+app.config['CUENTAS_INTERVALO'] = 2.0     # Segundos entre volcados
+app.config['CUENTAS_FSYNC'] = False       # True: el diario sobrevive también a un corte de luz
+
+def _leer_mesa_cuenta(mesa_id):
+    # Mesa, primera comanda pendiente y sus líneas en una sola consulta
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
         cur.execute("""
-            INSERT INTO comandas (mesa_id, total, estatus, usuario_id)
-            VALUES (%s, %s, 'pendiente', 
-                (SELECT id FROM usuario WHERE user = %s))
-        """, (data['mesa_id'], data['total'], session['usuario']['user']))
-        
-        comanda_id = cur.lastrowid
-        
-        # Guardar detalles
-        for item in data['items']:
+            SELECT m.Id as mesa_id, m.nombre as mesa, m.estatus as mesa_estatus,
+                   c.id as comanda_id, c.fecha, u.user, cd.item_id, i.nombre,
+                   cd.cantidad, cd.precio_unitario
+            FROM mesas m
+            LEFT JOIN comandas c ON c.mesa_id = m.Id AND c.estatus = 'pendiente'
+            LEFT JOIN usuario u ON c.usuario_id = u.id
+            LEFT JOIN comanda_detalle cd ON cd.comanda_id = c.id
+            LEFT JOIN item i ON cd.item_id = i.id
+            WHERE m.Id = %s
+            ORDER BY c.id, cd.id
+        """, (mesa_id,))
+        filas = cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+    if not filas:
+        return None
+    primera = filas[0]
+    return {
+        'mesa': {'id': primera['mesa_id'], 'nombre': primera['mesa'], 'estatus': primera['mesa_estatus']},
+        'comanda_id': primera['comanda_id'],
+        'usuario_id': primera['user'],
+        'abierta': primera['fecha'],
+        'lineas': [(fila['item_id'], fila['cantidad'], fila['precio_unitario'], fila['nombre'])
+                   for fila in filas
+                   if fila['item_id'] is not None and fila['comanda_id'] == primera['comanda_id']]
+    }
+
+def _leer_item_cuenta(item_id):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT nombre, precio, existencia FROM item WHERE id = %s", (item_id,))
+        item = cur.fetchone()
+    finally:
+        cur.close()
+        conn.close()
+    return (item['nombre'], item['precio'], item['existencia']) if item else None
+
+def _volcar_cuentas(cambios):
+    # Cantidades absolutas: volcar dos veces lo mismo (p. ej. al reproducir
+    # el diario) deja el mismo resultado. La existencia y el acumulado de
+    # ventas cambian solo en la diferencia con la línea ya guardada, en la
+    # misma transacción. usuario_id es el user de la sesión.
+    ids = {}
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        for cambio in cambios:
+            comanda_id = cambio['comanda_id']
+            if comanda_id is None:
+                # Si el proceso murió tras crear la comanda pero antes de
+                # anotarlo, la comanda pendiente de la mesa ya es la nuestra
+                cur.execute("""
+                    SELECT id FROM comandas WHERE mesa_id = %s AND estatus = 'pendiente'
+                    ORDER BY id LIMIT 1 FOR UPDATE
+                """, (cambio['mesa_id'],))
+                comanda = cur.fetchone()
+                if comanda:
+                    comanda_id = comanda['id']
+                else:
+                    # La mesa antes que la comanda, como pedidos.insertar_comanda
+                    cur.execute("UPDATE mesas SET estatus = 'ocupada' WHERE Id = %s", (cambio['mesa_id'],))
+                    # Acumulada desde el principio: cada volcado suma su diferencia
+                    cur.execute("""
+                        INSERT INTO comandas (mesa_id, total, estatus, usuario_id, acumulada)
+                        VALUES (%s, 0, 'pendiente', (SELECT id FROM usuario WHERE user = %s), 1)
+                    """, (cambio['mesa_id'], cambio['usuario_id']))
+                    comanda_id = cur.lastrowid
+            else:
+                # La comanda antes que sus líneas, como acumular_ventas
+                cur.execute("SELECT id FROM comandas WHERE id = %s FOR UPDATE", (comanda_id,))
+            
+            # Por id de ítem, en el mismo orden que reservar_existencias
+            for item_id, (cantidad, precio) in sorted(cambio['lineas'].items()):
+                cur.execute("""
+                    SELECT id, cantidad FROM comanda_detalle
+                    WHERE comanda_id = %s AND item_id = %s FOR UPDATE
+                """, (comanda_id, item_id))
+                linea = cur.fetchone()
+                if linea:
+                    delta = cantidad - linea['cantidad']
+                    cur.execute("UPDATE comanda_detalle SET cantidad = %s, total = %s WHERE id = %s",
+                                (cantidad, cantidad * precio, linea['id']))
+                else:
+                    delta = cantidad
+                    cur.execute("""
+                        INSERT INTO comanda_detalle (comanda_id, item_id, cantidad, precio_unitario, total)
+                        VALUES (%s, %s, %s, %s, %s)
+                    """, (comanda_id, item_id, cantidad, precio, cantidad * precio))
+                if delta:
+                    # El toque ya se aceptó contra la existencia en memoria:
+                    # aquí se descuenta sin condición
+                    cur.execute("UPDATE item SET existencia = existencia - %s WHERE id = %s",
+                                (delta, item_id))
+                    pedidos.ejecutar(cur, pedidos.acumular_toque(comanda_id, item_id, delta, precio))
+            
+            # Un solo recálculo del total por comanda y lote
             cur.execute("""
-                INSERT INTO comanda_detalle 
-                (comanda_id, item_id, cantidad, precio_unitario, total)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (comanda_id, item['id'], item['cantidad'], item['precio'], item['total']))
-        
-        # Actualizar estado de la mesa
-        cur.execute("UPDATE mesas SET estatus = 'ocupada' WHERE Id = %s", (data['mesa_id'],))
+                UPDATE comandas
+                SET total = (SELECT COALESCE(SUM(total), 0) FROM comanda_detalle WHERE comanda_id = %s)
+                WHERE id = %s
+            """, (comanda_id, comanda_id))
+            ids[cambio['mesa_id']] = comanda_id
         
+        item_ids = sorted({item_id for cambio in cambios for item_id in cambio['lineas']})
+        cur.execute(f"SELECT COUNT(*) AS n FROM item WHERE id IN ({', '.join(['%s'] * len(item_ids))}) "
+                    f"AND existencia <= 0", item_ids)
+        agotados = cur.fetchone()['n']
         conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    
+    _cuentas_volcadas(agotados)
+    return ids
+
+def _cuentas_volcadas(agotados):
+    # Tras el commit de un volcado: la existencia ha cambiado
+    try:
+        etags.invalidar('items')
+        if agotados:
+            catalogo.invalidar()
+    except Exception as e:
+        app.logger.error(f'Cuentas volcadas, pero: {e}')
+
+def _crear_cuentas():
+    # Desde get_cuentas(), con la sucursal ya fijada
+    sucursal = sucursal_actual()
+    directorio = app.config['CUENTAS_DIRECTORIO'] or app.instance_path
+    os.makedirs(directorio, exist_ok=True)
+    abiertas = CuentasAbiertas(
+        os.path.join(directorio, f'cuentas-{sucursal}.diario' if sucursal else 'cuentas.diario'),
+        _leer_mesa_cuenta, _leer_item_cuenta, _volcar_cuentas,
+        lote=app.config['CUENTAS_LOTE'],
+        intervalo=app.config['CUENTAS_INTERVALO'],
+        fsync=app.config['CUENTAS_FSYNC']
+    )
+    
+    @contextmanager
+    def contexto():
+        # El hilo de volcado no ve la sucursal de la petición
+        with sucursales.en(sucursal), app.app_context():
+            yield
+    
+    # Reproduce el diario de una ejecución anterior; se vuelca en el primer ciclo
+    abiertas.abrir(contexto)
+    atexit.register(abiertas.detener)
+    return abiertas
+
+cuentas_abiertas = PorSucursal(_crear_cuentas, sucursal_actual)
+
+def get_cuentas():
+    return cuentas_abiertas.para(sucursal_actual())
+
+def _olvidar_items_cuentas(item_ids=None):
+    # Existencia o precio cambiados sin pasar por las cuentas: que el
+    # siguiente toque no descuente de una existencia vieja. Si esta
+    # sucursal aún no tiene cuentas abiertas no hay caché que limpiar.
+    abiertas = cuentas_abiertas.instancias().get(sucursal_actual())
+    if abiertas is not None:
+        abiertas.olvidar_items(item_ids)
+
+# Flujo de mesa de la tablet (mismo SQL que el modo ASGI, ver pedidos.py)
+@app.route('/comandas/mesa/<int:mesa_id>')
+@login_required
+def cargar_mesa(mesa_id):
+    if app.config['CUENTAS_EN_MEMORIA']:
+        try:
+            cuenta = get_cuentas().ver(mesa_id)
+        except cuentas.NoEncontrado as e:
+            return jsonify({'success': False, 'message': str(e)}), 404
+        except Exception as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
         return jsonify({
-            'success': True,
-            'message': 'Comanda guardada correctamente',
-            'comanda_id': comanda_id
+            'mesa': cuenta['mesa'],
+            'items': [{
+                'id': item_id,
+                'nombre': nombre,
+                'precio': precio,
+                'cantidad': cantidad,
+                'total': cantidad * precio
+            } for item_id, nombre, cantidad, precio in cuenta['lineas']],
+            'total': cuenta['total'],
+            'comanda_id': cuenta['comanda_id']
+        })
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        return jsonify(pedidos.ejecutar(cur, pedidos.cargar_mesa(mesa_id)))
+    except pedidos.NoEncontrado as e:
+        return jsonify({'success': False, 'message': str(e)}), 404
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    finally:
+        cur.close()
+        conn.close()
+
+@app.route('/comandas/agregar_item', methods=['POST'])
+@login_required
+def agregar_item():
+    data = request.get_json()
+    if app.config['CUENTAS_EN_MEMORIA']:
+        # En memoria y al diario; la base se actualiza en el siguiente volcado
+        try:
+            get_cuentas().agregar(int(data['mesa_id']), int(data['item_id']), session['usuario']['user'])
+        except cuentas.ExistenciaInsuficiente as e:
+            return jsonify({'success': False, 'message': str(e)}), 409
+        except cuentas.NoEncontrado as e:
+            return jsonify({'success': False, 'message': str(e)}), 404
+        except Exception as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        try:
+            eventos.publicar('mesas', 'mesa', {'id': data['mesa_id'], 'estatus': 'ocupada'})
+        except Exception as e:
+            app.logger.error(f"Ítem agregado a la mesa {data['mesa_id']}, pero: {e}")
+        return jsonify({'success': True})
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        _, agotados = pedidos.ejecutar(cur, pedidos.agregar_item(
+            data['mesa_id'], data['item_id'], session['usuario']['user']))
+        conn.commit()
+    except pedidos.ExistenciaInsuficiente as e:
+        conn.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 409
+    except pedidos.NoEncontrado as e:
+        conn.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 404
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 400
+    finally:
+        cur.close()
+        conn.close()
+    
+    # El toque ya está confirmado: si falla el aviso solo se registra
+    try:
+        _item_agregado(data['mesa_id'], agotados)
+    except Exception as e:
+        app.logger.error(f"Ítem agregado a la mesa {data['mesa_id']}, pero: {e}")
+    return jsonify({'success': True})
+
+@app.route('/comandas/mesa/<int:mesa_id>/cerrar', methods=['POST'])
+@login_required
+def cerrar_cuenta(mesa_id):
+    # Vuelca la cuenta a la base y la saca de memoria
+    if app.config['CUENTAS_EN_MEMORIA']:
+        try:
+            get_cuentas().cerrar(mesa_id)
+        except Exception as e:
+            return jsonify({'success': False, 'message': f'Error al volcar la cuenta: {str(e)}'}), 500
+    return jsonify({'success': True})
+
+@app.route('/comandas/plano')
+@login_required
+def plano():
+    # Estado de todas las mesas en una consulta: primera comanda pendiente
+    # de cada mesa con su número de líneas y total acumulado. Con las
+    # cuentas en memoria se superponen sus últimos toques.
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            SELECT m.Id as id, m.nombre, m.estatus, p.comanda_id, c.fecha, c.total,
+                   COUNT(cd.id) as lineas
+            FROM mesas m
+            LEFT JOIN (
+                SELECT mesa_id, MIN(id) as comanda_id FROM comandas
+                WHERE estatus = 'pendiente'
+                GROUP BY mesa_id
+            ) p ON p.mesa_id = m.Id
+            LEFT JOIN comandas c ON c.id = p.comanda_id
+            LEFT JOIN comanda_detalle cd ON cd.comanda_id = p.comanda_id
+            GROUP BY m.Id, m.nombre, m.estatus, p.comanda_id, c.fecha, c.total
+            ORDER BY m.nombre
+        """)
+        filas = cur.fetchall()
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+    finally:
+        cur.close()
+        conn.close()
+    
+    en_memoria = get_cuentas().mesas() if app.config['CUENTAS_EN_MEMORIA'] else {}
+    ahora = datetime.now()
+    mesas = []
+    for fila in filas:
+        cuenta = en_memoria.get(fila['id'])
+        if cuenta:
+            comanda_id, abierta = cuenta['comanda_id'] or fila['comanda_id'], cuenta['abierta']
+            lineas, total, estatus = cuenta['lineas'], cuenta['total'], 'ocupada'
+        else:
+            comanda_id, abierta = fila['comanda_id'], fila['fecha']
+            lineas, total, estatus = fila['lineas'], fila['total'] or Decimal('0'), fila['estatus']
+        mesas.append({
+            'id': fila['id'],
+            'nombre': fila['nombre'],
+            'estatus': estatus,
+            'comanda_id': comanda_id,
+            'lineas': lineas,
+            'total': total,
+            'abierta': abierta.isoformat() if abierta else None,
+            'minutos': int((ahora - abierta).total_seconds() // 60) if abierta else None
         })
+    
+    return jsonify({'mesas': mesas, 'generado': ahora.replace(microsecond=0).isoformat()})
+
+# Cola de impresión (impresion.py): los tickets se renderizan una vez a
+# ESC/POS y los imprime en segundo plano el hilo de cada impresora. Una
+# sucursal puede cambiar IMPRESORAS e IMPRESION_RUTAS en SUCURSALES.
+app.config['IMPRESION_DIRECTORIO'] = None  # None = instance_path/impresion
+# Nombre -> tcp://host:9100 o file:///ruta (None = fichero de prueba 'caja')
+app.config['IMPRESORAS'] = None
+# Impresora por tipo de ticket ('cuenta', 'cocina'), código de grupo o formato
+app.config['IMPRESION_RUTAS'] = {}
+app.config['IMPRESION_REINTENTOS'] = 5    # Intentos antes de pasar a fallidos/
+app.config['IMPRESION_ESPERA'] = 2.0      # Primera espera entre intentos; se dobla
+app.config['IMPRESION_TIMEOUT'] = 5
+
+def _crear_impresion():
+    # Desde get_impresion(), con la sucursal ya fijada
+    sucursal = sucursal_actual()
+    directorio = app.config['IMPRESION_DIRECTORIO'] or os.path.join(app.instance_path, 'impresion')
+    if sucursal:
+        directorio = os.path.join(directorio, sucursal)
+    cola = ColaImpresion(
+        directorio,
+        _mysql('IMPRESORAS', sucursal) or {'caja': 'file://' + os.path.join(directorio, 'caja.prn')},
+        reintentos=app.config['IMPRESION_REINTENTOS'],
+        espera=app.config['IMPRESION_ESPERA'],
+        timeout=app.config['IMPRESION_TIMEOUT']
+    )
+    cola.abrir()
+    atexit.register(cola.detener)
+    return cola
+
+colas_impresion = PorSucursal(_crear_impresion, sucursal_actual)
+
+def get_impresion():
+    return colas_impresion.para(sucursal_actual())
+
+@app.route('/comandas/imprimir_comanda/<int:comanda_id>')
+@login_required
+def imprimir_comanda(comanda_id):
+    # ?tipo=cuenta (por defecto) o cocina. Solo se encola: la respuesta no
+    # espera a la impresora
+    tipo = request.args.get('tipo', 'cuenta')
+    if tipo not in ('cuenta', 'cocina'):
+        return jsonify({'success': False, 'message': 'tipo debe ser cuenta o cocina'}), 400
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        if app.config['CUENTAS_EN_MEMORIA']:
+            # Lo impreso tiene que incluir los últimos toques
+            get_cuentas().volcar()
+        cur.execute("""
+            SELECT c.id, c.mesa_id, c.fecha, c.total, m.nombre as mesa
+            FROM comandas c
+            LEFT JOIN mesas m ON c.mesa_id = m.Id
+            WHERE c.id = %s
+        """, (comanda_id,))
+        comanda = cur.fetchone()
+        if not comanda:
+            return jsonify({'success': False, 'message': 'Comanda no encontrada'}), 404
+        cur.execute("""
+            SELECT cd.cantidad, cd.total, i.nombre, i.grupo_codigo, g.formato
+            FROM comanda_detalle cd
+            JOIN item i ON cd.item_id = i.id
+            LEFT JOIN grupos g ON i.grupo_codigo = g.codigo
+            WHERE cd.comanda_id = %s
+            ORDER BY cd.id
+        """, (comanda_id,))
+        lineas = cur.fetchall()
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+    finally:
+        cur.close()
+        conn.close()
+    
+    # Impresora por tipo de ticket; en cocina, por código de grupo, luego
+    # por formato (p. ej. 'bar') y si no la de 'cocina'
+    rutas = _mysql('IMPRESION_RUTAS', sucursal_actual()) or {}
+    defecto = rutas.get('cuenta', 'caja')
+    cabecera = [f"Mesa {comanda['mesa'] or comanda['mesa_id']}",
+                f"Comanda {comanda['id']}  {comanda['fecha']:%d/%m/%Y %H:%M}"]
+    try:
+        if tipo == 'cuenta':
+            datos = ticket_escpos('CUENTA', cabecera,
+                                  [(l['cantidad'], l['nombre'], l['total']) for l in lineas], comanda['total'])
+            trabajos = [get_impresion().encolar(defecto, datos, descripcion=f"cuenta {comanda['id']}")]
+        else:
+            por_impresora = {}
+            for l in lineas:
+                impresora = rutas.get(l['grupo_codigo']) or rutas.get(l['formato']) or rutas.get('cocina', defecto)
+                por_impresora.setdefault(impresora, []).append((l['cantidad'], l['nombre'], None))
+            trabajos = [get_impresion().encolar(impresora, ticket_escpos('COCINA', cabecera, items, grande=True),
+                                                descripcion=f"cocina {comanda['id']}")
+                        for impresora, items in por_impresora.items()]
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error al encolar: {str(e)}'}), 500
+    
+    return jsonify({'success': True, 'trabajos': trabajos}), 202
+
+@app.route('/manager/impresoras')
+@login_required
+@admin_required
+def manager_impresoras():
+    # Trabajos pendientes, impresos y fallidos por impresora
+    return jsonify(get_impresion().estado())
+
+@app.route('/api/eventos')
+@login_required
+def api_eventos():
+    # Stream SSE; no retiene conexión a la base de datos, pero aquí cada
+    # cliente ocupa un hilo del servidor WSGI mientras está conectado. Con
+    # muchos clientes hay que servir con asgi.py, que atiende esta ruta con
+    # stream_sse_async (una tarea por cliente).
+    canales = request.args.get('canales', 'mesas,comandas').split(',')
+    ultimo_id = request.headers.get('Last-Event-ID', type=int)
+    sub = eventos.suscribir(canales, desde_id=ultimo_id)
+    return Response(stream_sse(sub, heartbeat=app.config['EVENTOS_HEARTBEAT']),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Pantallas de cocina. Las líneas nuevas llegan en vivo por
+# /api/eventos?canales=cocina:<estacion>
+@app.route('/api/cocina')
+@login_required
+def api_cocina_estaciones():
+    return jsonify(get_cocina().estaciones())
+
+@app.route('/api/cocina/<estacion>')
+@login_required
+def api_cocina(estacion):
+    return jsonify(get_cocina().pendientes(estacion))
+
+@app.route('/api/cocina/lineas/<int:linea_id>/bump', methods=['POST'])
+@login_required
+def api_cocina_bump(linea_id):
+    # Sube la prioridad de la línea: pasa por delante de las de menor prioridad
+    colas = get_cocina()
+    if colas.obtener(linea_id) is None:
+        return jsonify({'success': False, 'message': 'Línea no encontrada'}), 404
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("UPDATE cocina_linea SET prioridad = prioridad + 1 WHERE detalle_id = %s",
+                    (linea_id,))
+        conn.commit()
     except Exception as e:
         conn.rollback()
-        return jsonify({
-            'success': False,
-            'message': f'Error al guardar comanda: {str(e)}'
-        }), 400
+        return jsonify({'success': False, 'message': str(e)}), 400
     finally:
         cur.close()
         conn.close()
+    
+    # Confirmado en la base: la cola en memoria y el aviso no lo convierten en error
+    prioridad = None
+    try:
+        prioridad = colas.subir_prioridad(linea_id)
+        linea = colas.obtener(linea_id)
+        if linea is not None:
+            eventos.publicar(f"cocina:{linea['estacion']}", 'prioridad',
+                             {'id': linea_id, 'prioridad': prioridad})
+    except Exception as e:
+        app.logger.error(f'Prioridad de la línea {linea_id} guardada, pero: {e}')
+    return jsonify({'success': True, 'prioridad': prioridad})
+
+@app.route('/api/cocina/lineas/<int:linea_id>/completar', methods=['POST'])
+@login_required
+def api_cocina_completar(linea_id):
+    colas = get_cocina()
+    if colas.obtener(linea_id) is None:
+        return jsonify({'success': False, 'message': 'Línea no encontrada'}), 404
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            UPDATE cocina_linea SET estatus = 'completada', completado = NOW()
+            WHERE detalle_id = %s AND estatus = 'pendiente'
+        """, (linea_id,))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 400
+    finally:
+        cur.close()
+        conn.close()
+    
+    try:
+        linea = colas.completar(linea_id)
+        if linea is not None:
+            eventos.publicar(f"cocina:{linea['estacion']}", 'completada', {'id': linea_id})
+    except Exception as e:
+        app.logger.error(f'Línea {linea_id} completada, pero: {e}')
+    return jsonify({'success': True})
+
 # Agrega estas rutas API para items en app.py
 @app.route('/api/items', methods=['GET', 'POST'])
 @login_required
 @admin_required
 def api_items():
     if request.method == 'GET':
-        try:
+        def cargar():
             conn = get_db_connection()
             cur = conn.cursor()
-            cur.execute("""
-                SELECT i.id, i.nombre, i.precio, i.existencia, i.estatus, 
-                       g.codigo as grupo_codigo, g.nombre as grupo_nombre
-                FROM item i 
-                JOIN grupos g ON i.grupo_codigo = g.codigo
-                ORDER BY i.nombre
-            """)
-            items = cur.fetchall()
-            
-            # Convertir Decimal a float
-            for item in items:
-                item['precio'] = float(item['precio'])
-                
-            return jsonify(items)
+            try:
+                cur.execute("""
+                    SELECT i.id, i.nombre, i.precio, i.existencia, i.estatus, 
+                           g.codigo as grupo_codigo, g.nombre as grupo_nombre
+                    FROM item i 
+                    JOIN grupos g ON i.grupo_codigo = g.codigo
+                    ORDER BY i.nombre
+                """)
+                return cur.fetchall()
+            finally:
+                cur.close()
+                conn.close()
+        
+        try:
+            return _json_condicional('items', 'items', cargar)
         except Exception as e:
             return jsonify({'success': False, 'message': str(e)}), 400
-        finally:
-            cur.close()
-            conn.close()
     
     elif request.method == 'POST':
         data = request.get_json()
+        conn = get_db_connection()
+        cur = conn.cursor()
         try:
-            conn = get_db_connection()
-            cur = conn.cursor()
             cur.execute("""
                 INSERT INTO item (nombre, grupo_codigo, precio, existencia, estatus)
                 VALUES (%s, %s, %s, %s, %s)
             """, (data['nombre'], data['grupo_codigo'], data['precio'], 
                  data['existencia'], data['estatus']))
             conn.commit()
+            catalogo.invalidar()
+            etags.invalidar('items')
             return jsonify({'success': True, 'message': 'Item creado correctamente'})
         except Exception as e:
             conn.rollback()
@@ -653,34 +2247,35 @@ def api_items():
 @admin_required
 def api_item(item_id):
     if request.method == 'GET':
-        try:
+        def cargar():
             conn = get_db_connection()
             cur = conn.cursor()
-            cur.execute("""
-                SELECT i.id, i.nombre, i.precio, i.existencia, i.estatus, 
-                       g.codigo as grupo_codigo, g.nombre as grupo_nombre
-                FROM item i 
-                JOIN grupos g ON i.grupo_codigo = g.codigo
-                WHERE i.id = %s
-            """, (item_id,))
-            item = cur.fetchone()
-            
-            if item:
-                item['precio'] = float(item['precio'])
-                return jsonify(item)
-            else:
+            try:
+                cur.execute("""
+                    SELECT i.id, i.nombre, i.precio, i.existencia, i.estatus, 
+                           g.codigo as grupo_codigo, g.nombre as grupo_nombre
+                    FROM item i 
+                    JOIN grupos g ON i.grupo_codigo = g.codigo
+                    WHERE i.id = %s
+                """, (item_id,))
+                return cur.fetchone()
+            finally:
+                cur.close()
+                conn.close()
+        
+        try:
+            respuesta = _json_condicional(('item', item_id), 'items', cargar)
+            if respuesta is None:
                 return jsonify({'success': False, 'message': 'Item no encontrado'}), 404
+            return respuesta
         except Exception as e:
             return jsonify({'success': False, 'message': str(e)}), 400
-        finally:
-            cur.close()
-            conn.close()
     
     elif request.method == 'PUT':
         data = request.get_json()
+        conn = get_db_connection()
+        cur = conn.cursor()
         try:
-            conn = get_db_connection()
-            cur = conn.cursor()
             cur.execute("""
                 UPDATE item 
                 SET nombre=%s, grupo_codigo=%s, precio=%s, existencia=%s, estatus=%s
@@ -688,6 +2283,9 @@ def api_item(item_id):
             """, (data['nombre'], data['grupo_codigo'], data['precio'], 
                  data['existencia'], data['estatus'], item_id))
             conn.commit()
+            catalogo.invalidar()
+            etags.invalidar('items')
+            _olvidar_items_cuentas([item_id])
             return jsonify({'success': True, 'message': 'Item actualizado correctamente'})
         except Exception as e:
             conn.rollback()
@@ -697,11 +2295,14 @@ def api_item(item_id):
             conn.close()
     
     elif request.method == 'DELETE':
+        conn = get_db_connection()
+        cur = conn.cursor()
         try:
-            conn = get_db_connection()
-            cur = conn.cursor()
             cur.execute("DELETE FROM item WHERE id = %s", (item_id,))
             conn.commit()
+            catalogo.invalidar()
+            etags.invalidar('items')
+            _olvidar_items_cuentas([item_id])
             return jsonify({'success': True, 'message': 'Item eliminado correctamente'})
         except Exception as e:
             conn.rollback()
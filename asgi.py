@@ -0,0 +1,277 @@
+# Modo de servicio asíncrono (ASGI) para los endpoints de los meseros.
+#
+#   hypercorn asgi:aplicacion --bind 0.0.0.0:5000 --workers 1
+#
+# /comandas, /api/comandas y el flujo de mesa (/comandas/mesa/<id>,
+# /comandas/agregar_item) se sirven con Quart y aiomysql sin bloquear el
+# bucle de eventos, usando la misma lógica de pedidos.py que la app Flask.
+# /api/eventos (SSE) también es de Quart: cada cliente conectado es una
+# tarea, no un hilo, así que esta es la forma de servir SSE con muchos
+# clientes. El resto de rutas (manager, reportes...) pasa a la app Flask de
+# app.py dentro del mismo proceso, así comparten caché del catálogo,
+# eventos y colas de cocina. Ese estado es del proceso: un solo worker
+# (ver PROCESO_UNICO en app.py); un segundo worker no llega a arrancar.
+import asyncio
+import time
+from functools import wraps
+
+import aiomysql
+from hypercorn.middleware import AsyncioWSGIMiddleware
+from quart import Quart, Response, jsonify, redirect, render_template, request, session, url_for
+from werkzeug.exceptions import MethodNotAllowed, NotFound
+
+import app as flask_app
+import pedidos
+import sucursales
+from eventos import stream_sse_async
+from serializacion import ProveedorJSON
+
+config = flask_app.app.config
+
+app = Quart(__name__)
+app.secret_key = flask_app.app.secret_key
+# Misma serialización que la app Flask (Decimal como número, orjson)
+app.json = ProveedorJSON(app)
+# Misma cookie de sesión que la app Flask
+app.config['PERMANENT_SESSION_LIFETIME'] = config['PERMANENT_SESSION_LIFETIME']
+app.config['SESSION_REFRESH_EACH_REQUEST'] = config['SESSION_REFRESH_EACH_REQUEST']
+
+# Un pool por sucursal (ver SUCURSALES en app.py), creado al primer uso
+_pools = {}
+_pools_lock = asyncio.Lock()
+
+
+async def _pool():
+    sucursal = flask_app.sucursal_actual()
+    pool = _pools.get(sucursal)
+    if pool is None:
+        async with _pools_lock:
+            pool = _pools.get(sucursal)
+            if pool is None:
+                mysql = flask_app._mysql
+                pool = _pools[sucursal] = await aiomysql.create_pool(
+                    host=mysql('MYSQL_HOST', sucursal),
+                    port=mysql('MYSQL_PORT', sucursal),
+                    user=mysql('MYSQL_USER', sucursal),
+                    password=mysql('MYSQL_PASSWORD', sucursal),
+                    db=mysql('MYSQL_DB', sucursal),
+                    minsize=config['MYSQL_POOL_MIN'],
+                    maxsize=config['MYSQL_POOL_MAX'],
+                    pool_recycle=config['MYSQL_POOL_RECYCLE'],
+                    cursorclass=aiomysql.DictCursor,
+                    autocommit=False
+                )
+    return pool
+
+
+@app.before_serving
+async def _crear_pool():
+    # Falla aquí, al arrancar, si ya hay otro worker sirviendo
+    flask_app.bloquear_proceso_unico()
+    # El de la sucursal por defecto se abre ya al arrancar
+    await _pool()
+
+
+@app.after_serving
+async def _cerrar_pool():
+    for pool in _pools.values():
+        pool.close()
+        await pool.wait_closed()
+
+
+@app.before_request
+async def _fijar_sucursal():
+    # Cada petición es su propia tarea de asyncio: no hace falta restaurarla
+    sucursales.fijar(session.get('sucursal'))
+
+
+@app.after_request
+async def _marcar_escritura(response):
+    # Igual que en app.py: los informes de este usuario leen de la principal
+    # hasta que la réplica tenga su escritura
+    if request.method == 'POST' and response.status_code < 400 and 'usuario' in session:
+        session['ultima_escritura'] = time.time()
+    return response
+
+
+def login_required(f):
+    @wraps(f)
+    async def decorated_function(*args, **kwargs):
+        if 'usuario' not in session:
+            return redirect(url_for('login'))
+        return await f(*args, **kwargs)
+    return decorated_function
+
+
+@app.route('/login')
+async def login():
+    # Solo para url_for: el login lo atiende la app Flask
+    return redirect('/login')
+
+
+@app.route('/comandas')
+@login_required
+async def comandas():
+    menu = flask_app.catalogo.actual()
+    if menu is None:
+        # Reconstrucción (poco frecuente) con el loader síncrono en un hilo
+        menu = await asyncio.to_thread(flask_app.catalogo.get)
+
+    async with (await _pool()).acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT Id, nombre, estatus FROM mesas ORDER BY nombre")
+            mesas = await cur.fetchall()
+
+    return await render_template('comandas.html',
+                                 mesas=mesas,
+                                 grupos=menu['grupos'],
+                                 items=menu['items_json'],
+                                 usuario=session['usuario'])
+
+
+@app.route('/api/comandas', methods=['POST'])
+@login_required
+async def api_guardar_comanda():
+    data = await request.get_json()
+    user = session['usuario']['user']
+    clave = request.headers.get('Idempotency-Key')
+    if clave and len(clave) > 100:
+        return jsonify({'success': False, 'message': 'Idempotency-Key demasiado larga'}), 400
+
+    # Sin bloqueos por franjas (bloquearían el bucle de eventos): entre
+    # peticiones simultáneas arbitra la clave única de comanda_idempotencia
+    if clave:
+        guardada = flask_app.idempotencia.obtener((user, clave))
+        if guardada is not None:
+            return jsonify(guardada), 200, {'Idempotent-Replayed': 'true'}
+
+    async with (await _pool()).acquire() as conn:
+        async with conn.cursor() as cur:
+            try:
+                if clave:
+                    guardada = await pedidos.ejecutar_async(cur, pedidos.reclamar_clave(user, clave))
+                    if guardada:
+                        flask_app.idempotencia.guardar((user, clave), guardada)
+                        return jsonify(guardada), 200, {'Idempotent-Replayed': 'true'}
+                    if guardada is not None:
+                        return jsonify({
+                            'success': False,
+                            'message': 'La comanda con esta Idempotency-Key se está procesando'
+                        }), 409
+
+                comanda_id, agotados, lineas_cocina = await pedidos.ejecutar_async(
+                    cur, pedidos.guardar_comanda(data, user, config['COCINA_ESTACIONES'],
+                                                 config['COCINA_ESTACION_DEFECTO']))
+                cuerpo = {
+                    'success': True,
+                    'message': 'Comanda guardada correctamente',
+                    'comanda_id': comanda_id
+                }
+                if clave:
+                    await pedidos.ejecutar_async(
+                        cur, pedidos.guardar_respuesta(user, clave, comanda_id, cuerpo))
+                await conn.commit()
+            except pedidos.ExistenciaInsuficiente as e:
+                await conn.rollback()
+                return jsonify({'success': False, 'message': str(e)}), 409
+            except Exception as e:
+                await conn.rollback()
+                return jsonify({
+                    'success': False,
+                    'message': f'Error al guardar comanda: {str(e)}'
+                }), 400
+
+    # La comanda ya está confirmada: lo que falle a partir de aquí se
+    # registra pero no cambia la respuesta
+    try:
+        if clave:
+            flask_app.idempotencia.guardar((user, clave), cuerpo)
+        # Invalida cachés y encola acumulados y avisos en flask_app.tareas
+        flask_app._comanda_guardada(comanda_id, data, user, agotados, lineas_cocina)
+    except Exception as e:
+        app.logger.error(f'Comanda {comanda_id} guardada, pero: {e}')
+    return jsonify(cuerpo)
+
+
+@app.route('/comandas/mesa/<int:mesa_id>')
+@login_required
+async def cargar_mesa(mesa_id):
+    async with (await _pool()).acquire() as conn:
+        async with conn.cursor() as cur:
+            try:
+                mesa = await pedidos.ejecutar_async(cur, pedidos.cargar_mesa(mesa_id))
+            except pedidos.NoEncontrado as e:
+                return jsonify({'success': False, 'message': str(e)}), 404
+            finally:
+                # Solo lectura: cerrar la transacción implícita
+                await conn.rollback()
+    return jsonify(mesa)
+
+
+@app.route('/comandas/agregar_item', methods=['POST'])
+@login_required
+async def agregar_item():
+    data = await request.get_json()
+    async with (await _pool()).acquire() as conn:
+        async with conn.cursor() as cur:
+            try:
+                _, agotados = await pedidos.ejecutar_async(cur, pedidos.agregar_item(
+                    data['mesa_id'], data['item_id'], session['usuario']['user']))
+                await conn.commit()
+            except pedidos.ExistenciaInsuficiente as e:
+                await conn.rollback()
+                return jsonify({'success': False, 'message': str(e)}), 409
+            except pedidos.NoEncontrado as e:
+                await conn.rollback()
+                return jsonify({'success': False, 'message': str(e)}), 404
+            except Exception as e:
+                await conn.rollback()
+                return jsonify({'success': False, 'message': str(e)}), 400
+
+    try:
+        flask_app._item_agregado(data['mesa_id'], agotados)
+    except Exception as e:
+        app.logger.error(f"Ítem agregado a la mesa {data['mesa_id']}, pero: {e}")
+    return jsonify({'success': True})
+
+
+@app.route('/api/eventos')
+@login_required
+async def api_eventos():
+    # Mismo broker que la app Flask (flask_app.eventos), así que recibe lo
+    # que publiquen las rutas de ambas
+    canales = request.args.get('canales', 'mesas,comandas').split(',')
+    ultimo_id = request.headers.get('Last-Event-ID', type=int)
+    sub = flask_app.eventos.suscribir(canales, desde_id=ultimo_id)
+    response = Response(stream_sse_async(sub, heartbeat=config['EVENTOS_HEARTBEAT']),
+                        mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Sin el RESPONSE_TIMEOUT de Quart (60 s): el stream no termina
+    response.timeout = None
+    return response
+
+
+# Cada petición a Flask corre en el pool de hilos del bucle de eventos
+# (run_in_executor), así una petición lenta no retiene a las demás. El
+# adaptador lee el cuerpo entero antes de llamar a Flask y rechaza lo que
+# pase del límite: /api/comandas/lote necesita más que sus 64 KB por defecto.
+_wsgi = AsyncioWSGIMiddleware(flask_app.app,
+                              max_body_size=config['MAX_CONTENT_LENGTH'] or 16 * 1024 * 1024)
+_rutas = app.url_map.bind('')
+
+
+async def aplicacion(scope, receive, send):
+    # Las rutas asíncronas van a Quart; todo lo demás a la app Flask
+    if scope['type'] == 'http':
+        try:
+            endpoint, _ = _rutas.match(scope['path'], method=scope['method'])
+        except (NotFound, MethodNotAllowed):
+            endpoint = None
+        if endpoint in (None, 'login', 'static'):
+            await _wsgi(scope, receive, send)
+            return
+        if config['CUENTAS_EN_MEMORIA'] and endpoint in ('cargar_mesa', 'agregar_item'):
+            # Las cuentas en memoria son de la app Flask (y de un solo worker)
+            await _wsgi(scope, receive, send)
+            return
+    await app(scope, receive, send)
@@ -0,0 +1,113 @@
+# Compara el servidor WSGI (app.py, hilos) con el modo ASGI (asgi.py,
+# hypercorn) en los endpoints de los meseros, con un solo proceso cada
+# uno y varios niveles de tablets concurrentes. Opcionalmente un
+# administrador lanza el reporte de ventas en bucle mientras tanto.
+#
+#   python benchmarks/asgi_vs_wsgi.py --db comandas_bench --tablets 10 50 200 --duracion 20
+import argparse
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as aplicacion
+from carga import RAIZ, Cliente, Registro, pedido, resumen
+from sembrar import PASSWORD, configurar
+
+SERVIDORES = {
+    'wsgi': ("import app; app.app.config['MYSQL_DB'] = {db!r}; "
+             "app.app.run(host='127.0.0.1', port={puerto}, threaded=True, debug=False)"),
+    'asgi': ("import asyncio, app; app.app.config['MYSQL_DB'] = {db!r}; "
+             "import asgi; from hypercorn.config import Config; from hypercorn.asyncio import serve; "
+             "c = Config(); c.bind = ['127.0.0.1:{puerto}']; c.accesslog = None; "
+             "c.backlog = 2048; asyncio.run(serve(asgi.aplicacion, c))"),
+}
+
+
+def levantar(modo, db, puerto):
+    proceso = subprocess.Popen([sys.executable, '-c', SERVIDORES[modo].format(db=db, puerto=puerto)],
+                               cwd=RAIZ, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f'http://127.0.0.1:{puerto}'
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(base + '/metrics', timeout=1).read()
+            return proceso, base
+        except OSError:
+            time.sleep(0.1)
+    proceso.terminate()
+    raise RuntimeError(f'El servidor {modo} no arrancó')
+
+
+def tablet(n, base, registro, fin, catalogo, mesas):
+    rng = random.Random(n)
+    cliente = Cliente(base)
+    cliente.post_form('/login', {'usuario': f'mesero{n % 50 + 1}', 'password': PASSWORD})
+    while time.monotonic() < fin:
+        mesa_id = rng.choice(mesas)
+        registro.medir('GET /comandas/mesa', lambda: cliente.get(f'/comandas/mesa/{mesa_id}'))
+        datos = pedido(rng, catalogo, mesas)
+        registro.medir('POST /api/comandas', lambda: cliente.post_json('/api/comandas', datos))
+
+
+def reportes(base, registro, fin):
+    cliente = Cliente(base)
+    cliente.post_form('/login', {'usuario': 'admin_bench', 'password': PASSWORD})
+    while time.monotonic() < fin:
+        registro.medir('GET /manager/ventas-item', lambda: cliente.get('/manager/ventas-item'))
+
+
+def correr(base, tablets, duracion, catalogo, mesas, con_reportes):
+    registro = Registro()
+    fin = time.monotonic() + duracion
+    hilos = [threading.Thread(target=tablet, args=(n, base, registro, fin, catalogo, mesas))
+             for n in range(tablets)]
+    if con_reportes:
+        hilos.append(threading.Thread(target=reportes, args=(base, registro, fin)))
+    inicio = time.monotonic()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return resumen(registro, time.monotonic() - inicio)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default='comandas_bench')
+    parser.add_argument('--tablets', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--duracion', type=float, default=20)
+    parser.add_argument('--puerto', type=int, default=5056)
+    parser.add_argument('--sin-reportes', action='store_true')
+    args = parser.parse_args()
+
+    configurar(args.db)
+    conn = aplicacion._nueva_conexion()
+    cur = conn.cursor()
+    cur.execute("SELECT id, precio FROM item WHERE estatus = 'activo'")
+    catalogo = cur.fetchall()
+    cur.execute("SELECT Id FROM mesas")
+    mesas = [fila['Id'] for fila in cur.fetchall()]
+    cur.close()
+    conn.close()
+
+    print(f"{'modo':<5} {'tablets':>7} {'endpoint':<26} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'err':>5}")
+    for tablets in args.tablets:
+        for modo in ('wsgi', 'asgi'):
+            proceso, base = levantar(modo, args.db, args.puerto)
+            try:
+                endpoints = correr(base, tablets, args.duracion, catalogo, mesas, not args.sin_reportes)
+            finally:
+                proceso.terminate()
+                proceso.wait()
+            for nombre, datos in endpoints.items():
+                print(f"{modo:<5} {tablets:>7} {nombre:<26} {datos['rps']:>8.1f} {datos['p50_ms']:>8.1f} "
+                      f"{datos['p95_ms']:>8.1f} {datos['p99_ms']:>8.1f} {datos['errores']:>5}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# Benchmark de la analítica de ventas (analitica.calcular) con un año de
+# comandas sintéticas, sin base de datos: mide la agregación con NumPy a
+# partir de las filas tal como las devuelve el cursor de tuplas, y la
+# compara con un cálculo fila a fila en Python puro (que además sirve de
+# comprobación del resultado).
+#
+#   python benchmarks/bench_analitica.py [--dias 365] [--comandas-dia 300]
+import argparse
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import analitica
+
+
+def generar(desde, dias, por_dia, rng):
+    items = [(i, f'Item {i}', f'G{i % 8}', f'Grupo {i % 8}') for i in range(1, 201)]
+    mesas = [(m, f'Mesa {m}') for m in range(1, 41)]
+    comandas = []
+    detalle = []
+    for d in range(dias):
+        base = (analitica._to_days(desde) + d) * 86400
+        for _ in range(por_dia):
+            segundos = base + rng.randint(12 * 3600, 23 * 3600)
+            lineas = [(rng.randint(1, 200), rng.randint(1, 3), rng.randint(150, 3000))
+                      for _ in range(rng.randint(1, 7))]
+            detalle.extend(lineas)
+            comandas.append((rng.randint(1, 40), segundos, sum(linea[2] for linea in lineas)))
+    return comandas, detalle, items, mesas
+
+
+def fila_a_fila(comandas, detalle, items, desde):
+    # Lo mismo que calcular() pero recorriendo filas en Python
+    mapa = defaultdict(int)
+    por_dia = defaultdict(int)
+    por_mesa = defaultdict(int)
+    for mesa_id, segundos, centimos in comandas:
+        dia = segundos // 86400
+        mapa[((dia + 5) % 7, segundos % 86400 // 3600)] += centimos
+        por_dia[dia - analitica._to_days(desde)] += centimos
+        por_mesa[mesa_id] += 1
+    por_item = defaultdict(int)
+    for item_id, _, centimos in detalle:
+        por_item[item_id] += centimos
+    grupos = {item_id: codigo for item_id, _, codigo, _ in items}
+    top = defaultdict(list)
+    for item_id, centimos in sorted(por_item.items(), key=lambda par: -par[1]):
+        top[grupos[item_id]].append(item_id)
+    return mapa, por_dia, por_mesa, {codigo: ids[:5] for codigo, ids in top.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dias', type=int, default=365)
+    parser.add_argument('--comandas-dia', type=int, default=300)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args()
+
+    desde = date(2024, 1, 1)
+    hasta = desde + timedelta(days=args.dias - 1)
+    comandas, detalle, items, mesas = generar(desde, args.dias, args.comandas_dia, random.Random(1))
+    print(f"{len(comandas)} comandas, {len(detalle)} líneas de detalle ({args.dias} días)")
+
+    tiempos = []
+    for _ in range(args.repeticiones):
+        inicio = time.perf_counter()
+        resultado = analitica.calcular(comandas, detalle, items, mesas, desde, hasta)
+        tiempos.append(time.perf_counter() - inicio)
+    print(f"NumPy (analitica.calcular):   {min(tiempos) * 1000:8.1f} ms")
+    inicio = time.perf_counter()
+    analitica._columnas(comandas, 3)
+    analitica._columnas(detalle, 3)
+    print(f"  de ello, tuplas -> columnas: {(time.perf_counter() - inicio) * 1000:8.1f} ms")
+
+    inicio = time.perf_counter()
+    mapa, por_dia, por_mesa, top = fila_a_fila(comandas, detalle, items, desde)
+    print(f"Python fila a fila:           {(time.perf_counter() - inicio) * 1000:8.1f} ms")
+
+    fallos = []
+    for (dia, hora), centimos in mapa.items():
+        if round(centimos / 100, 2) != resultado['mapa_horas']['ventas'][dia][hora]:
+            fallos.append(f'mapa {dia} {hora}')
+    for indice, centimos in por_dia.items():
+        if round(centimos / 100, 2) != resultado['tendencia'][indice]['ventas']:
+            fallos.append(f'día {indice}')
+    for fila in resultado['mesas']:
+        if por_mesa[fila['mesa_id']] != fila['comandas']:
+            fallos.append(f"mesa {fila['mesa_id']}")
+    for grupo in resultado['top_items']:
+        if [item['item_id'] for item in grupo['items']] != top[grupo['grupo_codigo']]:
+            fallos.append(f"top {grupo['grupo_codigo']}")
+    if fallos:
+        print('FALLO: no coincide en ' + ', '.join(fallos[:10]))
+        sys.exit(1)
+    print('OK: coincide con el cálculo fila a fila')
+
+
+if __name__ == '__main__':
+    main()
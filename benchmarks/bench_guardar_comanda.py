@@ -0,0 +1,82 @@
+# Benchmark de api_guardar_comanda: un INSERT por línea (antes) frente al
+# INSERT multi-fila de _insertar_comanda (después), con 1, 10 y 50 líneas.
+#
+#   python benchmarks/bench_guardar_comanda.py [--pedidos 200] [--commit]
+#
+# Usa la base configurada en app.py. Por defecto cada pedido se deshace con
+# rollback para no ensuciar los datos; --commit mide también el commit real.
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app import _nueva_conexion, _insertar_comanda
+
+
+def insertar_por_linea(cur, mesa_id, total, user, items):
+    cur.execute("""
+        INSERT INTO comandas (mesa_id, total, estatus, usuario_id)
+        VALUES (%s, %s, 'pendiente', 
+            (SELECT id FROM usuario WHERE user = %s))
+    """, (mesa_id, total, user))
+    comanda_id = cur.lastrowid
+    for item in items:
+        cur.execute("""
+            INSERT INTO comanda_detalle 
+            (comanda_id, item_id, cantidad, precio_unitario, total)
+            VALUES (%s, %s, %s, %s, %s)
+        """, (comanda_id, item['id'], item['cantidad'], item['precio'], item['total']))
+    cur.execute("UPDATE mesas SET estatus = 'ocupada' WHERE Id = %s", (mesa_id,))
+    return comanda_id
+
+
+def medir(conn, guardar, pedidos, mesa_id, user, items, commit):
+    total = sum(item['total'] for item in items)
+    cur = conn.cursor()
+    inicio = time.perf_counter()
+    for _ in range(pedidos):
+        guardar(cur, mesa_id, total, user, items)
+        if commit:
+            conn.commit()
+        else:
+            conn.rollback()
+    transcurrido = time.perf_counter() - inicio
+    cur.close()
+    return pedidos / transcurrido
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pedidos', type=int, default=200)
+    parser.add_argument('--commit', action='store_true')
+    args = parser.parse_args()
+
+    conn = _nueva_conexion()
+    cur = conn.cursor()
+    cur.execute("SELECT Id FROM mesas LIMIT 1")
+    mesa_id = cur.fetchone()['Id']
+    cur.execute("SELECT user FROM usuario LIMIT 1")
+    user = cur.fetchone()['user']
+    cur.execute("SELECT id, precio FROM item LIMIT 50")
+    catalogo = cur.fetchall()
+    cur.close()
+
+    print(f"{'lineas':>6} {'antes ped/s':>12} {'despues ped/s':>14} {'mejora':>7}")
+    for lineas in (1, 10, 50):
+        items = [{
+            'id': catalogo[n % len(catalogo)]['id'],
+            'cantidad': 1,
+            'precio': catalogo[n % len(catalogo)]['precio'],
+            'total': catalogo[n % len(catalogo)]['precio'],
+        } for n in range(lineas)]
+        antes = medir(conn, insertar_por_linea, args.pedidos, mesa_id, user, items, args.commit)
+        despues = medir(conn, _insertar_comanda, args.pedidos, mesa_id, user, items, args.commit)
+        print(f"{lineas:>6} {antes:>12.1f} {despues:>14.1f} {despues / antes:>6.2f}x")
+
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
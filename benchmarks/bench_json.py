@@ -0,0 +1,91 @@
+# Benchmark de la serialización JSON de listas grandes: el bucle que
+# convertía cada Decimal a float antes de jsonify (antes) frente al
+# proveedor de serializacion.py sobre las filas tal cual (después), con
+# 50.000 filas de items y de comandas. No necesita base de datos.
+#
+#   python benchmarks/bench_json.py [--filas 50000] [--repeticiones 5]
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+import serializacion
+
+
+def filas_items(n, rng):
+    return [{
+        'id': i,
+        'nombre': f'Item {i}',
+        'precio': Decimal(rng.randint(100, 50000)) / 100,
+        'existencia': rng.randint(0, 200),
+        'estatus': 'activo',
+        'grupo_codigo': f'G{i % 20}',
+        'grupo_nombre': f'Grupo {i % 20}'
+    } for i in range(n)]
+
+
+def filas_comandas(n, rng):
+    inicio = datetime(2024, 1, 1, 12)
+    return [{
+        'id': i,
+        'mesa': f'Mesa {i % 40}',
+        'total': Decimal(rng.randint(500, 500000)) / 100,
+        'fecha': inicio + timedelta(minutes=i),
+        'estatus': 'pagada',
+        'usuario': f'Mesero {i % 12}'
+    } for i in range(n)]
+
+
+def antes(filas, proveedor, columna):
+    # Copia de las filas y float() por fila, como hacían los endpoints
+    copia = [dict(fila) for fila in filas]
+    for fila in copia:
+        fila[columna] = float(fila[columna])
+    return proveedor.dumps(copia).encode('utf-8')
+
+
+def despues(filas):
+    return serializacion.dumps_bytes(filas)
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--filas', type=int, default=50000)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    proveedor = DefaultJSONProvider(Flask(__name__))
+    casos = [
+        ('items', filas_items(args.filas, rng), 'precio'),
+        ('comandas', filas_comandas(args.filas, rng), 'total'),
+    ]
+
+    motor = 'orjson' if serializacion.orjson is not None else 'json'
+    print(f"{args.filas} filas, mejor de {args.repeticiones} (serializacion usa {motor})")
+    print(f"{'lista':<10} {'antes ms':>10} {'después ms':>11} {'x':>6}")
+    for nombre, filas, columna in casos:
+        t_antes = medir(lambda: antes(filas, proveedor, columna), args.repeticiones)
+        t_despues = medir(lambda: despues(filas), args.repeticiones)
+        print(f"{nombre:<10} {t_antes:>10.1f} {t_despues:>11.1f} {t_antes / t_despues:>6.1f}")
+
+
+if __name__ == '__main__':
+    main()
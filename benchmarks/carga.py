@@ -0,0 +1,248 @@
+# Prueba de carga de la hora punta: N meseros concurrentes inician sesión
+# en /login, cargan /comandas y envían pedidos a /api/comandas, mientras
+# un administrador navega /manager/comandas y /manager/ventas-item.
+#
+#   python benchmarks/sembrar.py --db comandas_bench --detalle 1000000
+#   python benchmarks/carga.py --db comandas_bench --meseros 30 --duracion 60
+#
+# Sin --url levanta la aplicación en un subproceso apuntando a --db. Los
+# resultados (rps y p50/p95/p99 por endpoint) se guardan en
+# benchmarks/resultados/ y se comparan con la ejecución anterior.
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+from http.cookiejar import CookieJar
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, RAIZ)
+
+import app as aplicacion
+from sembrar import PASSWORD, configurar
+
+RESULTADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resultados')
+
+# Líneas por pedido: (mínimo, máximo, peso). Mayoría de mesas pequeñas y
+# algún grupo grande.
+TAMANOS_PEDIDO = [(1, 3, 40), (4, 8, 40), (9, 20, 15), (21, 40, 5)]
+
+
+class Registro:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.tiempos = {}
+        self.errores = {}
+
+    def medir(self, nombre, fn):
+        inicio = time.perf_counter()
+        ok = False
+        try:
+            ok = fn()
+        except (urllib.error.URLError, OSError, ValueError):
+            ok = False
+        transcurrido = time.perf_counter() - inicio
+        with self._lock:
+            self.tiempos.setdefault(nombre, []).append(transcurrido)
+            if not ok:
+                self.errores[nombre] = self.errores.get(nombre, 0) + 1
+
+
+class Cliente:
+
+    def __init__(self, base):
+        self.base = base
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(CookieJar()))
+
+    def get(self, ruta):
+        with self.opener.open(self.base + ruta, timeout=30) as resp:
+            resp.read()
+            return resp.status == 200
+
+    def post_form(self, ruta, datos):
+        cuerpo = urllib.parse.urlencode(datos).encode()
+        with self.opener.open(self.base + ruta, cuerpo, timeout=30) as resp:
+            resp.read()
+            return resp.status == 200
+
+    def post_json(self, ruta, datos):
+        peticion = urllib.request.Request(self.base + ruta, json.dumps(datos).encode(),
+                                          {'Content-Type': 'application/json'})
+        try:
+            with self.opener.open(peticion, timeout=30) as resp:
+                return json.loads(resp.read()).get('success', False)
+        except urllib.error.HTTPError as e:
+            e.read()
+            return False
+
+
+def pedido(rng, catalogo, mesas):
+    minimo, maximo, _ = rng.choices(TAMANOS_PEDIDO, weights=[t[2] for t in TAMANOS_PEDIDO])[0]
+    items = []
+    for item in rng.sample(catalogo, min(len(catalogo), rng.randint(minimo, maximo))):
+        cantidad = rng.randint(1, 3)
+        precio = float(item['precio'])
+        items.append({'id': item['id'], 'cantidad': cantidad, 'precio': precio,
+                      'total': round(precio * cantidad, 2)})
+    return {'mesa_id': rng.choice(mesas), 'items': items,
+            'total': round(sum(i['total'] for i in items), 2)}
+
+
+def mesero(n, base, registro, fin, catalogo, mesas, pausa, semilla):
+    rng = random.Random(semilla + n)
+    cliente = Cliente(base)
+    registro.medir('POST /login', lambda: cliente.post_form(
+        '/login', {'usuario': f'mesero{n}', 'password': PASSWORD}))
+    while time.monotonic() < fin:
+        registro.medir('GET /comandas', lambda: cliente.get('/comandas'))
+        datos = pedido(rng, catalogo, mesas)
+        registro.medir('POST /api/comandas', lambda: cliente.post_json('/api/comandas', datos))
+        if pausa:
+            time.sleep(rng.uniform(0, 2 * pausa))
+
+
+def administrador(base, registro, fin, pausa):
+    cliente = Cliente(base)
+    registro.medir('POST /login', lambda: cliente.post_form(
+        '/login', {'usuario': 'admin_bench', 'password': PASSWORD}))
+    while time.monotonic() < fin:
+        registro.medir('GET /manager/comandas', lambda: cliente.get('/manager/comandas'))
+        registro.medir('GET /manager/ventas-item', lambda: cliente.get('/manager/ventas-item'))
+        time.sleep(pausa)
+
+
+def percentil(valores, p):
+    indice = min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))
+    return valores[indice]
+
+
+def resumen(registro, duracion):
+    endpoints = {}
+    for nombre, tiempos in sorted(registro.tiempos.items()):
+        tiempos = sorted(tiempos)
+        endpoints[nombre] = {
+            'peticiones': len(tiempos),
+            'errores': registro.errores.get(nombre, 0),
+            'rps': len(tiempos) / duracion,
+            'p50_ms': percentil(tiempos, 50) * 1000,
+            'p95_ms': percentil(tiempos, 95) * 1000,
+            'p99_ms': percentil(tiempos, 99) * 1000,
+        }
+    return endpoints
+
+
+def anterior():
+    if not os.path.isdir(RESULTADOS):
+        return None
+    archivos = sorted(f for f in os.listdir(RESULTADOS) if f.endswith('.json'))
+    if not archivos:
+        return None
+    with open(os.path.join(RESULTADOS, archivos[-1])) as f:
+        return json.load(f)
+
+
+def imprimir(endpoints, previo):
+    print(f"{'endpoint':<26} {'n':>7} {'err':>5} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for nombre, datos in endpoints.items():
+        linea = (f"{nombre:<26} {datos['peticiones']:>7} {datos['errores']:>5} {datos['rps']:>8.1f} "
+                 f"{datos['p50_ms']:>8.1f} {datos['p95_ms']:>8.1f} {datos['p99_ms']:>8.1f}")
+        antes = (previo or {}).get('endpoints', {}).get(nombre)
+        if antes and antes['p95_ms']:
+            linea += f"   p95 {(datos['p95_ms'] / antes['p95_ms'] - 1) * 100:+.0f}%"
+        print(linea)
+
+
+def levantar_servidor(db, puerto):
+    codigo = (f"import app; app.app.config['MYSQL_DB'] = {db!r}; "
+              f"app.app.run(host='127.0.0.1', port={puerto}, threaded=True, debug=False)")
+    proceso = subprocess.Popen([sys.executable, '-c', codigo], cwd=RAIZ,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f'http://127.0.0.1:{puerto}'
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(base + '/metrics', timeout=1).read()
+            return proceso, base
+        except OSError:
+            time.sleep(0.1)
+    proceso.terminate()
+    raise RuntimeError('El servidor no arrancó')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default='comandas_bench')
+    parser.add_argument('--url', help='Servidor ya levantado; si falta se arranca uno')
+    parser.add_argument('--puerto', type=int, default=5055)
+    parser.add_argument('--meseros', type=int, default=20)
+    parser.add_argument('--duracion', type=float, default=30, help='Segundos de carga')
+    parser.add_argument('--pausa', type=float, default=0.5, help='Pausa media entre pedidos por mesero')
+    parser.add_argument('--pausa-admin', type=float, default=2.0)
+    parser.add_argument('--semilla', type=int, default=1)
+    parser.add_argument('--etiqueta', default='', help='Texto libre guardado con el resultado')
+    args = parser.parse_args()
+
+    configurar(args.db)
+    conn = aplicacion._nueva_conexion()
+    cur = conn.cursor()
+    cur.execute("SELECT id, precio FROM item WHERE estatus = 'activo'")
+    catalogo = cur.fetchall()
+    cur.execute("SELECT Id FROM mesas")
+    mesas = [fila['Id'] for fila in cur.fetchall()]
+    cur.execute("SELECT COUNT(*) AS n FROM comanda_detalle")
+    filas_detalle = cur.fetchone()['n']
+    cur.close()
+    conn.close()
+
+    proceso = None
+    base = args.url
+    if not base:
+        proceso, base = levantar_servidor(args.db, args.puerto)
+
+    registro = Registro()
+    fin = time.monotonic() + args.duracion
+    hilos = [threading.Thread(target=mesero, args=(n, base, registro, fin, catalogo, mesas,
+                                                   args.pausa, args.semilla))
+             for n in range(1, args.meseros + 1)]
+    hilos.append(threading.Thread(target=administrador, args=(base, registro, fin, args.pausa_admin)))
+    inicio = time.monotonic()
+    try:
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+    finally:
+        if proceso:
+            proceso.terminate()
+            proceso.wait()
+    duracion = time.monotonic() - inicio
+
+    endpoints = resumen(registro, duracion)
+    previo = anterior()
+    imprimir(endpoints, previo)
+
+    os.makedirs(RESULTADOS, exist_ok=True)
+    marca = datetime.now().strftime('%Y%m%d-%H%M%S')
+    with open(os.path.join(RESULTADOS, f'{marca}.json'), 'w') as f:
+        json.dump({
+            'fecha': marca,
+            'etiqueta': args.etiqueta,
+            'db': args.db,
+            'filas_detalle': filas_detalle,
+            'meseros': args.meseros,
+            'duracion': duracion,
+            'pausa': args.pausa,
+            'endpoints': endpoints,
+        }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
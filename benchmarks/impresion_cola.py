@@ -0,0 +1,131 @@
+# Comprueba la cola de impresión sin impresoras reales: un socket local
+# hace de impresora de red y un fichero de impresora de barra. Mide lo que
+# tarda encolar (lo que espera el camarero) frente a imprimir, los
+# reintentos con una impresora que no responde y la recuperación de la
+# cola tras reiniciar:
+#
+#   python benchmarks/impresion_cola.py --tickets 500
+import argparse
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from impresion import ColaImpresion, ticket_escpos
+
+
+def impresora_red():
+    # Servidor raw tipo puerto 9100: guarda lo recibido en cada conexión
+    servidor = socket.socket()
+    servidor.bind(('127.0.0.1', 0))
+    servidor.listen(16)
+    recibido = []
+
+    def atender():
+        while True:
+            conexion, _ = servidor.accept()
+            with conexion:
+                partes = []
+                while True:
+                    datos = conexion.recv(65536)
+                    if not datos:
+                        break
+                    partes.append(datos)
+                recibido.append(b''.join(partes))
+
+    threading.Thread(target=atender, daemon=True).start()
+    return servidor.getsockname()[1], recibido
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def esperar(condicion, limite=30):
+    fin = time.monotonic() + limite
+    while not condicion():
+        if time.monotonic() > fin:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def ticket(n):
+    lineas = [(2, 'Cerveza de barril', 3.5), (1, 'Tacos al pastor (orden)', 95.0), (3, 'Agua mineral', 2.0)]
+    return ticket_escpos('CUENTA', [f'Mesa {n % 20 + 1}', f'Comanda {n}'], lineas, 105.5)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tickets', type=int, default=500)
+    args = parser.parse_args()
+    fallos = []
+
+    puerto, recibido = impresora_red()
+    directorio = tempfile.mkdtemp(prefix='impresion_')
+    barra = os.path.join(directorio, 'barra.prn')
+    impresoras = {
+        'caja': f'tcp://127.0.0.1:{puerto}',
+        'barra': 'file://' + barra,
+        'caida': f'tcp://127.0.0.1:{puerto_libre()}'
+    }
+    cola = ColaImpresion(os.path.join(directorio, 'cola'), impresoras, reintentos=3, espera=0.05, timeout=1)
+    cola.abrir()
+
+    datos = ticket(1)
+    print(f'Ticket ESC/POS: {len(datos)} bytes')
+
+    inicio = time.perf_counter()
+    for n in range(args.tickets):
+        cola.encolar('caja', ticket(n), descripcion=f'cuenta {n}')
+    encolado = time.perf_counter() - inicio
+    print(f'Encolar {args.tickets} tickets: {encolado * 1000:.1f} ms '
+          f'({encolado / args.tickets * 1e6:.0f} µs por ticket)')
+    if not esperar(lambda: len(recibido) == args.tickets):
+        fallos.append(f'la impresora de red recibió {len(recibido)} de {args.tickets}')
+    total = time.perf_counter() - inicio
+    print(f'Impresos por red: {len(recibido)} en {total * 1000:.1f} ms')
+    if recibido and recibido[0] != ticket(0):
+        fallos.append('los bytes recibidos no son los del ticket')
+
+    cola.encolar('barra', datos)
+    cola.encolar('caida', datos)
+    esperar(lambda: cola.estado()['barra']['impresos'] == 1 and cola.estado()['caida']['fallidos'] == 1)
+    estado = cola.estado()
+    if not os.path.exists(barra) or open(barra, 'rb').read() != datos:
+        fallos.append('el fichero de barra no tiene el ticket')
+    print(f"Impresora caída: {estado['caida']['fallidos']} fallido tras 3 intentos "
+          f"({estado['caida']['ultimo_error']})")
+    if estado['caida']['fallidos'] != 1 or len(os.listdir(os.path.join(directorio, 'cola', 'fallidos'))) != 1:
+        fallos.append('el trabajo de la impresora caída no pasó a fallidos')
+    cola.detener()
+
+    # Reinicio: un ticket que no se pudo imprimir sigue en disco y sale en
+    # cuanto la impresora vuelve tras reabrir la cola
+    cola = ColaImpresion(os.path.join(directorio, 'cola'), impresoras, espera=60, timeout=1)
+    cola.abrir()
+    cola.encolar('caida', datos)
+    esperar(lambda: cola.estado()['caida']['ultimo_error'] is not None)
+    cola.detener()
+    cola = ColaImpresion(os.path.join(directorio, 'cola'), dict(impresoras, caida=impresoras['caja']))
+    antes = len(recibido)
+    cola.abrir()
+    if not esperar(lambda: len(recibido) == antes + 1):
+        fallos.append('el ticket pendiente no se imprimió tras reiniciar')
+    cola.detener()
+    print(f'Tras reiniciar: {len(recibido) - antes} ticket pendiente recuperado')
+
+    if fallos:
+        print('FALLO: ' + '; '.join(fallos))
+        sys.exit(1)
+    print('OK: cola de impresión correcta')
+
+
+if __name__ == '__main__':
+    main()
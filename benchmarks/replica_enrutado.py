@@ -0,0 +1,94 @@
+# Comprueba el enrutado de lecturas a la réplica con dos instancias de
+# MySQL locales (principal y réplica) o, como doble, una segunda base en el
+# mismo servidor (sin replicación cuenta como retraso 0):
+#
+#   python benchmarks/sembrar.py --db comandas_bench
+#   python benchmarks/sembrar.py --db comandas_bench_replica
+#   python benchmarks/replica_enrutado.py --db comandas_bench --replica-db comandas_bench_replica
+#
+# Con dos instancias: --replica-host 127.0.0.1 --replica-port 3307.
+# Guarda una comanda en la base principal.
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as aplicacion
+from sembrar import PASSWORD, configurar
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default='comandas_bench')
+    parser.add_argument('--replica-host', default='localhost')
+    parser.add_argument('--replica-port', type=int, default=None)
+    parser.add_argument('--replica-db', default=None)
+    parser.add_argument('--puerto-caido', type=int, default=3999, help='Puerto sin MySQL para simular la caída')
+    args = parser.parse_args()
+
+    configurar(args.db)
+    config = aplicacion.app.config
+    config['MYSQL_REPLICA_HOST'] = args.replica_host
+    config['MYSQL_REPLICA_PORT'] = args.replica_port
+    config['MYSQL_REPLICA_DB'] = args.replica_db
+    estado = aplicacion.estado_replica.para(aplicacion.sucursal_actual())
+    # La réplica se vuelve a medir en cada lectura
+    estado.vigencia = 0
+
+    conn = aplicacion._nueva_conexion()
+    cur = conn.cursor()
+    cur.execute("SELECT id, precio FROM item WHERE existencia > 0 LIMIT 1")
+    item = cur.fetchone()
+    cur.execute("SELECT Id FROM mesas LIMIT 1")
+    mesa_id = cur.fetchone()['Id']
+    cur.close()
+    conn.close()
+
+    cliente = aplicacion.app.test_client()
+    cliente.post('/login', data={'usuario': 'admin_bench', 'password': PASSWORD})
+    fallos = []
+
+    def informe(esperado, caso):
+        lecturas, desvios = estado.lecturas, estado.desvios
+        respuesta = cliente.get('/manager/ventas-item')
+        destino = 'réplica' if estado.lecturas > lecturas else 'principal' if estado.desvios > desvios else '?'
+        print(f"  {caso:<45} -> {destino} (HTTP {respuesta.status_code}, retraso {estado.retraso})")
+        if destino != esperado:
+            fallos.append(f'{caso}: fue a {destino}, se esperaba {esperado}')
+
+    informe('réplica', 'informe sin escrituras')
+
+    respuesta = cliente.post('/api/comandas', json={
+        'mesa_id': mesa_id,
+        'total': float(item['precio']),
+        'items': [{'id': item['id'], 'cantidad': 1, 'precio': float(item['precio']),
+                   'total': float(item['precio'])}]
+    })
+    if respuesta.status_code != 200:
+        fallos.append(f'no se pudo guardar la comanda: {respuesta.get_json()}')
+    informe('principal', 'justo después de guardar una comanda')
+    # Sin retraso, la réplica ya tiene la escritura pasado el margen de 1 s
+    time.sleep(2)
+    informe('réplica', '2 s después')
+
+    max_retraso = estado.max_retraso
+    estado.max_retraso = -1
+    informe('principal', 'réplica más atrasada que la tolerancia')
+    estado.max_retraso = max_retraso
+
+    config['MYSQL_REPLICA_PORT'] = args.puerto_caido
+    aplicacion._descartar_pool(replica=True)
+    informe('principal', 'réplica caída')
+    if not estado.fallos:
+        fallos.append('la caída de la réplica no se registró')
+
+    if fallos:
+        print('FALLO: ' + '; '.join(fallos))
+        sys.exit(1)
+    print('OK: enrutado de lecturas correcto')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+# Crea y llena una base de datos de pruebas de carga.
+#
+#   python benchmarks/sembrar.py --db comandas_bench --detalle 10000
+#   python benchmarks/sembrar.py --db comandas_bench_1m --detalle 1000000
+#   python benchmarks/sembrar.py --db comandas_bench_10m --detalle 10000000
+#
+# Aplica las migraciones, genera grupos, items, mesas, meseros
+# (mesero1..N / bench) y un administrador (admin_bench / bench), y reparte
+# las comandas del último año. Al final reconstruye ventas_item_hora.
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pymysql
+
+import app as aplicacion
+from migraciones import migrar
+
+LOTE = 5000
+LINEAS_POR_COMANDA = 5
+PASSWORD = 'bench'
+
+
+def configurar(db, host=None, port=None, user=None, password=None):
+    config = aplicacion.app.config
+    for clave, valor in (('MYSQL_HOST', host), ('MYSQL_PORT', port),
+                         ('MYSQL_USER', user), ('MYSQL_PASSWORD', password)):
+        if valor is not None:
+            config[clave] = valor
+    config['MYSQL_DB'] = db
+
+
+def crear_base(db):
+    config = aplicacion.app.config
+    conn = pymysql.connect(host=config['MYSQL_HOST'], port=config['MYSQL_PORT'],
+                           user=config['MYSQL_USER'], password=config['MYSQL_PASSWORD'])
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"CREATE DATABASE IF NOT EXISTS `{db}`")
+    finally:
+        conn.close()
+
+
+def sembrar(conn, detalle, meseros, mesas, items, rng):
+    cur = conn.cursor()
+
+    grupos = [('BEB', 'Bebidas', 'bar'), ('CER', 'Cervezas', 'bar'), ('ENT', 'Entradas', 'cocina'),
+              ('PAR', 'Parrilla', 'parrilla'), ('PAS', 'Pastas', 'cocina'), ('POS', 'Postres', 'postres')]
+    cur.executemany("INSERT IGNORE INTO grupos (codigo, nombre, formato) VALUES (%s, %s, %s)", grupos)
+
+    cur.executemany("""
+        INSERT INTO item (nombre, grupo_codigo, precio, existencia, estatus)
+        VALUES (%s, %s, %s, %s, 'activo')
+    """, [(f'Item {n}', grupos[n % len(grupos)][0], Decimal(rng.randint(150, 4500)) / 100, 10 ** 9)
+          for n in range(1, items + 1)])
+    cur.executemany("INSERT INTO mesas (nombre, estatus) VALUES (%s, 'libre')",
+                    [(f'Mesa {n:02d}',) for n in range(1, mesas + 1)])
+    cur.executemany("""
+        INSERT INTO usuario (user, password, nombre_completo, estatus)
+        VALUES (%s, %s, %s, 'activo')
+    """, [(f'mesero{n}', PASSWORD, f'Mesero {n}') for n in range(1, meseros + 1)]
+         + [('admin_bench', PASSWORD, 'Admin')])
+    conn.commit()
+
+    cur.execute("SELECT id, precio FROM item")
+    catalogo = [(fila['id'], fila['precio']) for fila in cur.fetchall()]
+    cur.execute("SELECT Id FROM mesas")
+    id_mesas = [fila['Id'] for fila in cur.fetchall()]
+    cur.execute("SELECT id FROM usuario")
+    id_usuarios = [fila['id'] for fila in cur.fetchall()]
+
+    ahora = datetime.now()
+    total_comandas = max(1, detalle // LINEAS_POR_COMANDA)
+    cur.execute("SELECT COALESCE(MAX(id), 0) AS id FROM comandas")
+    siguiente_id = cur.fetchone()['id'] + 1
+    inicio = time.perf_counter()
+    escritas = 0
+
+    while escritas < total_comandas:
+        comandas = []
+        lineas = []
+        for comanda_id in range(siguiente_id, siguiente_id + min(LOTE, total_comandas - escritas)):
+            fecha = ahora - timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+            total = Decimal(0)
+            for item_id, precio in rng.sample(catalogo, LINEAS_POR_COMANDA):
+                cantidad = rng.randint(1, 4)
+                lineas.append((comanda_id, item_id, cantidad, precio, precio * cantidad))
+                total += precio * cantidad
+            comandas.append((comanda_id, rng.choice(id_mesas), rng.choice(id_usuarios),
+                             total, fecha, 'pagada'))
+        cur.executemany("""
+            INSERT INTO comandas (id, mesa_id, usuario_id, total, fecha, estatus)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, comandas)
+        cur.executemany("""
+            INSERT INTO comanda_detalle (comanda_id, item_id, cantidad, precio_unitario, total)
+            VALUES (%s, %s, %s, %s, %s)
+        """, lineas)
+        conn.commit()
+        siguiente_id += len(comandas)
+        escritas += len(comandas)
+        print(f'\r{escritas * LINEAS_POR_COMANDA:,} líneas de detalle '
+              f'({time.perf_counter() - inicio:.0f} s)', end='', flush=True)
+    print()
+    cur.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default='comandas_bench')
+    parser.add_argument('--host')
+    parser.add_argument('--port', type=int)
+    parser.add_argument('--user')
+    parser.add_argument('--password')
+    parser.add_argument('--detalle', type=int, default=10000, help='Líneas de comanda_detalle a generar')
+    parser.add_argument('--meseros', type=int, default=50)
+    parser.add_argument('--mesas', type=int, default=60)
+    parser.add_argument('--items', type=int, default=120)
+    parser.add_argument('--semilla', type=int, default=1)
+    args = parser.parse_args()
+
+    configurar(args.db, args.host, args.port, args.user, args.password)
+    crear_base(args.db)
+    conn = aplicacion._nueva_conexion()
+    try:
+        migrar(conn)
+        sembrar(conn, args.detalle, args.meseros, args.mesas, args.items, random.Random(args.semilla))
+        print(f'ventas_item_hora: {aplicacion.reconstruir_acumulado_ventas(conn):,} filas')
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
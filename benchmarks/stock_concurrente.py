@@ -0,0 +1,120 @@
+# Prueba de concurrencia del descuento de existencias: muchos meseros
+# piden a la vez los mismos ítems populares (en distinto orden dentro de
+# cada pedido). Comprueba que no se vende más de lo que había, que la
+# existencia final cuadra con los pedidos aceptados y que no hay deadlocks.
+#
+#   python benchmarks/sembrar.py --db comandas_bench
+#   python benchmarks/stock_concurrente.py --db comandas_bench --hilos 32 --stock 100
+#
+# Modifica la existencia de los ítems elegidos y deja las comandas creadas.
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pymysql
+
+import app as aplicacion
+import pedidos
+from sembrar import configurar
+
+ERROR_DEADLOCK = 1213
+ERROR_LOCK_TIMEOUT = 1205
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default='comandas_bench')
+    parser.add_argument('--hilos', type=int, default=32)
+    parser.add_argument('--pedidos', type=int, default=20, help='Pedidos por hilo')
+    parser.add_argument('--stock', type=int, default=100, help='Existencia inicial de cada ítem popular')
+    parser.add_argument('--populares', type=int, default=3)
+    args = parser.parse_args()
+
+    configurar(args.db)
+    conn = aplicacion._nueva_conexion()
+    cur = conn.cursor()
+    cur.execute("SELECT id, precio FROM item ORDER BY id LIMIT %s", (args.populares,))
+    populares = cur.fetchall()
+    ids = [item['id'] for item in populares]
+    cur.execute(f"UPDATE item SET existencia = %s WHERE id IN ({', '.join(['%s'] * len(ids))})",
+                [args.stock] + ids)
+    cur.execute("SELECT Id FROM mesas LIMIT 1")
+    mesa_id = cur.fetchone()['Id']
+    cur.execute("SELECT user FROM usuario LIMIT 1")
+    user = cur.fetchone()['user']
+    conn.commit()
+
+    lock = threading.Lock()
+    vendido = {item_id: 0 for item_id in ids}
+    resultado = {'aceptados': 0, 'rechazados': 0, 'deadlocks': 0, 'otros_errores': 0}
+
+    def mesero(n):
+        rng = random.Random(n)
+        conexion = aplicacion._nueva_conexion()
+        cursor = conexion.cursor()
+        for _ in range(args.pedidos):
+            lineas = rng.sample(populares, rng.randint(1, len(populares)))
+            items = [{'id': item['id'], 'cantidad': rng.randint(1, 3), 'precio': item['precio'],
+                      'total': item['precio']} for item in lineas]
+            try:
+                aplicacion._reservar_existencias(cursor, items)
+                aplicacion._insertar_comanda(cursor, mesa_id, 0, user, items)
+                conexion.commit()
+                with lock:
+                    resultado['aceptados'] += 1
+                    for item in items:
+                        vendido[item['id']] += item['cantidad']
+            except pedidos.ExistenciaInsuficiente:
+                conexion.rollback()
+                with lock:
+                    resultado['rechazados'] += 1
+            except pymysql.err.OperationalError as e:
+                conexion.rollback()
+                with lock:
+                    if e.args[0] in (ERROR_DEADLOCK, ERROR_LOCK_TIMEOUT):
+                        resultado['deadlocks'] += 1
+                    else:
+                        resultado['otros_errores'] += 1
+        cursor.close()
+        conexion.close()
+
+    hilos = [threading.Thread(target=mesero, args=(n,)) for n in range(args.hilos)]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    transcurrido = time.perf_counter() - inicio
+
+    cur.execute(f"SELECT id, existencia FROM item WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+    finales = {fila['id']: fila['existencia'] for fila in cur.fetchall()}
+    cur.close()
+    conn.close()
+
+    total = args.hilos * args.pedidos
+    print(f"{total} pedidos en {transcurrido:.2f} s ({total / transcurrido:.0f} ped/s): {resultado}")
+    fallos = []
+    for item_id in ids:
+        print(f"  item {item_id}: vendido {vendido[item_id]}, existencia final {finales[item_id]}")
+        if finales[item_id] < 0:
+            fallos.append(f'item {item_id} con existencia negativa')
+        if finales[item_id] != args.stock - vendido[item_id]:
+            fallos.append(f'item {item_id} no cuadra con lo vendido')
+    if resultado['deadlocks']:
+        fallos.append(f"{resultado['deadlocks']} deadlocks")
+    if resultado['otros_errores']:
+        fallos.append(f"{resultado['otros_errores']} errores inesperados")
+
+    if fallos:
+        print('FALLO: ' + '; '.join(fallos))
+        sys.exit(1)
+    print('OK: sin sobreventa ni deadlocks')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+# Comprueba el enrutado por sucursal con varias bases locales, una por
+# sucursal, en el mismo servidor MySQL:
+#
+#   python benchmarks/sembrar.py --db comandas_suc_centro
+#   python benchmarks/sembrar.py --db comandas_suc_norte
+#   python benchmarks/sucursales_enrutado.py --db comandas_suc_centro --db comandas_suc_norte
+#
+# Guarda una comanda en cada sucursal con su propia sesión y verifica que
+# cada una llega solo a su base, que las cachés no se mezclan y que el
+# informe conjunto de ventas por ítem (en paralelo) suma el de cada base.
+import argparse
+import os
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as aplicacion
+import sucursales
+from sembrar import PASSWORD
+
+
+def contar_comandas(sucursal):
+    conn = aplicacion._nueva_conexion(sucursal)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*) AS n FROM comandas")
+            return cur.fetchone()['n']
+    finally:
+        conn.close()
+
+
+def primer_item(sucursal):
+    conn = aplicacion._nueva_conexion(sucursal)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id, precio FROM item WHERE existencia > 0 ORDER BY id LIMIT 1")
+            item = cur.fetchone()
+            cur.execute("SELECT Id FROM mesas ORDER BY Id LIMIT 1")
+            return item, cur.fetchone()['Id']
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', action='append', required=True, help='Base de una sucursal (repetir)')
+    args = parser.parse_args()
+    if len(args.db) < 2:
+        parser.error('Hacen falta al menos dos bases')
+
+    config = aplicacion.app.config
+    config['SUCURSALES'] = {f'suc{n}': {'nombre': db, 'MYSQL_DB': db} for n, db in enumerate(args.db)}
+    fallos = []
+
+    antes = {sucursal: contar_comandas(sucursal) for sucursal in config['SUCURSALES']}
+    for sucursal in config['SUCURSALES']:
+        cliente = aplicacion.app.test_client()
+        respuesta = cliente.post('/login', data={'usuario': 'admin_bench', 'password': PASSWORD,
+                                                 'sucursal': sucursal})
+        with cliente.session_transaction() as sesion:
+            if sesion.get('sucursal') != sucursal:
+                fallos.append(f'login en {sucursal}: la sesión quedó en {sesion.get("sucursal")}')
+                continue
+        item, mesa_id = primer_item(sucursal)
+        precio = float(item['precio'])
+        respuesta = cliente.post('/api/comandas', json={
+            'mesa_id': mesa_id,
+            'total': precio,
+            'items': [{'id': item['id'], 'cantidad': 1, 'precio': precio, 'total': precio}]
+        })
+        if respuesta.status_code != 200:
+            fallos.append(f'{sucursal}: no se pudo guardar la comanda: {respuesta.get_json()}')
+    # El acumulado de ventas va en segundo plano
+    time.sleep(1)
+
+    for sucursal, n in antes.items():
+        despues = contar_comandas(sucursal)
+        print(f'  {sucursal} ({config["SUCURSALES"][sucursal]["MYSQL_DB"]}): {n} -> {despues} comandas')
+        if despues != n + 1:
+            fallos.append(f'{sucursal}: se esperaba exactamente una comanda nueva, hay {despues - n}')
+
+    catalogos = {sucursal: aplicacion.catalogo.para(sucursal) for sucursal in config['SUCURSALES']}
+    if len({id(c) for c in catalogos.values()}) != len(catalogos):
+        fallos.append('las sucursales comparten caché del catálogo')
+
+    with aplicacion.app.app_context():
+        inicio = time.perf_counter()
+        por_sucursal = sucursales.en_paralelo(lambda: aplicacion._ventas_por_item('', []),
+                                              config['SUCURSALES'], contexto=aplicacion.app.app_context)
+        conjunto = aplicacion._sumar_ventas_por_item(por_sucursal.values())
+        print(f'  Informe conjunto: {len(conjunto)} ítems de {len(por_sucursal)} sucursales '
+              f'en {(time.perf_counter() - inicio) * 1000:.1f} ms')
+        total = sum((fila['total'] for fila in conjunto), Decimal('0'))
+        esperado = Decimal('0')
+        for sucursal in config['SUCURSALES']:
+            with sucursales.en(sucursal):
+                esperado += sum((fila['total'] for fila in aplicacion._ventas_por_item('', [])), Decimal('0'))
+        if total != esperado:
+            fallos.append(f'el informe conjunto suma {total}, las sucursales por separado {esperado}')
+
+    if fallos:
+        print('FALLO: ' + '; '.join(fallos))
+        sys.exit(1)
+    print('OK: enrutado por sucursal correcto')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import threading
+import time
+
+
+class CatalogCache:
+    # Snapshot en memoria del menú (grupos + items) y su JSON ya serializado.
+    # invalidar() sube la versión; la siguiente lectura reconstruye una sola
+    # vez aunque lleguen muchas peticiones a la vez. El TTL es una red de
+    # seguridad por si algún cambio no pasa por invalidar().
+
+    def __init__(self, loader, ttl=300):
+        self._loader = loader
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._version_lock = threading.Lock()
+        self._version = 0
+        # (snapshot, version, cargado_en) se sustituye de una vez
+        self._entry = None
+        self.rebuilds = 0
+
+    @property
+    def version(self):
+        return self._version
+
+    def _fresh(self):
+        entry = self._entry
+        if (entry is not None and entry[1] == self._version
+                and time.monotonic() - entry[2] < self.ttl):
+            return entry[0]
+        return None
+
+    def actual(self):
+        # Snapshot vigente o None, sin reconstruir ni bloquear
+        return self._fresh()
+
+    def get(self):
+        snapshot = self._fresh()
+        if snapshot is not None:
+            return snapshot
+
+        with self._lock:
+            # Otro hilo pudo reconstruir mientras esperábamos el lock
+            snapshot = self._fresh()
+            if snapshot is not None:
+                return snapshot
+            version = self._version
+            snapshot = self._loader()
+            snapshot['version'] = version
+            self._entry = (snapshot, version, time.monotonic())
+            self.rebuilds += 1
+            return snapshot
+
+    def invalidar(self):
+        with self._version_lock:
+            self._version += 1
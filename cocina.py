@@ -0,0 +1,72 @@
+import itertools
+import threading
+
+
+class ColasCocina:
+    # Colas en memoria de líneas de comanda por estación (bar, parrilla...).
+    # La fuente de verdad es la tabla cocina_linea: las líneas se insertan
+    # en la misma transacción que la comanda y aquí solo se reflejan tras
+    # el commit, así las pantallas leen sin consultar la base de datos.
+    # Tras reiniciar el proceso se recargan las pendientes con cargar().
+    #
+    # Orden: mayor prioridad primero y, a igual prioridad, FIFO.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._estaciones = {}
+        self._lineas = {}
+        self._seq = itertools.count()
+        self.cargada = False
+
+    def _poner(self, linea):
+        linea = dict(linea)
+        linea['_seq'] = next(self._seq)
+        self._lineas[linea['id']] = linea
+        self._estaciones.setdefault(linea['estacion'], {})[linea['id']] = linea
+
+    def cargar(self, lineas):
+        with self._lock:
+            self._estaciones.clear()
+            self._lineas.clear()
+            for linea in lineas:
+                self._poner(linea)
+            self.cargada = True
+
+    def agregar(self, lineas):
+        with self._lock:
+            for linea in lineas:
+                self._poner(linea)
+
+    def pendientes(self, estacion):
+        with self._lock:
+            lineas = list(self._estaciones.get(estacion, {}).values())
+        lineas.sort(key=lambda l: (-l['prioridad'], l['_seq']))
+        return [{k: v for k, v in l.items() if k != '_seq'} for l in lineas]
+
+    def estaciones(self):
+        with self._lock:
+            return {estacion: len(lineas) for estacion, lineas in self._estaciones.items()}
+
+    def obtener(self, linea_id):
+        with self._lock:
+            return self._lineas.get(linea_id)
+
+    def subir_prioridad(self, linea_id):
+        with self._lock:
+            linea = self._lineas.get(linea_id)
+            if linea is None:
+                return None
+            linea['prioridad'] += 1
+            return linea['prioridad']
+
+    def completar(self, linea_id):
+        with self._lock:
+            linea = self._lineas.pop(linea_id, None)
+            if linea is not None:
+                self._estaciones[linea['estacion']].pop(linea_id, None)
+            return linea
+
+
+def estacion_de(estaciones, grupo_codigo, formato, defecto='cocina'):
+    # Estación configurada para el grupo, si no el formato del grupo
+    return estaciones.get(grupo_codigo) or formato or defecto
@@ -0,0 +1,396 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal
+
+try:
+    import fcntl
+except ImportError:  # Sin fcntl (Windows) no se comprueba el proceso único
+    fcntl = None
+
+
+class NoEncontrado(Exception):
+    pass
+
+
+class ExistenciaInsuficiente(Exception):
+    pass
+
+
+class Cuenta:
+    __slots__ = ('mesa', 'comanda_id', 'usuario_id', 'abierta', 'lineas', 'total', 'completa')
+
+    def __init__(self, mesa, comanda_id, usuario_id, abierta=None):
+        self.mesa = mesa
+        self.comanda_id = comanda_id
+        self.usuario_id = usuario_id
+        # Hora del primer ítem (fecha de la comanda si ya está en la base)
+        self.abierta = abierta
+        # item_id -> [cantidad, precio, nombre], en orden de llegada
+        self.lineas = {}
+        self.total = Decimal('0')
+        # False si solo se conocen las líneas recuperadas del diario
+        self.completa = True
+
+
+class CuentasAbiertas:
+    # Cuentas abiertas por mesa en memoria con escritura diferida
+    # (write-behind). Cada toque se aplica en memoria y se anota en un
+    # diario local de solo-añadir con el estado absoluto de la línea
+    # (cantidad y precio), así repetirlo es idempotente. Un hilo vuelca las
+    # líneas pendientes a la base en lotes (cada `intervalo` segundos o al
+    # llegar a `lote`) y después reescribe el diario solo con lo que siga
+    # pendiente. Al arrancar se reproduce el diario; al cerrar una cuenta o
+    # detener el proceso se vuelca todo.
+    #
+    # Callbacks (los pone quien la usa, con su acceso a la base):
+    #   cargar_mesa(mesa_id) -> {'mesa': {...}, 'comanda_id', 'usuario_id',
+    #       'abierta', 'lineas': [(item_id, cantidad, precio, nombre), ...]} o None
+    #   cargar_item(item_id) -> (nombre, precio, existencia) o None
+    #   volcar(cambios) -> {mesa_id: comanda_id}; cambios es una lista de
+    #       {'mesa_id', 'comanda_id', 'usuario_id', 'lineas': {item_id: (cantidad, precio)}}
+    #       y debe escribir cantidades absolutas en una sola transacción,
+    #       descontando de la existencia (y sumando a las ventas) solo la
+    #       diferencia con lo ya volcado.
+    #
+    # Un toque se rechaza (ExistenciaInsuficiente) si la existencia leída
+    # menos las unidades tocadas y aún no volcadas no llega a 1.
+    #
+    # Solo este proceso debe escribir las comandas pendientes de estas
+    # mesas mientras tenga la cuenta abierta: abrir() bloquea el diario con
+    # flock y falla si otro proceso ya lo tiene (un solo worker).
+
+    def __init__(self, ruta, cargar_mesa, cargar_item, volcar,
+                 lote=200, intervalo=2.0, fsync=False, ttl_items=300):
+        self.ruta = ruta
+        self._cargar_mesa = cargar_mesa
+        self._cargar_item = cargar_item
+        self._volcar = volcar
+        self.lote = lote
+        self.intervalo = intervalo
+        # Sin fsync el diario sobrevive a la caída del proceso, no a la del
+        # sistema operativo; con fsync cada toque cuesta una escritura a disco
+        self.fsync = fsync
+        self.ttl_items = ttl_items
+
+        self._lock = threading.Lock()
+        self._hay_pendientes = threading.Condition(self._lock)
+        self._volcado = threading.Lock()
+        self._cuentas = {}
+        self._items = {}
+        # Se incrementa al volcar (u olvidar ítems): una existencia leída
+        # antes ya no vale
+        self._generacion = 0
+        # item_id -> unidades tocadas aún no descontadas en la base, y las
+        # del volcado en curso
+        self._reservado = {}
+        self._en_vuelo = {}
+        # mesa_id -> set(item_id) aún no volcados
+        self._sucias = {}
+        self._pendientes = 0
+        self._diario = None
+        self._bloqueo = None
+        self._contexto = None
+        self._hilo = None
+        self._parar = False
+        self.volcados = 0
+        self.errores = 0
+
+    # Arranque y parada
+
+    def abrir(self, contexto=None):
+        # Reproduce el diario y arranca el hilo de volcado. contexto() debe
+        # devolver un context manager (p. ej. app.app_context) si los
+        # callbacks lo necesitan fuera de una petición.
+        self._contexto = contexto
+        self._bloquear()
+        with self._lock:
+            self._reproducir()
+            self._diario = open(self.ruta, 'a', encoding='utf-8')
+        self._hilo = threading.Thread(target=self._bucle, name='cuentas-volcado', daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        with self._lock:
+            self._parar = True
+            self._hay_pendientes.notify()
+        if self._hilo is not None:
+            self._hilo.join()
+        self._volcar_con_contexto()
+        with self._lock:
+            if self._diario is not None:
+                self._diario.close()
+                self._diario = None
+        if self._bloqueo is not None:
+            self._bloqueo.close()
+            self._bloqueo = None
+
+    def _bloquear(self):
+        # Dos procesos con el mismo diario se pisarían las cuentas y, al
+        # reproducirlo, volcarían las del otro
+        if fcntl is None:
+            return
+        bloqueo = open(self.ruta + '.lock', 'w')
+        try:
+            fcntl.flock(bloqueo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            bloqueo.close()
+            raise RuntimeError(f'{self.ruta} lo tiene abierto otro proceso: las cuentas en '
+                               f'memoria necesitan un solo worker')
+        self._bloqueo = bloqueo
+
+    def _reproducir(self):
+        if not os.path.exists(self.ruta):
+            return
+        with open(self.ruta, encoding='utf-8') as diario:
+            for linea in diario:
+                try:
+                    r = json.loads(linea)
+                except ValueError:
+                    # Última línea a medio escribir si el proceso murió
+                    continue
+                cuenta = self._cuentas.get(r['m'])
+                if cuenta is None:
+                    abierta = datetime.fromisoformat(r['a']) if r.get('a') else None
+                    cuenta = self._cuentas[r['m']] = Cuenta(None, r['c'], r['u'], abierta)
+                    cuenta.completa = False
+                if r['c'] is not None:
+                    cuenta.comanda_id = r['c']
+                cuenta.lineas[r['i']] = [r['n'], Decimal(r['p']), r['d']]
+                self._marcar(r['m'], r['i'])
+
+    # Toques y lecturas
+
+    def agregar(self, mesa_id, item_id, usuario_id):
+        # Suma una unidad del ítem a la cuenta de la mesa. Solo toca la base
+        # la primera vez que se ve la mesa o el ítem.
+        nombre, precio, existencia = self._item(item_id)
+        while True:
+            cuenta = self._cuenta(mesa_id, usuario_id)
+            with self._lock:
+                # cerrar() pudo sacarla de memoria entre tanto
+                if self._cuentas.get(mesa_id) is cuenta:
+                    quedan = (existencia - self._reservado.get(item_id, 0)
+                              - self._en_vuelo.get(item_id, 0))
+                    if quedan < 1:
+                        raise ExistenciaInsuficiente(
+                            f'Sin existencia suficiente: {nombre} (quedan {max(quedan, 0)})')
+                    self._reservado[item_id] = self._reservado.get(item_id, 0) + 1
+                    self._aplicar(mesa_id, cuenta, item_id, nombre, precio, usuario_id)
+                    return
+
+    def _aplicar(self, mesa_id, cuenta, item_id, nombre, precio, usuario_id):
+        # Con self._lock tomado
+        if cuenta.usuario_id is None:
+            cuenta.usuario_id = usuario_id
+        if cuenta.abierta is None:
+            cuenta.abierta = datetime.now().replace(microsecond=0)
+        if cuenta.mesa is not None:
+            # Como hará el volcado al abrir la comanda
+            cuenta.mesa['estatus'] = 'ocupada'
+        linea = cuenta.lineas.get(item_id)
+        if linea is None:
+            linea = cuenta.lineas[item_id] = [0, precio, nombre]
+        linea[0] += 1
+        cuenta.total += linea[1]
+        self._anotar(mesa_id, cuenta, item_id, linea)
+        self._marcar(mesa_id, item_id)
+        if self._pendientes >= self.lote:
+            self._hay_pendientes.notify()
+
+    def ver(self, mesa_id):
+        # Copia de la cuenta: {'mesa', 'comanda_id', 'total', 'lineas':
+        # [(item_id, nombre, cantidad, precio), ...]}
+        cuenta = self._cuenta(mesa_id)
+        with self._lock:
+            return {
+                'mesa': dict(cuenta.mesa),
+                'comanda_id': cuenta.comanda_id,
+                'total': cuenta.total,
+                'lineas': [(item_id, nombre, cantidad, precio)
+                           for item_id, (cantidad, precio, nombre) in cuenta.lineas.items()]
+            }
+
+    def mesas(self):
+        # Cuentas con ítems en memoria: {mesa_id: {'comanda_id', 'lineas',
+        # 'total', 'abierta'}}. Las recuperadas del diario que aún no se han
+        # combinado con la base no se incluyen.
+        with self._lock:
+            return {mesa_id: {
+                'comanda_id': cuenta.comanda_id,
+                'lineas': len(cuenta.lineas),
+                'total': cuenta.total,
+                'abierta': cuenta.abierta
+            } for mesa_id, cuenta in self._cuentas.items() if cuenta.completa and cuenta.lineas}
+
+    def cerrar(self, mesa_id):
+        # Vuelca lo pendiente y saca la cuenta de memoria
+        self.volcar()
+        with self._lock:
+            if mesa_id not in self._sucias:
+                self._cuentas.pop(mesa_id, None)
+
+    def olvidar_items(self, item_ids=None):
+        # Para quien escriba en item fuera de estas cuentas (pedidos de
+        # /api/comandas, ediciones del manager): el próximo toque relee
+        # existencia y precio. None = todos. Las lecturas en curso, hechas
+        # quizá antes de ese cambio, se repiten como tras un volcado.
+        with self._lock:
+            if item_ids is None:
+                self._items.clear()
+            else:
+                for item_id in item_ids:
+                    self._items.pop(item_id, None)
+            self._generacion += 1
+
+    def _item(self, item_id):
+        # (nombre, precio, existencia) con caché de ttl_items segundos
+        while True:
+            entrada = self._items.get(item_id)
+            if entrada is not None and time.monotonic() - entrada[3] <= self.ttl_items:
+                return entrada[:3]
+            generacion = self._generacion
+            datos = self._cargar_item(item_id)
+            if datos is None:
+                raise NoEncontrado('Ítem no encontrado')
+            entrada = (datos[0], Decimal(datos[1]), datos[2], time.monotonic())
+            with self._lock:
+                # Si se volcó mientras tanto la existencia leída puede no
+                # incluir lo volcado (y ya no está en _en_vuelo): se relee
+                if self._generacion == generacion:
+                    self._items[item_id] = entrada
+                    return entrada[:3]
+
+    def _cuenta(self, mesa_id, usuario_id=None):
+        cuenta = self._cuentas.get(mesa_id)
+        if cuenta is not None and cuenta.completa:
+            return cuenta
+
+        # Primera vez que se ve la mesa (o recuperada del diario): se lee
+        # de la base fuera del lock y se combina con lo que haya en memoria
+        datos = self._cargar_mesa(mesa_id)
+        if datos is None:
+            raise NoEncontrado('Mesa no encontrada')
+        with self._lock:
+            cuenta = self._cuentas.get(mesa_id)
+            if cuenta is not None and cuenta.completa:
+                return cuenta
+            nueva = Cuenta(datos['mesa'], datos['comanda_id'], datos['usuario_id'] or usuario_id,
+                           datos['abierta'])
+            for item_id, cantidad, precio, nombre in datos['lineas']:
+                nueva.lineas[item_id] = [cantidad, Decimal(precio), nombre]
+            if cuenta is not None:
+                # Las líneas del diario son posteriores a lo volcado
+                nueva.comanda_id = cuenta.comanda_id or nueva.comanda_id
+                nueva.usuario_id = cuenta.usuario_id or nueva.usuario_id
+                nueva.abierta = nueva.abierta or cuenta.abierta
+                nueva.lineas.update(cuenta.lineas)
+            nueva.total = sum((cantidad * precio for cantidad, precio, _ in nueva.lineas.values()),
+                              Decimal('0'))
+            self._cuentas[mesa_id] = nueva
+            return nueva
+
+    # Diario
+
+    def _anotar(self, mesa_id, cuenta, item_id, linea):
+        self._diario.write(json.dumps({
+            'm': mesa_id, 'c': cuenta.comanda_id, 'u': cuenta.usuario_id,
+            'a': cuenta.abierta.isoformat() if cuenta.abierta else None,
+            'i': item_id, 'n': linea[0], 'p': str(linea[1]), 'd': linea[2]
+        }) + '\n')
+        self._diario.flush()
+        if self.fsync:
+            os.fsync(self._diario.fileno())
+
+    def _marcar(self, mesa_id, item_id):
+        sucias = self._sucias.setdefault(mesa_id, set())
+        if item_id not in sucias:
+            sucias.add(item_id)
+            self._pendientes += 1
+
+    def _rotar(self):
+        # Reescribe el diario con el estado de las líneas aún pendientes
+        temporal = self.ruta + '.tmp'
+        with open(temporal, 'w', encoding='utf-8') as nuevo:
+            for mesa_id, items in self._sucias.items():
+                cuenta = self._cuentas[mesa_id]
+                for item_id in items:
+                    cantidad, precio, nombre = cuenta.lineas[item_id]
+                    nuevo.write(json.dumps({
+                        'm': mesa_id, 'c': cuenta.comanda_id, 'u': cuenta.usuario_id,
+                        'a': cuenta.abierta.isoformat() if cuenta.abierta else None,
+                        'i': item_id, 'n': cantidad, 'p': str(precio), 'd': nombre
+                    }) + '\n')
+            nuevo.flush()
+            os.fsync(nuevo.fileno())
+        self._diario.close()
+        os.replace(temporal, self.ruta)
+        self._diario = open(self.ruta, 'a', encoding='utf-8')
+
+    # Volcado
+
+    def volcar(self):
+        # Escribe en la base todas las líneas pendientes. Devuelve cuántas
+        # se volcaron; si falla quedan pendientes para el siguiente intento.
+        with self._volcado:
+            with self._lock:
+                sucias, self._sucias, self._pendientes = self._sucias, {}, 0
+                self._en_vuelo, self._reservado = self._reservado, {}
+                cambios = [{
+                    'mesa_id': mesa_id,
+                    'comanda_id': self._cuentas[mesa_id].comanda_id,
+                    'usuario_id': self._cuentas[mesa_id].usuario_id,
+                    'lineas': {item_id: tuple(self._cuentas[mesa_id].lineas[item_id][:2])
+                               for item_id in items}
+                } for mesa_id, items in sucias.items()]
+            if not cambios:
+                return 0
+
+            try:
+                ids = self._volcar(cambios)
+            except Exception:
+                with self._lock:
+                    self.errores += 1
+                    for mesa_id, items in sucias.items():
+                        for item_id in items:
+                            self._marcar(mesa_id, item_id)
+                    for item_id, unidades in self._en_vuelo.items():
+                        self._reservado[item_id] = self._reservado.get(item_id, 0) + unidades
+                    self._en_vuelo = {}
+                raise
+
+            with self._lock:
+                for mesa_id, comanda_id in ids.items():
+                    cuenta = self._cuentas.get(mesa_id)
+                    if cuenta is not None:
+                        cuenta.comanda_id = comanda_id
+                # La existencia de la base ya descuenta lo volcado
+                for item_id in self._en_vuelo:
+                    self._items.pop(item_id, None)
+                self._en_vuelo = {}
+                self._generacion += 1
+                self._rotar()
+                volcadas = sum(len(items) for items in sucias.values())
+                self.volcados += volcadas
+                return volcadas
+
+    def _volcar_con_contexto(self):
+        if self._contexto is None:
+            return self.volcar()
+        with self._contexto():
+            return self.volcar()
+
+    def _bucle(self):
+        while True:
+            with self._lock:
+                if not self._parar and self._pendientes < self.lote:
+                    self._hay_pendientes.wait(self.intervalo)
+                if self._parar:
+                    return
+            try:
+                self._volcar_con_contexto()
+            except Exception:
+                # Se reintenta en la siguiente vuelta; el diario conserva los toques
+                time.sleep(self.intervalo)
@@ -0,0 +1,231 @@
+import threading
+import time
+from collections import deque
+
+from pymysql.constants import SERVER_STATUS
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ErrorTrasCommit(Exception):
+    # Falló alguna función de al_confirmar(); la transacción sí se confirmó
+    def __init__(self, errores):
+        super().__init__('; '.join(f'{type(e).__name__}: {e}' for e in errores))
+        self.errores = errores
+
+
+class PooledConnection:
+    # Envoltorio de una conexión del pool: close() la devuelve al pool en
+    # lugar de cerrar el socket, así las rutas no cambian.
+    # al_confirmar() registra funciones que se llaman tras el próximo
+    # commit(); rollback() o close() sin commit las descartan.
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self._closed = False
+        self._al_confirmar = []
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def al_confirmar(self, funcion, *args):
+        self._al_confirmar.append((funcion, args))
+
+    def commit(self):
+        self._raw.commit()
+        # El commit ya está hecho: que falle un efecto no afecta a los demás
+        pendientes, self._al_confirmar = self._al_confirmar, []
+        errores = []
+        for funcion, args in pendientes:
+            try:
+                funcion(*args)
+            except Exception as e:
+                errores.append(e)
+        if errores:
+            raise ErrorTrasCommit(errores)
+
+    def rollback(self):
+        self._al_confirmar = []
+        self._raw.rollback()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._al_confirmar = []
+        self._pool._release(self._raw)
+
+
+class ConnectionPool:
+    # Pool acotado y seguro entre hilos de conexiones pymysql.
+    #   min_size: conexiones que se abren al crear el pool
+    #   max_size: máximo de conexiones abiertas (libres + prestadas)
+    #   timeout: segundos a esperar una conexión libre; None espera
+    #            indefinidamente y 0 falla de inmediato (PoolTimeout)
+    #   recycle: segundos de vida máxima de una conexión
+    #   ping_interval: si la conexión lleva más de estos segundos ociosa se
+    #                  verifica con ping() antes de prestarla
+
+    def __init__(self, connect, min_size=1, max_size=10, timeout=None,
+                 recycle=3600, ping_interval=5):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError('Tamaños de pool inválidos')
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_interval = ping_interval
+
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        # Conexiones libres: (conexion, creada_en, ultimo_uso)
+        self._idle = deque()
+        self._created = {}
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+
+        self._stats = {
+            'prestamos': 0,
+            'esperas': 0,
+            'tiempo_espera_total': 0.0,
+            'tiempo_espera_max': 0.0,
+            'timeouts': 0,
+            'conexiones_creadas': 0,
+            'conexiones_recicladas': 0,
+            'conexiones_fallidas': 0,
+        }
+
+        for _ in range(min_size):
+            raw = self._open()
+            self._idle.append((raw, self._created[id(raw)], time.monotonic()))
+            self._size += 1
+
+    def _open(self):
+        raw = self._connect()
+        self._created[id(raw)] = time.monotonic()
+        with self._lock:
+            self._stats['conexiones_creadas'] += 1
+        return raw
+
+    def _discard(self, raw):
+        self._created.pop(id(raw), None)
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def get(self, timeout=-1):
+        # Devuelve (conexion, segundos_esperados). timeout=-1 usa el del pool.
+        if timeout == -1:
+            timeout = self.timeout
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+
+        with self._cond:
+            while not self._idle and self._size >= self.max_size:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(
+                        f'No hay conexiones libres ({self.max_size} en uso)')
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+            entry = self._idle.pop() if self._idle else None
+            # Reservamos el hueco antes de soltar el lock para no pasar de max_size
+            if entry is None:
+                self._size += 1
+            self._in_use += 1
+
+        waited = time.monotonic() - start
+        try:
+            raw = self._checkout(entry)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._in_use -= 1
+                self._stats['conexiones_fallidas'] += 1
+                self._cond.notify()
+            raise
+
+        with self._lock:
+            self._stats['prestamos'] += 1
+            if waited > 0.001:
+                self._stats['esperas'] += 1
+            self._stats['tiempo_espera_total'] += waited
+            self._stats['tiempo_espera_max'] = max(self._stats['tiempo_espera_max'], waited)
+        return PooledConnection(self, raw), waited
+
+    def _checkout(self, entry):
+        if entry is None:
+            return self._open()
+
+        raw, created, last_used = entry
+        now = time.monotonic()
+        if self.recycle is not None and now - created > self.recycle:
+            self._discard(raw)
+            with self._lock:
+                self._stats['conexiones_recicladas'] += 1
+            return self._open()
+        if self.ping_interval is not None and now - last_used > self.ping_interval:
+            try:
+                raw.ping(reconnect=False)
+            except Exception:
+                self._discard(raw)
+                return self._open()
+        return raw
+
+    def _release(self, raw):
+        healthy = raw.open
+        if healthy and raw.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+            # Transacción sin cerrar: se descarta para no filtrarla al siguiente
+            try:
+                raw.rollback()
+            except Exception:
+                healthy = False
+
+        with self._cond:
+            self._in_use -= 1
+            if healthy:
+                self._idle.append((raw, self._created.get(id(raw), time.monotonic()),
+                                   time.monotonic()))
+            else:
+                self._size -= 1
+                self._discard(raw)
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            while self._idle:
+                raw, _, _ = self._idle.popleft()
+                self._size -= 1
+                self._discard(raw)
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data.update({
+                'min': self.min_size,
+                'max': self.max_size,
+                'abiertas': self._size,
+                'en_uso': self._in_use,
+                'libres': len(self._idle),
+                'esperando': self._waiting,
+            })
+        prestamos = data['prestamos'] or 1
+        data['tiempo_espera_medio'] = data['tiempo_espera_total'] / prestamos
+        return data
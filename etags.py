@@ -0,0 +1,49 @@
+import hashlib
+import threading
+import time
+from datetime import datetime, timezone
+
+
+class RegistroETag:
+    # ETag fuerte (hash del JSON enviado) y Last-Modified de cada recurso de
+    # la API, validados con un contador de versión por grupo ('items',
+    # 'usuarios') que los endpoints de escritura suben con invalidar().
+    # Mientras la versión no cambie, un If-None-Match que coincide se
+    # contesta con 304 sin ir a la base de datos. El TTL acota cuánto puede
+    # tardar en verse un cambio hecho por otro proceso.
+
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._versiones = {}
+        # clave -> (etag, modificado, version, verificado_en)
+        self._entradas = {}
+
+    def version(self, grupo):
+        return self._versiones.get(grupo, 0)
+
+    def invalidar(self, *grupos):
+        with self._lock:
+            for grupo in grupos:
+                self._versiones[grupo] = self._versiones.get(grupo, 0) + 1
+
+    def vigente(self, clave, grupo):
+        # (etag, modificado) si sigue valiendo sin consultar la base, o None
+        entrada = self._entradas.get(clave)
+        if (entrada is not None and entrada[2] == self.version(grupo)
+                and time.monotonic() - entrada[3] < self.ttl):
+            return entrada[0], entrada[1]
+        return None
+
+    def registrar(self, clave, version, cuerpo):
+        # version es la leída antes de consultar: si alguien invalidó
+        # mientras tanto, la entrada nace caducada
+        etag = hashlib.sha1(cuerpo).hexdigest()
+        with self._lock:
+            anterior = self._entradas.get(clave)
+            if anterior is not None and anterior[0] == etag:
+                modificado = anterior[1]
+            else:
+                modificado = datetime.now(timezone.utc).replace(microsecond=0)
+            self._entradas[clave] = (etag, modificado, version, time.monotonic())
+        return etag, modificado
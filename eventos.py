@@ -0,0 +1,143 @@
+import asyncio
+import itertools
+import queue
+import threading
+from collections import deque
+
+import serializacion
+
+
+class Suscripcion:
+
+    def __init__(self, broker, canales, maxsize):
+        self._broker = broker
+        self.canales = frozenset(canales)
+        self.cola = queue.Queue(maxsize)
+        # Si el cliente no consume a tiempo se le desconecta; al reconectar
+        # con Last-Event-ID recupera lo que siga en el historial.
+        self.desbordada = False
+        # Lo fija stream_sse_async para que publicar() despierte al bucle
+        # de eventos en vez de tener un hilo esperando en la cola
+        self.al_publicar = None
+
+    def siguiente(self, timeout):
+        try:
+            return self.cola.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def cerrar(self):
+        self._broker._quitar(self)
+
+
+class Broker:
+    # Pub/sub en proceso para los eventos en vivo (estado de mesas, nuevas
+    # comandas...). Cada suscriptor es solo una cola en memoria: no usa
+    # conexión a la base de datos. publicar() nunca bloquea a quien publica.
+
+    def __init__(self, maxsize=100, historial=500):
+        self._lock = threading.Lock()
+        self._suscripciones = set()
+        self._ids = itertools.count(1)
+        self._maxsize = maxsize
+        self._historial = deque(maxlen=historial)
+
+    def suscribir(self, canales, desde_id=None):
+        sub = Suscripcion(self, canales, self._maxsize)
+        with self._lock:
+            if desde_id is not None:
+                for evento in self._historial:
+                    if evento[0] > desde_id and evento[1] in sub.canales:
+                        try:
+                            sub.cola.put_nowait(evento)
+                        except queue.Full:
+                            break
+            self._suscripciones.add(sub)
+        return sub
+
+    def _quitar(self, sub):
+        with self._lock:
+            self._suscripciones.discard(sub)
+
+    def publicar(self, canal, tipo, datos):
+        # Misma serialización que las respuestas de la API (orjson si está),
+        # hecha fuera del lock
+        datos = serializacion.dumps(datos)
+        avisar = []
+        with self._lock:
+            evento = (next(self._ids), canal, tipo, datos)
+            self._historial.append(evento)
+            for sub in list(self._suscripciones):
+                if canal not in sub.canales:
+                    continue
+                try:
+                    sub.cola.put_nowait(evento)
+                except queue.Full:
+                    sub.desbordada = True
+                    self._suscripciones.discard(sub)
+                if sub.al_publicar is not None:
+                    avisar.append(sub.al_publicar)
+        for al_publicar in avisar:
+            al_publicar()
+        return evento[0]
+
+    @property
+    def suscriptores(self):
+        return len(self._suscripciones)
+
+
+def formato_sse(evento):
+    evento_id, _, tipo, datos = evento
+    return f"id: {evento_id}\nevent: {tipo}\ndata: {datos}\n\n"
+
+
+def stream_sse(sub, heartbeat=15):
+    # Generador para la respuesta text/event-stream. Los comentarios de
+    # heartbeat mantienen viva la conexión y detectan clientes caídos.
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            evento = sub.siguiente(0 if sub.desbordada else heartbeat)
+            if evento is None:
+                if sub.desbordada:
+                    return
+                yield ": ping\n\n"
+            else:
+                yield formato_sse(evento)
+    finally:
+        sub.cerrar()
+
+
+async def stream_sse_async(sub, heartbeat=15):
+    # Igual que stream_sse pero para servidores ASGI (ver asgi.py): cada
+    # cliente ocioso es una tarea esperando un asyncio.Event, no un hilo
+    loop = asyncio.get_running_loop()
+    hay_eventos = asyncio.Event()
+
+    def avisar():
+        try:
+            loop.call_soon_threadsafe(hay_eventos.set)
+        except RuntimeError:
+            # El bucle ya se cerró
+            pass
+
+    sub.al_publicar = avisar
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            # Limpiar antes de mirar la cola: lo que se publique después
+            # vuelve a marcar el evento
+            hay_eventos.clear()
+            evento = sub.siguiente(0)
+            if evento is not None:
+                yield formato_sse(evento)
+                continue
+            if sub.desbordada:
+                return
+            try:
+                await asyncio.wait_for(hay_eventos.wait(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+    finally:
+        sub.al_publicar = None
+        sub.cerrar()
@@ -0,0 +1,42 @@
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+
+class CacheIdempotencia:
+    # Respuestas ya enviadas por clave de idempotencia (LRU acotada con
+    # TTL). Un reintento que acierta aquí no toca la base de datos; la tabla
+    # comanda_idempotencia es la copia durable y la que arbitra entre
+    # procesos. Los bloqueos por franjas serializan dentro del proceso las
+    # peticiones simultáneas con la misma clave.
+
+    def __init__(self, maximo=10000, ttl=24 * 3600, franjas=64):
+        self.maximo = maximo
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._datos = OrderedDict()
+        self._franjas = [threading.Lock() for _ in range(franjas)]
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            respuesta, guardada = entrada
+            if time.monotonic() - guardada > self.ttl:
+                del self._datos[clave]
+                return None
+            self._datos.move_to_end(clave)
+            return respuesta
+
+    def guardar(self, clave, respuesta):
+        with self._lock:
+            self._datos[clave] = (respuesta, time.monotonic())
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maximo:
+                self._datos.popitem(last=False)
+
+    def en_curso(self, clave):
+        # Lock de la franja de la clave (usar con with)
+        return self._franjas[zlib.crc32(repr(clave).encode()) % len(self._franjas)]
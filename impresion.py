@@ -0,0 +1,223 @@
+import base64
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import deque
+from itertools import count
+
+log = logging.getLogger(__name__)
+
+# Cola de impresión en segundo plano. Cada ticket se renderiza una vez a
+# bytes ESC/POS (y opcionalmente HTML), se guarda en un fichero del
+# directorio de la cola y lo envía el hilo de su impresora, con reintentos
+# y espera creciente. Al arrancar se recuperan los trabajos que quedaron
+# pendientes. Una impresora caída no retrasa a las demás.
+#
+# Destinos: tcp://host:9100 (impresora de red en modo raw) o
+# file:///ruta (añade los bytes al fichero; sirve de impresora de prueba).
+
+ESC_INIT = b'\x1b@'
+ESC_PC858 = b'\x1bt\x13'
+ESC_NEGRITA = b'\x1bE\x01'
+ESC_NORMAL = b'\x1bE\x00'
+ESC_DOBLE = b'\x1d!\x11'
+ESC_SENCILLO = b'\x1d!\x00'
+ESC_CENTRO = b'\x1ba\x01'
+ESC_IZQUIERDA = b'\x1ba\x00'
+ESC_CORTE = b'\x1dVB\x00'
+
+
+def _texto(texto):
+    return texto.encode('cp858', errors='replace')
+
+
+def ticket_escpos(titulo, cabecera, lineas, total=None, ancho=42, grande=False):
+    # lineas: (cantidad, nombre, importe o None). Los tickets de cocina van
+    # sin importes y con letra doble (grande=True, la mitad de columnas).
+    columnas = ancho // 2 if grande else ancho
+    partes = [ESC_INIT, ESC_PC858, ESC_CENTRO, ESC_DOBLE, ESC_NEGRITA, _texto(titulo + '\n'),
+              ESC_SENCILLO, ESC_NORMAL]
+    for texto in cabecera:
+        partes.append(_texto(texto + '\n'))
+    partes += [ESC_IZQUIERDA, _texto('-' * ancho + '\n')]
+    if grande:
+        partes.append(ESC_DOBLE)
+    for cantidad, nombre, importe in lineas:
+        if importe is None:
+            ancho_nombre = columnas - 4
+            partes.append(_texto(f'{cantidad:>3} {nombre[:ancho_nombre]}\n'))
+        else:
+            ancho_nombre = columnas - 14
+            partes.append(_texto(f'{cantidad:>3} {nombre[:ancho_nombre]:<{ancho_nombre}} {importe:>9.2f}\n'))
+    if grande:
+        partes.append(ESC_SENCILLO)
+    partes.append(_texto('-' * ancho + '\n'))
+    if total is not None:
+        partes += [ESC_NEGRITA, _texto(f"{'TOTAL':<{ancho - 12}}{total:>12.2f}\n"), ESC_NORMAL]
+    partes += [b'\n\n\n', ESC_CORTE]
+    return b''.join(partes)
+
+
+def enviar(destino, datos, timeout=5):
+    if destino.startswith('tcp://'):
+        host, _, puerto = destino[len('tcp://'):].rpartition(':')
+        with socket.create_connection((host, int(puerto)), timeout=timeout) as conexion:
+            conexion.sendall(datos)
+    elif destino.startswith('file://'):
+        with open(destino[len('file://'):], 'ab') as fichero:
+            fichero.write(datos)
+            fichero.flush()
+            os.fsync(fichero.fileno())
+    else:
+        raise ValueError(f'Destino de impresora no soportado: {destino}')
+
+
+class _Impresora:
+
+    def __init__(self, nombre, destino):
+        self.nombre = nombre
+        self.destino = destino
+        self.trabajos = deque()
+        self.hay_trabajo = threading.Condition()
+        self.hilo = None
+        self.impresos = 0
+        self.fallidos = 0
+        self.ultimo_error = None
+
+
+class ColaImpresion:
+
+    def __init__(self, directorio, impresoras, reintentos=5, espera=2.0, espera_max=60.0, timeout=5):
+        # impresoras: {nombre: destino}
+        self.directorio = directorio
+        self.pendientes = os.path.join(directorio, 'pendientes')
+        self.fallidos = os.path.join(directorio, 'fallidos')
+        self.reintentos = reintentos
+        self.espera = espera
+        self.espera_max = espera_max
+        self.timeout = timeout
+        self._impresoras = {nombre: _Impresora(nombre, destino) for nombre, destino in impresoras.items()}
+        self._secuencia = count()
+        self._parar = False
+
+    def abrir(self):
+        os.makedirs(self.pendientes, exist_ok=True)
+        os.makedirs(self.fallidos, exist_ok=True)
+        # Trabajos que quedaron sin imprimir en la ejecución anterior
+        for nombre in sorted(os.listdir(self.pendientes)):
+            if not nombre.endswith('.json'):
+                continue
+            with open(os.path.join(self.pendientes, nombre), encoding='utf-8') as fichero:
+                trabajo = json.load(fichero)
+            impresora = self._impresoras.get(trabajo['impresora'])
+            if impresora is None:
+                os.replace(os.path.join(self.pendientes, nombre), os.path.join(self.fallidos, nombre))
+                continue
+            trabajo['siguiente'] = 0
+            impresora.trabajos.append(trabajo)
+        for impresora in self._impresoras.values():
+            impresora.hilo = threading.Thread(target=self._bucle, args=(impresora,),
+                                              name=f'impresora-{impresora.nombre}', daemon=True)
+            impresora.hilo.start()
+
+    def detener(self):
+        # Los trabajos sin imprimir siguen en disco para el próximo arranque
+        self._parar = True
+        for impresora in self._impresoras.values():
+            with impresora.hay_trabajo:
+                impresora.hay_trabajo.notify()
+        for impresora in self._impresoras.values():
+            if impresora.hilo is not None:
+                impresora.hilo.join()
+
+    def encolar(self, impresora, datos, html=None, descripcion=''):
+        # Guarda el trabajo en disco y vuelve; lo imprime el hilo de la impresora
+        destino = self._impresoras.get(impresora)
+        if destino is None:
+            raise ValueError(f'Impresora desconocida: {impresora}')
+        trabajo = {
+            'id': f'{time.time_ns():020d}-{next(self._secuencia):06d}',
+            'impresora': impresora,
+            'descripcion': descripcion,
+            'creado': time.time(),
+            'intentos': 0,
+            'siguiente': 0,
+            'escpos': base64.b64encode(datos).decode('ascii'),
+            'html': html
+        }
+        self._guardar(trabajo)
+        with destino.hay_trabajo:
+            destino.trabajos.append(trabajo)
+            destino.hay_trabajo.notify()
+        return trabajo['id']
+
+    def estado(self):
+        return {nombre: {
+            'destino': impresora.destino,
+            'pendientes': len(impresora.trabajos),
+            'impresos': impresora.impresos,
+            'fallidos': impresora.fallidos,
+            'ultimo_error': impresora.ultimo_error
+        } for nombre, impresora in self._impresoras.items()}
+
+    def _ruta(self, trabajo):
+        return os.path.join(self.pendientes, trabajo['id'] + '.json')
+
+    def _guardar(self, trabajo):
+        ruta = self._ruta(trabajo)
+        with open(ruta + '.tmp', 'w', encoding='utf-8') as fichero:
+            json.dump(trabajo, fichero)
+            fichero.flush()
+            os.fsync(fichero.fileno())
+        os.replace(ruta + '.tmp', ruta)
+
+    def _bucle(self, impresora):
+        while True:
+            with impresora.hay_trabajo:
+                while not self._parar:
+                    if impresora.trabajos:
+                        # En orden: si el primero está esperando, esperan todos
+                        pausa = impresora.trabajos[0]['siguiente'] - time.time()
+                        if pausa <= 0:
+                            break
+                        impresora.hay_trabajo.wait(pausa)
+                    else:
+                        impresora.hay_trabajo.wait()
+                if self._parar:
+                    return
+                trabajo = impresora.trabajos[0]
+
+            try:
+                enviar(impresora.destino, base64.b64decode(trabajo['escpos']), self.timeout)
+            except Exception as e:
+                impresora.ultimo_error = f'{type(e).__name__}: {e}'
+                trabajo['intentos'] += 1
+                espera = min(self.espera * 2 ** (trabajo['intentos'] - 1), self.espera_max)
+                trabajo['siguiente'] = time.time() + espera
+                try:
+                    if trabajo['intentos'] >= self.reintentos:
+                        os.replace(self._ruta(trabajo), os.path.join(self.fallidos, trabajo['id'] + '.json'))
+                        impresora.fallidos += 1
+                        with impresora.hay_trabajo:
+                            impresora.trabajos.popleft()
+                    else:
+                        self._guardar(trabajo)
+                except Exception:
+                    # Disco lleno, permisos...: el trabajo sigue en memoria y
+                    # se reintenta tras la espera; el hilo no debe morir
+                    log.exception('Impresora %s: no se pudo guardar el trabajo %s',
+                                  impresora.nombre, trabajo['id'])
+                continue
+
+            impresora.impresos += 1
+            with impresora.hay_trabajo:
+                impresora.trabajos.popleft()
+            try:
+                os.remove(self._ruta(trabajo))
+            except Exception:
+                # Ya está impreso: si el fichero queda se reimprimirá al arrancar
+                log.exception('Impresora %s: no se pudo borrar el trabajo impreso %s',
+                              impresora.nombre, trabajo['id'])
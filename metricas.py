@@ -0,0 +1,133 @@
+import bisect
+import threading
+import time
+
+from flask import g, has_request_context
+from pymysql import cursors
+
+# Límites de los buckets de latencia en segundos
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _registrar_consulta(sql, segundos):
+    # Acumula en la petición actual; fuera de una petición (CLI, streams ya
+    # desacoplados de su petición) no se registra nada
+    if not has_request_context() or '_metricas' not in g:
+        return
+    datos = g._metricas
+    datos['consultas'] += 1
+    datos['tiempo_db'] += segundos
+    if datos['sql'] is not None:
+        datos['sql'].append((sql, segundos))
+
+
+class _Medido:
+    # executemany llama internamente a execute(): se mide solo el nivel
+    # exterior para no contar dos veces
+    _en_lote = False
+
+    def execute(self, query, args=None):
+        if self._en_lote:
+            return super().execute(query, args)
+        inicio = time.perf_counter()
+        try:
+            return super().execute(query, args)
+        finally:
+            _registrar_consulta(query, time.perf_counter() - inicio)
+
+    def executemany(self, query, args):
+        inicio = time.perf_counter()
+        self._en_lote = True
+        try:
+            return super().executemany(query, args)
+        finally:
+            self._en_lote = False
+            _registrar_consulta(query, time.perf_counter() - inicio)
+
+
+class CursorMedido(_Medido, cursors.DictCursor):
+    pass
+
+
+class SSCursorMedido(_Medido, cursors.SSDictCursor):
+    pass
+
+
+class CursorTuplaMedido(_Medido, cursors.Cursor):
+    pass
+
+
+class _Ruta:
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.suma = 0.0
+        self.cuenta = 0
+        self.estados = {}
+        self.consultas = 0
+        self.tiempo_db = 0.0
+        self.espera_pool = 0.0
+
+
+class Metricas:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rutas = {}
+
+    def registrar(self, ruta, metodo, estado, segundos, consultas, tiempo_db, espera_pool):
+        with self._lock:
+            datos = self._rutas.get((ruta, metodo))
+            if datos is None:
+                datos = self._rutas[(ruta, metodo)] = _Ruta()
+            indice = bisect.bisect_left(BUCKETS, segundos)
+            if indice < len(BUCKETS):
+                datos.buckets[indice] += 1
+            datos.suma += segundos
+            datos.cuenta += 1
+            datos.estados[estado] = datos.estados.get(estado, 0) + 1
+            datos.consultas += consultas
+            datos.tiempo_db += tiempo_db
+            datos.espera_pool += espera_pool
+
+    def exponer(self, extra=None):
+        # Formato de texto de Prometheus
+        with self._lock:
+            rutas = sorted(self._rutas.items())
+            lineas = [
+                '# HELP http_request_duration_seconds Latencia de las peticiones por ruta',
+                '# TYPE http_request_duration_seconds histogram',
+            ]
+            for (ruta, metodo), datos in rutas:
+                etiquetas = f'route="{ruta}",method="{metodo}"'
+                acumulado = 0
+                for limite, cuenta in zip(BUCKETS, datos.buckets):
+                    acumulado += cuenta
+                    lineas.append(f'http_request_duration_seconds_bucket{{{etiquetas},le="{limite}"}} {acumulado}')
+                lineas.append(f'http_request_duration_seconds_bucket{{{etiquetas},le="+Inf"}} {datos.cuenta}')
+                lineas.append(f'http_request_duration_seconds_sum{{{etiquetas}}} {datos.suma}')
+                lineas.append(f'http_request_duration_seconds_count{{{etiquetas}}} {datos.cuenta}')
+
+            lineas += ['# HELP http_requests_total Peticiones por ruta y código de estado',
+                       '# TYPE http_requests_total counter']
+            for (ruta, metodo), datos in rutas:
+                for estado, cuenta in sorted(datos.estados.items()):
+                    lineas.append(f'http_requests_total{{route="{ruta}",method="{metodo}",status="{estado}"}} {cuenta}')
+
+            for nombre, ayuda, campo in (
+                    ('db_queries_total', 'Consultas SQL ejecutadas por ruta', 'consultas'),
+                    ('db_query_seconds_total', 'Tiempo total en la base de datos por ruta', 'tiempo_db'),
+                    ('db_pool_wait_seconds_total', 'Tiempo esperando conexión del pool por ruta', 'espera_pool')):
+                lineas += [f'# HELP {nombre} {ayuda}', f'# TYPE {nombre} counter']
+                for (ruta, metodo), datos in rutas:
+                    lineas.append(f'{nombre}{{route="{ruta}",method="{metodo}"}} {getattr(datos, campo)}')
+
+        # extra: (nombre, tipo, ayuda, valor); valor puede ser una lista de
+        # (etiquetas, valor), p. ej. [('sucursal="centro"', 3), ...]
+        for nombre, tipo, ayuda, valor in (extra or []):
+            lineas += [f'# HELP {nombre} {ayuda}', f'# TYPE {nombre} {tipo}']
+            if isinstance(valor, list):
+                lineas += [f'{nombre}{{{etiquetas}}} {v}' for etiquetas, v in valor]
+            else:
+                lineas.append(f'{nombre} {valor}')
+        return '\n'.join(lineas) + '\n'
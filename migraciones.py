@@ -0,0 +1,257 @@
+from datetime import datetime
+
+# Migraciones versionadas del esquema. Cada migración es (version,
+# descripcion, pasos) y cada paso es una sentencia SQL o una función que
+# recibe el cursor. En MySQL el DDL hace commit implícito, así que la
+# versión se registra al terminar cada migración y los pasos deben poder
+# repetirse sin error (IF NOT EXISTS, índices comprobados antes de crear).
+
+
+def crear_indice(tabla, nombre, columnas):
+    def paso(cur):
+        cur.execute("""
+            SELECT 1 FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+            LIMIT 1
+        """, (tabla, nombre))
+        if not cur.fetchone():
+            cur.execute(f"CREATE INDEX {nombre} ON {tabla} ({columnas})")
+    return paso
+
+
+def agregar_columna(tabla, columna, definicion):
+    def paso(cur):
+        cur.execute("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+            LIMIT 1
+        """, (tabla, columna))
+        if not cur.fetchone():
+            cur.execute(f"ALTER TABLE {tabla} ADD COLUMN {columna} {definicion}")
+    return paso
+
+
+# Acumulado de ventas por item, día y hora para los reportes
+VENTAS_ITEM_HORA_DDL = """
+    CREATE TABLE IF NOT EXISTS ventas_item_hora (
+        fecha DATE NOT NULL,
+        hora TINYINT UNSIGNED NOT NULL,
+        item_id INT NOT NULL,
+        cantidad INT NOT NULL DEFAULT 0,
+        total DECIMAL(12,2) NOT NULL DEFAULT 0,
+        PRIMARY KEY (fecha, hora, item_id),
+        KEY idx_ventas_item_hora_item (item_id, fecha)
+    )
+"""
+
+MIGRACIONES = [
+    (1, 'Esquema inicial', [
+        """
+        CREATE TABLE IF NOT EXISTS usuario (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            user VARCHAR(50) NOT NULL,
+            password VARCHAR(255) NOT NULL,
+            nombre_completo VARCHAR(100) NOT NULL,
+            estatus VARCHAR(20) NOT NULL DEFAULT 'activo'
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS grupos (
+            codigo VARCHAR(10) PRIMARY KEY,
+            nombre VARCHAR(100) NOT NULL,
+            formato VARCHAR(50)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS item (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            nombre VARCHAR(100) NOT NULL,
+            grupo_codigo VARCHAR(10) NOT NULL,
+            precio DECIMAL(10,2) NOT NULL,
+            existencia INT NOT NULL DEFAULT 0,
+            estatus VARCHAR(20) NOT NULL DEFAULT 'activo',
+            FOREIGN KEY (grupo_codigo) REFERENCES grupos(codigo)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS mesas (
+            Id INT AUTO_INCREMENT PRIMARY KEY,
+            nombre VARCHAR(50) NOT NULL,
+            estatus VARCHAR(20) NOT NULL DEFAULT 'libre'
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS comandas (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            mesa_id INT NOT NULL,
+            usuario_id INT NOT NULL,
+            total DECIMAL(10,2) NOT NULL DEFAULT 0,
+            fecha DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            estatus VARCHAR(20) NOT NULL DEFAULT 'pendiente',
+            FOREIGN KEY (mesa_id) REFERENCES mesas(Id),
+            FOREIGN KEY (usuario_id) REFERENCES usuario(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS comanda_detalle (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            comanda_id INT NOT NULL,
+            item_id INT NOT NULL,
+            cantidad INT NOT NULL,
+            precio_unitario DECIMAL(10,2) NOT NULL,
+            total DECIMAL(10,2) NOT NULL,
+            FOREIGN KEY (comanda_id) REFERENCES comandas(id),
+            FOREIGN KEY (item_id) REFERENCES item(id)
+        )
+        """,
+    ]),
+    (2, 'Índices para las consultas frecuentes', [
+        # Historial paginado por (fecha, id) y filtrado por usuario
+        crear_indice('comandas', 'idx_comandas_fecha_id', 'fecha, id'),
+        crear_indice('comandas', 'idx_comandas_usuario_fecha', 'usuario_id, fecha'),
+        # Comanda pendiente de una mesa
+        crear_indice('comandas', 'idx_comandas_mesa_estatus', 'mesa_id, estatus'),
+        # Joins del detalle
+        crear_indice('comanda_detalle', 'idx_detalle_comanda_item', 'comanda_id, item_id'),
+        crear_indice('comanda_detalle', 'idx_detalle_item_comanda', 'item_id, comanda_id'),
+        crear_indice('item', 'idx_item_grupo', 'grupo_codigo'),
+        # Login
+        crear_indice('usuario', 'idx_usuario_user', 'user, estatus'),
+    ]),
+    (3, 'Acumulado de ventas por item, día y hora', [
+        VENTAS_ITEM_HORA_DDL,
+    ]),
+    (4, 'Colas de cocina por estación', [
+        """
+        CREATE TABLE IF NOT EXISTS cocina_linea (
+            detalle_id INT PRIMARY KEY,
+            comanda_id INT NOT NULL,
+            mesa_id INT NOT NULL,
+            item VARCHAR(100) NOT NULL,
+            cantidad INT NOT NULL,
+            estacion VARCHAR(50) NOT NULL,
+            prioridad INT NOT NULL DEFAULT 0,
+            estatus VARCHAR(20) NOT NULL DEFAULT 'pendiente',
+            creado DATETIME NOT NULL,
+            completado DATETIME NULL,
+            KEY idx_cocina_linea_estatus (estatus, estacion)
+        )
+        """,
+    ]),
+    (5, 'Claves de idempotencia de comandas', [
+        """
+        CREATE TABLE IF NOT EXISTS comanda_idempotencia (
+            usuario VARCHAR(50) NOT NULL,
+            clave VARCHAR(100) NOT NULL,
+            comanda_id INT NULL,
+            respuesta TEXT NULL,
+            creado DATETIME NOT NULL,
+            PRIMARY KEY (usuario, clave),
+            KEY idx_comanda_idempotencia_creado (creado)
+        )
+        """,
+    ]),
+    (6, 'Marca de comanda sumada al acumulado de ventas', [
+        # Las comandas existentes ya se sumaron (o las recalcula
+        # reconstruir-ventas); las nuevas empiezan sin sumar
+        agregar_columna('comandas', 'acumulada', 'TINYINT NOT NULL DEFAULT 1'),
+        "ALTER TABLE comandas ALTER COLUMN acumulada SET DEFAULT 0",
+    ]),
+]
+
+
+# Consultas calientes de la aplicación que deben resolverse con índice:
+# (nombre, sql, params, tablas que no pueden quedar en escaneo completo)
+CONSULTAS_CALIENTES = [
+    ('historial comandas', """
+        SELECT c.id, m.nombre as mesa, c.total, c.fecha, c.estatus, u.nombre_completo as usuario
+        FROM comandas c
+        JOIN mesas m ON c.mesa_id = m.Id
+        JOIN usuario u ON c.usuario_id = u.id
+        WHERE (c.fecha < %s OR (c.fecha = %s AND c.id < %s))
+        ORDER BY c.fecha DESC, c.id DESC
+        LIMIT 51
+    """, (datetime(2100, 1, 1), datetime(2100, 1, 1), 0), ('c',)),
+    ('comanda pendiente por mesa', """
+        SELECT id FROM comandas WHERE mesa_id = %s AND estatus = 'pendiente'
+    """, (1,), ('comandas',)),
+    ('login', """
+        SELECT * FROM usuario WHERE user = %s AND password = %s AND estatus = 'activo'
+    """, ('admin', 'x'), ('usuario',)),
+    ('detalle de una comanda', """
+        SELECT cd.item_id, i.nombre, cd.cantidad, cd.precio_unitario, cd.total
+        FROM comanda_detalle cd
+        JOIN item i ON cd.item_id = i.id
+        WHERE cd.comanda_id = %s
+    """, (1,), ('cd', 'i')),
+    ('acumulado de ventas de una comanda', """
+        SELECT DATE(c.fecha), HOUR(c.fecha), cd.item_id, SUM(cd.cantidad), SUM(cd.total)
+        FROM comanda_detalle cd
+        JOIN comandas c ON cd.comanda_id = c.id
+        WHERE cd.comanda_id = %s
+        GROUP BY DATE(c.fecha), HOUR(c.fecha), cd.item_id
+    """, (1,), ('cd', 'c')),
+    ('ventas por item en rango', """
+        SELECT i.nombre as item, SUM(v.cantidad) as cantidad, SUM(v.total) as total
+        FROM ventas_item_hora v
+        JOIN item i ON v.item_id = i.id
+        WHERE v.fecha >= %s AND v.fecha <= %s
+        GROUP BY i.nombre
+    """, (datetime(2000, 1, 1).date(), datetime(2000, 1, 31).date()), ('v',)),
+    ('líneas pendientes de cocina', """
+        SELECT detalle_id FROM cocina_linea WHERE estatus = 'pendiente'
+    """, (), ('cocina_linea',)),
+]
+
+
+def version_actual(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INT PRIMARY KEY,
+            descripcion VARCHAR(200) NOT NULL,
+            aplicada DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("SELECT COALESCE(MAX(version), 0) AS version FROM schema_version")
+    return cur.fetchone()['version']
+
+
+def migrar(conn, hasta=None, log=print):
+    # Aplica en orden las migraciones pendientes y devuelve la versión final
+    cur = conn.cursor()
+    try:
+        actual = version_actual(cur)
+        for version, descripcion, pasos in MIGRACIONES:
+            if version <= actual or (hasta is not None and version > hasta):
+                continue
+            log(f'Aplicando migración {version}: {descripcion}')
+            for paso in pasos:
+                if callable(paso):
+                    paso(cur)
+                else:
+                    cur.execute(paso)
+            cur.execute("INSERT INTO schema_version (version, descripcion) VALUES (%s, %s)",
+                        (version, descripcion))
+            conn.commit()
+            actual = version
+        return actual
+    finally:
+        cur.close()
+
+
+def verificar_consultas(conn):
+    # EXPLAIN de las consultas calientes. Devuelve [(nombre, tabla, tipo, key)]
+    # de las que acaban en escaneo completo (type = ALL) sobre una tabla
+    # que debería usar índice. Tiene sentido con datos de volumen real: con
+    # tablas casi vacías el optimizador prefiere escanear.
+    fallos = []
+    cur = conn.cursor()
+    try:
+        for nombre, sql, params, tablas in CONSULTAS_CALIENTES:
+            cur.execute("EXPLAIN " + sql, params)
+            for fila in cur.fetchall():
+                if fila['table'] in tablas and fila['type'] == 'ALL':
+                    fallos.append((nombre, fila['table'], fila['type'], fila['key']))
+        return fallos
+    finally:
+        cur.close()
@@ -0,0 +1,339 @@
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from pymysql.err import IntegrityError
+
+from cocina import estacion_de
+
+# Lógica de negocio del camino de pedidos, independiente del driver.
+# Cada operación es un generador que produce pasos (metodo, sql, params)
+# y recibe el Resultado de cada uno; ejecutar() los corre con un cursor
+# pymysql (Flask/WSGI) y ejecutar_async() con uno de aiomysql (ASGI), así
+# las dos formas de servir comparten exactamente las mismas consultas.
+# Los errores de la base de datos se lanzan dentro del generador para que
+# pueda tratarlos (p. ej. la clave duplicada de idempotencia).
+
+
+class ExistenciaInsuficiente(Exception):
+    pass
+
+
+class NoEncontrado(Exception):
+    pass
+
+
+class Resultado:
+    __slots__ = ('filas', 'rowcount', 'lastrowid')
+
+    def __init__(self, filas, rowcount, lastrowid):
+        self.filas = filas
+        self.rowcount = rowcount
+        self.lastrowid = lastrowid
+
+
+def ejecutar(cur, pasos):
+    try:
+        metodo, sql, params = next(pasos)
+        while True:
+            try:
+                getattr(cur, metodo)(sql, params)
+            except Exception as e:
+                metodo, sql, params = pasos.throw(e)
+                continue
+            filas = cur.fetchall() if cur.description else ()
+            metodo, sql, params = pasos.send(Resultado(filas, cur.rowcount, cur.lastrowid))
+    except StopIteration as fin:
+        return fin.value
+
+
+async def ejecutar_async(cur, pasos):
+    try:
+        metodo, sql, params = next(pasos)
+        while True:
+            try:
+                await getattr(cur, metodo)(sql, params)
+            except Exception as e:
+                metodo, sql, params = pasos.throw(e)
+                continue
+            filas = await cur.fetchall() if cur.description else ()
+            metodo, sql, params = pasos.send(Resultado(filas, cur.rowcount, cur.lastrowid))
+    except StopIteration as fin:
+        return fin.value
+
+
+def reservar_existencias(items):
+    # Descuenta la existencia de todas las líneas con un único UPDATE. El
+    # WHERE id IN (...) recorre la clave primaria en orden ascendente, así
+    # que dos pedidos concurrentes bloquean las filas en el mismo orden y no
+    # pueden entrar en deadlock. Si alguna fila no tiene existencia
+    # suficiente no se actualiza y el pedido se rechaza (el llamador hace
+    # rollback). Devuelve los ids que se quedaron a 0.
+    cantidades = {}
+    for item in items:
+        cantidad = int(item['cantidad'])
+        if cantidad <= 0:
+            raise ValueError(f"Cantidad no válida para el ítem {item['id']}")
+        cantidades[int(item['id'])] = cantidades.get(int(item['id']), 0) + cantidad
+    if not cantidades:
+        return []
+
+    ids = sorted(cantidades)
+    en = ', '.join(['%s'] * len(ids))
+    caso = ' '.join(['WHEN %s THEN %s'] * len(ids))
+    pares = [valor for item_id in ids for valor in (item_id, cantidades[item_id])]
+    resultado = yield ('execute', f"""
+        UPDATE item
+        SET existencia = existencia - CASE id {caso} END
+        WHERE id IN ({en}) AND existencia >= CASE id {caso} END
+    """, pares + ids + pares)
+
+    if resultado.rowcount != len(ids):
+        resultado = yield ('execute', f"SELECT id, nombre, existencia FROM item WHERE id IN ({en})", ids)
+        faltantes = [f"{fila['nombre']} (quedan {fila['existencia']})"
+                     for fila in resultado.filas if fila['existencia'] < cantidades[fila['id']]]
+        raise ExistenciaInsuficiente('Sin existencia suficiente: ' + ', '.join(faltantes or ['ítem no encontrado']))
+
+    resultado = yield ('execute', f"SELECT id FROM item WHERE id IN ({en}) AND existencia = 0", ids)
+    return [fila['id'] for fila in resultado.filas]
+
+
+def insertar_comanda(mesa_id, total, user, items):
+    # Estado de mesa, cabecera y detalle en tres sentencias. executemany
+    # agrupa los INSERT del detalle en un único INSERT multi-fila (troceado
+    # por max_allowed_packet en pedidos muy grandes).
+    # La mesa va primero: el INSERT en comandas toma un bloqueo compartido
+    # (clave foránea) sobre su fila, y si el UPDATE viniera después dos
+    # pedidos a la misma mesa se bloquearían mutuamente (1213). Así se
+    # bloquea en exclusiva desde el principio, igual que en agregar_item.
+    yield ('execute', "UPDATE mesas SET estatus = 'ocupada' WHERE Id = %s", (mesa_id,))
+
+    resultado = yield ('execute', """
+        INSERT INTO comandas (mesa_id, total, estatus, usuario_id)
+        VALUES (%s, %s, 'pendiente',
+            (SELECT id FROM usuario WHERE user = %s))
+    """, (mesa_id, total, user))
+
+    comanda_id = resultado.lastrowid
+
+    if items:
+        yield ('executemany', """
+            INSERT INTO comanda_detalle
+            (comanda_id, item_id, cantidad, precio_unitario, total)
+            VALUES (%s, %s, %s, %s, %s)
+        """, [(comanda_id, item['id'], item['cantidad'], item['precio'], item['total'])
+              for item in items])
+
+    return comanda_id
+
+
+def acumular_ventas(comanda_id):
+    # Acumulado de ventas por item, día y hora. Va en su propia transacción
+    # después del commit de la comanda (tarea en segundo plano): así las
+    # filas más disputadas de ventas_item_hora no alargan la del pedido.
+    # Si se pierde, `flask reconstruir-ventas` lo recalcula.
+    # comandas.acumulada se marca en la misma transacción: si la tarea se
+    # reintenta tras un commit cuya respuesta se perdió, no suma dos veces.
+    # Bloquea la comanda antes que sus líneas, como agregar_item.
+    resultado = yield ('execute', """
+        UPDATE comandas SET acumulada = 1 WHERE id = %s AND acumulada = 0
+    """, (comanda_id,))
+    if resultado.rowcount == 0:
+        return
+    yield ('execute', """
+        INSERT INTO ventas_item_hora (fecha, hora, item_id, cantidad, total)
+        SELECT DATE(c.fecha), HOUR(c.fecha), cd.item_id, SUM(cd.cantidad), SUM(cd.total)
+        FROM comanda_detalle cd
+        JOIN comandas c ON cd.comanda_id = c.id
+        WHERE cd.comanda_id = %s
+        GROUP BY DATE(c.fecha), HOUR(c.fecha), cd.item_id
+        ON DUPLICATE KEY UPDATE
+            ventas_item_hora.cantidad = ventas_item_hora.cantidad + VALUES(cantidad),
+            ventas_item_hora.total = ventas_item_hora.total + VALUES(total)
+    """, (comanda_id,))
+
+
+def encolar_cocina(comanda_id, mesa_id, estaciones, defecto):
+    # Reparte las líneas de la comanda por estación dentro de la misma
+    # transacción; las colas en memoria se actualizan tras el commit
+    resultado = yield ('execute', """
+        SELECT cd.id, cd.cantidad, i.nombre, i.grupo_codigo, g.formato
+        FROM comanda_detalle cd
+        JOIN item i ON cd.item_id = i.id
+        JOIN grupos g ON i.grupo_codigo = g.codigo
+        WHERE cd.comanda_id = %s
+        ORDER BY cd.id
+    """, (comanda_id,))
+    creado = datetime.now().replace(microsecond=0)
+    lineas = [{
+        'id': fila['id'],
+        'comanda_id': comanda_id,
+        'mesa_id': mesa_id,
+        'item': fila['nombre'],
+        'cantidad': fila['cantidad'],
+        'estacion': estacion_de(estaciones, fila['grupo_codigo'], fila['formato'], defecto),
+        'prioridad': 0,
+        'creado': creado
+    } for fila in resultado.filas]
+
+    if lineas:
+        yield ('executemany', """
+            INSERT INTO cocina_linea
+            (detalle_id, comanda_id, mesa_id, item, cantidad, estacion, creado)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """, [(l['id'], l['comanda_id'], l['mesa_id'], l['item'], l['cantidad'],
+               l['estacion'], l['creado']) for l in lineas])
+    return lineas
+
+
+def guardar_comanda(data, user, estaciones, defecto):
+    # Pedido completo: existencias, comanda y colas de cocina.
+    # Devuelve (comanda_id, agotados, lineas_cocina); el commit es del llamador.
+    agotados = yield from reservar_existencias(data['items'])
+    comanda_id = yield from insertar_comanda(data['mesa_id'], data['total'], user, data['items'])
+    lineas = yield from encolar_cocina(comanda_id, data['mesa_id'], estaciones, defecto)
+    return comanda_id, agotados, lineas
+
+
+def reclamar_clave(user, clave, cerrar=True):
+    # Reserva la clave de idempotencia en la transacción actual y devuelve
+    # None. Si otra petición ya la tiene, el INSERT espera a que termine y
+    # falla por clave duplicada: se cierra la transacción y se devuelve la
+    # respuesta guardada ({} si la otra petición no llegó a guardarla).
+    # Con cerrar=False (comandas del lote, cada una en su SAVEPOINT) la
+    # transacción sigue abierta y la respuesta se lee con bloqueo
+    # compartido, que ve la última versión confirmada de la fila.
+    try:
+        yield ('execute', """
+            INSERT INTO comanda_idempotencia (usuario, clave, creado)
+            VALUES (%s, %s, NOW())
+        """, (user, clave))
+        return None
+    except IntegrityError:
+        pass
+    if cerrar:
+        yield ('execute', "ROLLBACK", ())
+    resultado = yield ('execute', f"""
+        SELECT respuesta FROM comanda_idempotencia
+        WHERE usuario = %s AND clave = %s{'' if cerrar else ' LOCK IN SHARE MODE'}
+    """, (user, clave))
+    if resultado.filas and resultado.filas[0]['respuesta']:
+        return json.loads(resultado.filas[0]['respuesta'])
+    return {}
+
+
+def guardar_respuesta(user, clave, comanda_id, cuerpo):
+    yield ('execute', """
+        UPDATE comanda_idempotencia SET comanda_id = %s, respuesta = %s
+        WHERE usuario = %s AND clave = %s
+    """, (comanda_id, json.dumps(cuerpo), user, clave))
+
+
+def cargar_mesa(mesa_id):
+    # Mesa, comanda pendiente y sus líneas en una sola consulta
+    resultado = yield ('execute', """
+        SELECT m.Id as mesa_id, m.nombre as mesa, m.estatus as mesa_estatus,
+               c.id as comanda_id, cd.item_id, i.nombre, cd.precio_unitario,
+               cd.cantidad, cd.total
+        FROM mesas m
+        LEFT JOIN comandas c ON c.mesa_id = m.Id AND c.estatus = 'pendiente'
+        LEFT JOIN comanda_detalle cd ON cd.comanda_id = c.id
+        LEFT JOIN item i ON cd.item_id = i.id
+        WHERE m.Id = %s
+        ORDER BY c.id, cd.id
+    """, (mesa_id,))
+    if not resultado.filas:
+        raise NoEncontrado('Mesa no encontrada')
+
+    primera = resultado.filas[0]
+    comanda_id = primera['comanda_id']
+    items = []
+    # Dinero en Decimal, como llega de las columnas DECIMAL: sumado en
+    # float acumularía error; ProveedorJSON lo convierte solo al responder
+    total = Decimal('0')
+    for fila in resultado.filas:
+        # Solo la primera comanda pendiente, como en routes.cargar_mesa
+        if fila['item_id'] is None or fila['comanda_id'] != comanda_id:
+            continue
+        items.append({
+            'id': fila['item_id'],
+            'nombre': fila['nombre'],
+            'precio': fila['precio_unitario'],
+            'cantidad': fila['cantidad'],
+            'total': fila['total']
+        })
+        total += fila['total']
+
+    return {
+        'mesa': {'id': primera['mesa_id'], 'nombre': primera['mesa'], 'estatus': primera['mesa_estatus']},
+        'items': items,
+        'total': total,
+        'comanda_id': comanda_id
+    }
+
+
+def acumular_toque(comanda_id, item_id, cantidad, precio):
+    # Suma unidades sueltas de un ítem al acumulado de ventas dentro de la
+    # transacción que las escribe: es una sola fila y así no se cuentan dos
+    # veces ni se pierden. Día y hora son los de la comanda, como en
+    # acumular_ventas y flask reconstruir-ventas. Si la comanda aún no está
+    # acumulada (pedido de /api/comandas con su acumular_ventas pendiente)
+    # no se suma aquí: ese acumulado ya incluirá la línea.
+    yield ('execute', """
+        INSERT INTO ventas_item_hora (fecha, hora, item_id, cantidad, total)
+        SELECT DATE(fecha), HOUR(fecha), %s, %s, %s FROM comandas WHERE id = %s AND acumulada = 1
+        ON DUPLICATE KEY UPDATE
+            ventas_item_hora.cantidad = ventas_item_hora.cantidad + VALUES(cantidad),
+            ventas_item_hora.total = ventas_item_hora.total + VALUES(total)
+    """, (item_id, cantidad, cantidad * precio, comanda_id))
+
+
+def agregar_item(mesa_id, item_id, user):
+    # Un toque en la tablet: suma una unidad del ítem a la comanda pendiente
+    # de la mesa (creándola si no existe) tocando solo esa línea y el total.
+    # Como un pedido, descuenta la existencia (ExistenciaInsuficiente si no
+    # queda) y suma al acumulado de ventas. Devuelve (comanda_id, agotados);
+    # el commit es del llamador.
+    resultado = yield ('execute', "SELECT precio FROM item WHERE id = %s", (item_id,))
+    if not resultado.filas:
+        raise NoEncontrado('Ítem no encontrado')
+    precio = resultado.filas[0]['precio']
+
+    # Primero el ítem y luego la comanda, en el mismo orden que guardar_comanda
+    agotados = yield from reservar_existencias([{'id': item_id, 'cantidad': 1}])
+
+    resultado = yield ('execute', """
+        SELECT id FROM comandas WHERE mesa_id = %s AND estatus = 'pendiente'
+        ORDER BY id LIMIT 1 FOR UPDATE
+    """, (mesa_id,))
+    if resultado.filas:
+        comanda_id = resultado.filas[0]['id']
+    else:
+        resultado = yield ('execute', "UPDATE mesas SET estatus = 'ocupada' WHERE Id = %s", (mesa_id,))
+        if resultado.rowcount == 0:
+            resultado = yield ('execute', "SELECT 1 FROM mesas WHERE Id = %s", (mesa_id,))
+            if not resultado.filas:
+                raise NoEncontrado('Mesa no encontrada')
+        # Acumulada desde el principio: cada toque suma su línea
+        resultado = yield ('execute', """
+            INSERT INTO comandas (mesa_id, total, estatus, usuario_id, acumulada)
+            VALUES (%s, 0, 'pendiente', (SELECT id FROM usuario WHERE user = %s), 1)
+        """, (mesa_id, user))
+        comanda_id = resultado.lastrowid
+
+    # En MySQL las asignaciones del SET se evalúan en orden: total usa la
+    # cantidad ya incrementada
+    resultado = yield ('execute', """
+        UPDATE comanda_detalle
+        SET cantidad = cantidad + 1, total = cantidad * precio_unitario
+        WHERE comanda_id = %s AND item_id = %s
+    """, (comanda_id, item_id))
+    if resultado.rowcount == 0:
+        yield ('execute', """
+            INSERT INTO comanda_detalle (comanda_id, item_id, cantidad, precio_unitario, total)
+            VALUES (%s, %s, 1, %s, %s)
+        """, (comanda_id, item_id, precio, precio))
+
+    yield ('execute', "UPDATE comandas SET total = total + %s WHERE id = %s", (precio, comanda_id))
+    yield from acumular_toque(comanda_id, item_id, 1, precio)
+    return comanda_id, agotados
@@ -0,0 +1,80 @@
+import threading
+import time
+
+# Enrutado de lecturas a la réplica de MySQL. EstadoReplica decide con la
+# última medición del retraso si una lectura puede ir a la réplica:
+# - el retraso no supera max_retraso segundos (tolerancia de la ruta),
+# - la réplica no ha fallado en los últimos `reintento` segundos,
+# - y ya ha aplicado la última escritura del usuario (leer lo escrito:
+#   se compara con la hora de su última escritura, guardada en la sesión).
+# Si no, la lectura va a la principal.
+
+
+def medir_retraso(consultar):
+    # Segundos de retraso de la réplica, o None si la replicación está
+    # parada. consultar(sql) devuelve la primera fila como dict o None.
+    # Un servidor que no es réplica (p. ej. una segunda instancia local
+    # usada como doble en pruebas) cuenta como retraso 0.
+    for sql in ("SHOW REPLICA STATUS", "SHOW SLAVE STATUS"):
+        try:
+            fila = consultar(sql)
+        except Exception:
+            # MySQL anterior a 8.0.22 solo entiende SHOW SLAVE STATUS
+            continue
+        if not fila:
+            return 0
+        return fila.get('Seconds_Behind_Source', fila.get('Seconds_Behind_Master'))
+    return None
+
+
+class EstadoReplica:
+
+    def __init__(self, max_retraso=5, reintento=30, vigencia=1.0):
+        self.max_retraso = max_retraso
+        self.reintento = reintento
+        # Segundos que vale una medición del retraso
+        self.vigencia = vigencia
+        self._lock = threading.Lock()
+        self._retraso = None
+        self._medido = None
+        self._caida_hasta = 0.0
+        self.lecturas = 0
+        self.desvios = 0
+        self.fallos = 0
+
+    @property
+    def retraso(self):
+        return self._retraso
+
+    def activa(self):
+        return time.monotonic() >= self._caida_hasta
+
+    def necesita_medir(self):
+        return self._medido is None or time.monotonic() - self._medido > self.vigencia
+
+    def medir(self, retraso):
+        self._retraso = retraso
+        self._medido = time.monotonic()
+
+    def caida(self):
+        with self._lock:
+            self._caida_hasta = time.monotonic() + self.reintento
+            self._retraso = None
+            self._medido = None
+            self.fallos += 1
+
+    def admite(self, ultima_escritura=None):
+        retraso = self._retraso
+        if not self.activa() or retraso is None or retraso > self.max_retraso:
+            return False
+        # Seconds_Behind_Source tiene resolución de un segundo: margen de 1 s
+        if ultima_escritura is not None and time.time() - retraso - 1 <= ultima_escritura:
+            return False
+        return True
+
+    def contar(self, replica):
+        with self._lock:
+            if replica:
+                self.lecturas += 1
+            else:
+                self.desvios += 1
@@ -0,0 +1,79 @@
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # Sin orjson se usa el json de la biblioteca estándar
+    orjson = None
+
+# Serialización JSON de la app. Las filas de pymysql se envían tal cual
+# llegan: Decimal sale como número (las columnas de dinero son
+# DECIMAL(10,2), que la representación más corta de un float conserva
+# exacta) y las fechas en ISO 8601, sin copiar ni recorrer las filas antes.
+# Con orjson instalado se usa orjson; si no, json con el mismo default.
+
+
+def _convertir(valor):
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, (datetime, date, time)):
+        return valor.isoformat()
+    raise TypeError(f'No serializable: {type(valor).__name__}')
+
+
+if orjson is not None:
+    _OPCIONES = orjson.OPT_NON_STR_KEYS
+
+    def dumps_bytes(valor):
+        return orjson.dumps(valor, default=_convertir, option=_OPCIONES)
+
+    def dumps(valor):
+        return orjson.dumps(valor, default=_convertir, option=_OPCIONES).decode('utf-8')
+
+    loads = orjson.loads
+else:
+    def dumps(valor):
+        return json.dumps(valor, default=_convertir, separators=(',', ':'))
+
+    def dumps_bytes(valor):
+        return dumps(valor).encode('utf-8')
+
+    loads = json.loads
+
+
+def stream_array(valores, lote=500):
+    # Array JSON por bloques de bytes, para Response(stream_array(...)):
+    # la memoria no crece con el número de elementos
+    yield b'['
+    partes = []
+    separador = b''
+    for valor in valores:
+        partes.append(dumps_bytes(valor))
+        if len(partes) >= lote:
+            yield separador + b','.join(partes)
+            separador = b','
+            partes = []
+    if partes:
+        yield separador + b','.join(partes)
+    yield b']'
+
+
+class ProveedorJSON(JSONProvider):
+    # app.json: jsonify, request.get_json y el filtro tojson
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # Opciones de formato (indent, sort_keys...): json estándar
+            kwargs.setdefault('default', _convertir)
+            return json.dumps(obj, **kwargs)
+        return dumps(obj)
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype='application/json')
@@ -0,0 +1,81 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Varias sucursales (restaurantes) en un mismo despliegue, cada una con su
+# base de datos. La sucursal de la petición (elegida en /login y guardada
+# en la sesión) se fija en una ContextVar: la ven igual las rutas Flask,
+# las asíncronas de Quart (cada petición es una tarea de asyncio) y los
+# hilos de asyncio.to_thread. Los hilos propios (tareas en segundo plano,
+# informes en paralelo) la reciben explícitamente con en().
+
+_actual = ContextVar('sucursal', default=None)
+
+
+def actual():
+    return _actual.get()
+
+
+def fijar(sucursal):
+    # Devuelve el token para restaurar(); las peticiones Flask comparten
+    # hilo con las siguientes y deben restaurarla al terminar
+    return _actual.set(sucursal)
+
+
+def restaurar(token):
+    _actual.reset(token)
+
+
+@contextmanager
+def en(sucursal):
+    token = _actual.set(sucursal)
+    try:
+        yield
+    finally:
+        _actual.reset(token)
+
+
+class PorSucursal:
+    # Una instancia por sucursal (caché del catálogo, colas de cocina,
+    # eventos...) creada al primer uso. Los atributos se leen de la
+    # instancia de la sucursal actual, así el código que usaba la instancia
+    # única no cambia. Para asignar atributos usar para(sucursal).
+
+    def __init__(self, crear, resolver):
+        self._crear = crear
+        self._resolver = resolver
+        self._lock = threading.Lock()
+        self._instancias = {}
+
+    def para(self, sucursal):
+        instancia = self._instancias.get(sucursal)
+        if instancia is None:
+            with self._lock:
+                instancia = self._instancias.get(sucursal)
+                if instancia is None:
+                    instancia = self._instancias[sucursal] = self._crear()
+        return instancia
+
+    def instancias(self):
+        with self._lock:
+            return dict(self._instancias)
+
+    def __getattr__(self, nombre):
+        return getattr(self.para(self._resolver()), nombre)
+
+
+def en_paralelo(funcion, sucursales, hilos=8, contexto=None):
+    # funcion() en cada sucursal a la vez; devuelve {sucursal: resultado}.
+    # Si alguna falla se propaga la excepción de la primera en el orden dado.
+    # contexto: fábrica de context manager por llamada (p. ej. app.app_context)
+    def ejecutar(sucursal):
+        with en(sucursal):
+            if contexto is None:
+                return funcion()
+            with contexto():
+                return funcion()
+
+    sucursales = list(sucursales)
+    with ThreadPoolExecutor(max_workers=max(1, min(hilos, len(sucursales)))) as ejecutor:
+        return dict(zip(sucursales, ejecutor.map(ejecutar, sucursales)))
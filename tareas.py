@@ -0,0 +1,157 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+# Tareas en segundo plano para los efectos no críticos de una escritura
+# (acumulados, avisos a las pantallas...): la petición solo espera a la
+# escritura esencial. Cola acotada con un grupo fijo de hilos:
+# - si la cola está llena, quien envía espera hasta `espera_llena`
+#   segundos y, si sigue llena, ejecuta la tarea él mismo (contrapresión:
+#   la petición se alarga pero la tarea no se pierde);
+# - una tarea que falla se reintenta con espera creciente hasta
+#   `reintentos` veces y después se registra en el log como fallida;
+# - detener() deja de aceptar tareas y espera a que se vacíe la cola.
+# Las tareas se pierden si el proceso muere: solo para lo que se puede
+# reconstruir (p. ej. flask reconstruir-ventas).
+
+
+class _Tarea:
+    __slots__ = ('funcion', 'args', 'nombre', 'intentos')
+
+    def __init__(self, funcion, args, nombre):
+        self.funcion = funcion
+        self.args = args
+        self.nombre = nombre
+        self.intentos = 0
+
+
+class Tareas:
+
+    def __init__(self, hilos=4, maximo=1000, reintentos=3, espera=0.5, espera_max=30.0, espera_llena=0.05):
+        self.hilos = hilos
+        self.maximo = maximo
+        self.reintentos = reintentos
+        self.espera = espera
+        self.espera_max = espera_max
+        self.espera_llena = espera_llena
+        self._cond = threading.Condition()
+        self._cola = deque()
+        # Reintentos pendientes: (cuando, orden, tarea)
+        self._diferidas = []
+        self._orden = itertools.count()
+        self._hilos = []
+        self._contexto = None
+        self._cerrando = False
+        self.en_curso = 0
+        self.completadas = 0
+        self.fallidas = 0
+        self.reintentadas = 0
+        self.en_linea = 0
+
+    def abrir(self, contexto=None):
+        # contexto: fábrica de context manager para cada tarea (p. ej.
+        # app.app_context), los hilos no heredan el de la petición
+        self._contexto = contexto
+        for n in range(self.hilos):
+            hilo = threading.Thread(target=self._bucle, name=f'tareas-{n}', daemon=True)
+            hilo.start()
+            self._hilos.append(hilo)
+
+    def enviar(self, funcion, *args, nombre=None):
+        tarea = _Tarea(funcion, args, nombre or getattr(funcion, '__name__', repr(funcion)))
+        with self._cond:
+            limite = time.monotonic() + self.espera_llena
+            while not self._cerrando and self._hilos and len(self._cola) >= self.maximo:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                self._cond.wait(restante)
+            if not self._cerrando and self._hilos and len(self._cola) < self.maximo:
+                self._cola.append(tarea)
+                self._cond.notify_all()
+                return True
+            self.en_linea += 1
+        # Cola llena, sin hilos o cerrando: la tarea se ejecuta aquí
+        self._ejecutar(tarea, reintentar=False)
+        return False
+
+    def detener(self, timeout=10):
+        # Los reintentos pendientes se adelantan: no se espera su turno
+        with self._cond:
+            self._cerrando = True
+            while self._diferidas:
+                self._cola.append(heapq.heappop(self._diferidas)[2])
+            self._cond.notify_all()
+        limite = time.monotonic() + timeout
+        for hilo in self._hilos:
+            hilo.join(max(0, limite - time.monotonic()))
+        pendientes = len(self._cola)
+        if pendientes:
+            log.warning('Tareas sin terminar al detener: %s', pendientes)
+        self._hilos = []
+        return pendientes
+
+    def estado(self):
+        with self._cond:
+            return {
+                'en_cola': len(self._cola),
+                'diferidas': len(self._diferidas),
+                'en_curso': self.en_curso,
+                'completadas': self.completadas,
+                'fallidas': self.fallidas,
+                'reintentadas': self.reintentadas,
+                'en_linea': self.en_linea,
+                'maximo': self.maximo
+            }
+
+    def _bucle(self):
+        while True:
+            with self._cond:
+                while True:
+                    ahora = time.monotonic()
+                    while self._diferidas and self._diferidas[0][0] <= ahora:
+                        self._cola.append(heapq.heappop(self._diferidas)[2])
+                    if self._cola:
+                        tarea = self._cola.popleft()
+                        self.en_curso += 1
+                        # Hay hueco: despierta a quien espera para encolar
+                        self._cond.notify_all()
+                        break
+                    if self._cerrando and not self._diferidas:
+                        return
+                    self._cond.wait(self._diferidas[0][0] - ahora if self._diferidas else None)
+            try:
+                self._ejecutar(tarea, reintentar=not self._cerrando)
+            finally:
+                with self._cond:
+                    self.en_curso -= 1
+
+    def _ejecutar(self, tarea, reintentar):
+        try:
+            if self._contexto is None:
+                tarea.funcion(*tarea.args)
+            else:
+                with self._contexto():
+                    tarea.funcion(*tarea.args)
+        except Exception:
+            tarea.intentos += 1
+            if reintentar and tarea.intentos < self.reintentos:
+                espera = min(self.espera * 2 ** (tarea.intentos - 1), self.espera_max)
+                log.warning('Tarea %s falló (intento %s), se reintenta en %.1f s',
+                            tarea.nombre, tarea.intentos, espera, exc_info=True)
+                with self._cond:
+                    self.reintentadas += 1
+                    heapq.heappush(self._diferidas, (time.monotonic() + espera, next(self._orden), tarea))
+                    self._cond.notify()
+                return
+            log.exception('Tarea %s fallida tras %s intentos', tarea.nombre, tarea.intentos)
+            with self._cond:
+                self.fallidas += 1
+            return
+        with self._cond:
+            self.completadas += 1
@@ -0,0 +1,57 @@
+# Base MySQL temporal para las pruebas de integración: se crea con las
+# migraciones y se borra al terminar; si no hay servidor las pruebas que la
+# usan se saltan. Conexión por variables de entorno:
+#
+#   COMANDAS_TEST_MYSQL_HOST=localhost COMANDAS_TEST_MYSQL_PASSWORD=... python -m pytest -q
+import os
+import sys
+import uuid
+from decimal import Decimal
+
+import pymysql
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from migraciones import migrar
+
+PRECIO = Decimal('12.50')
+
+
+def configuracion():
+    return {
+        'host': os.environ.get('COMANDAS_TEST_MYSQL_HOST', 'localhost'),
+        'port': int(os.environ.get('COMANDAS_TEST_MYSQL_PORT', 3306)),
+        'user': os.environ.get('COMANDAS_TEST_MYSQL_USER', 'root'),
+        'password': os.environ.get('COMANDAS_TEST_MYSQL_PASSWORD', 'TURING'),
+    }
+
+
+@pytest.fixture
+def base():
+    config = configuracion()
+    try:
+        admin = pymysql.connect(connect_timeout=2, **config)
+    except pymysql.err.OperationalError as e:
+        pytest.skip(f'MySQL no disponible: {e}')
+    db = f'comandas_test_{uuid.uuid4().hex[:8]}'
+    with admin.cursor() as cur:
+        cur.execute(f"CREATE DATABASE `{db}`")
+    conn = pymysql.connect(database=db, cursorclass=pymysql.cursors.DictCursor, **config)
+    try:
+        migrar(conn, log=lambda mensaje: None)
+        with conn.cursor() as cur:
+            cur.execute("INSERT INTO usuario (user, password, nombre_completo) VALUES ('mesero', 'x', 'Mesero')")
+            cur.execute("INSERT INTO grupos (codigo, nombre, formato) VALUES ('BEB', 'Bebidas', 'bar')")
+            cur.execute("INSERT INTO item (nombre, grupo_codigo, precio, existencia) VALUES ('Limonada', 'BEB', %s, 10)",
+                        (PRECIO,))
+            item_id = cur.lastrowid
+            cur.execute("INSERT INTO mesas (nombre) VALUES ('Mesa 1')")
+            mesa_id = cur.lastrowid
+        conn.commit()
+        yield conn, db, mesa_id, item_id
+    finally:
+        conn.close()
+        with admin.cursor() as cur:
+            cur.execute(f"DROP DATABASE `{db}`")
+        admin.close()
@@ -0,0 +1,56 @@
+# Integración contra MySQL: el acumulado de ventas de una comanda se suma
+# una sola vez aunque la tarea se repita o la mesa reciba toques antes
+import pedidos
+from conftest import PRECIO
+
+
+def _guardar(conn, mesa_id, item_id, cantidad):
+    data = {'mesa_id': mesa_id, 'total': cantidad * PRECIO,
+            'items': [{'id': item_id, 'cantidad': cantidad, 'precio': PRECIO, 'total': cantidad * PRECIO}]}
+    with conn.cursor() as cur:
+        comanda_id, _, _ = pedidos.ejecutar(cur, pedidos.guardar_comanda(data, 'mesero', {}, 'cocina'))
+    conn.commit()
+    return comanda_id
+
+
+def _acumular(conn, comanda_id):
+    with conn.cursor() as cur:
+        pedidos.ejecutar(cur, pedidos.acumular_ventas(comanda_id))
+    conn.commit()
+
+
+def _vendido(conn, item_id):
+    with conn.cursor() as cur:
+        cur.execute("SELECT COALESCE(SUM(cantidad), 0) AS cantidad, COALESCE(SUM(total), 0) AS total "
+                    "FROM ventas_item_hora WHERE item_id = %s", (item_id,))
+        return cur.fetchone()
+
+
+def test_acumular_dos_veces_suma_una(base):
+    conn, _, mesa_id, item_id = base
+    comanda_id = _guardar(conn, mesa_id, item_id, 2)
+    _acumular(conn, comanda_id)
+    _acumular(conn, comanda_id)
+
+    vendido = _vendido(conn, item_id)
+    assert vendido['cantidad'] == 2
+    assert vendido['total'] == 2 * PRECIO
+
+
+def test_toque_antes_del_acumulado_no_se_cuenta_doble(base):
+    conn, _, mesa_id, item_id = base
+    comanda_id = _guardar(conn, mesa_id, item_id, 2)
+    # El toque cae en la comanda pendiente antes de que corra su acumulado
+    with conn.cursor() as cur:
+        tocada, _ = pedidos.ejecutar(cur, pedidos.agregar_item(mesa_id, item_id, 'mesero'))
+    conn.commit()
+    assert tocada == comanda_id
+    _acumular(conn, comanda_id)
+    # Y otro después: este lo suma el propio toque
+    with conn.cursor() as cur:
+        pedidos.ejecutar(cur, pedidos.agregar_item(mesa_id, item_id, 'mesero'))
+    conn.commit()
+
+    vendido = _vendido(conn, item_id)
+    assert vendido['cantidad'] == 4
+    assert vendido['total'] == 4 * PRECIO
@@ -0,0 +1,62 @@
+# Integración contra MySQL: el toque de la tablet (agregar_item) sumando
+# dos veces el mismo ítem (base temporal de conftest.py)
+import app as aplicacion
+import pedidos
+from conftest import PRECIO, configuracion
+
+
+def _linea(conn, comanda_id, item_id):
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT cd.cantidad, cd.total, c.total AS total_comanda, i.existencia
+            FROM comanda_detalle cd
+            JOIN comandas c ON c.id = cd.comanda_id
+            JOIN item i ON i.id = cd.item_id
+            WHERE cd.comanda_id = %s AND cd.item_id = %s
+        """, (comanda_id, item_id))
+        return cur.fetchone()
+
+
+def test_dos_toques_del_mismo_item(base):
+    conn, _, mesa_id, item_id = base
+    for _ in range(2):
+        with conn.cursor() as cur:
+            comanda_id, agotados = pedidos.ejecutar(cur, pedidos.agregar_item(mesa_id, item_id, 'mesero'))
+        conn.commit()
+        assert agotados == []
+
+    linea = _linea(conn, comanda_id, item_id)
+    assert linea['cantidad'] == 2
+    assert linea['total'] == 2 * PRECIO
+    assert linea['total_comanda'] == 2 * PRECIO
+    assert linea['existencia'] == 8
+
+
+def test_dos_toques_por_la_ruta(base, monkeypatch):
+    conn, db, mesa_id, item_id = base
+    config = configuracion()
+    for clave, valor in (('MYSQL_HOST', config['host']), ('MYSQL_PORT', config['port']),
+                         ('MYSQL_USER', config['user']), ('MYSQL_PASSWORD', config['password']),
+                         ('MYSQL_DB', db), ('MYSQL_POOL_MIN', 0),
+                         # Puede haber un servidor de desarrollo en marcha
+                         ('PROCESO_UNICO', False)):
+        monkeypatch.setitem(aplicacion.app.config, clave, valor)
+    monkeypatch.setattr(aplicacion, '_pools', {})
+
+    cliente = aplicacion.app.test_client()
+    with cliente.session_transaction() as sesion:
+        sesion['usuario'] = {'user': 'mesero', 'nombre_completo': 'Mesero'}
+    try:
+        for _ in range(2):
+            respuesta = cliente.post('/comandas/agregar_item', json={'mesa_id': mesa_id, 'item_id': item_id})
+            assert respuesta.status_code == 200, respuesta.get_json()
+    finally:
+        aplicacion._descartar_pool()
+
+    conn.commit()  # Instantánea nueva: las escrituras son de otra conexión
+    with conn.cursor() as cur:
+        cur.execute("SELECT id FROM comandas WHERE mesa_id = %s AND estatus = 'pendiente'", (mesa_id,))
+        comanda_id = cur.fetchone()['id']
+    linea = _linea(conn, comanda_id, item_id)
+    assert linea['cantidad'] == 2
+    assert linea['total'] == 2 * PRECIO